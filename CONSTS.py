@@ -16,6 +16,86 @@ class C(object):
     SNMP_PORT = None
     ZENOSS_COLLECTOR = None
 
+    # Bulk operations: how many calls to pack into one Ext.Direct envelope and how many envelopes to run at once.
+    BULK_BATCH_SIZE = 50
+    BULK_WORKERS = 8
+
+    # Events (EventsRouter): events per query page, event ids per acknowledge/close call in the bulk functions, and
+    # seconds between polls of zenoss_events.EventPoller.follow.
+    EVENTS_PAGE_SIZE = 500
+    EVENTS_PER_CALL = 100
+    EVENTS_POLL_INTERVAL = 10.0
+
+    # Inventory export: devices per getDevices page.
+    EXPORT_PAGE_SIZE = 500
+
+    # Snapshots (zenoss_snapshot): decoded device records a SnapshotStore keeps, and the listing fields stored in
+    # the index so that get_devices can filter and sort on them without decoding every record.
+    SNAPSHOT_CACHE_SIZE = 1024
+    SNAPSHOT_INDEX_KEYS = ['name', 'productionState', 'priority', 'collector', 'ipAddressString']
+
+    # Worker processes for CPU-bound post-processing of fetched pages (zenoss_pipeline.ProcessStage). 0 keeps it in
+    # the calling process.
+    PIPELINE_PROCESSES = 0
+
+    # HTTP compression: ask for compressed responses, and gzip request bodies at least this big when enabled.
+    # Zenoss' Zope front end doesn't decode gzipped request bodies out of the box, so that half is off by default.
+    ACCEPT_COMPRESSED = True
+    COMPRESS_REQUESTS = False
+    COMPRESS_REQUESTS_MIN_BYTES = 64 * 1024
+
+    # Job polling (zenoss_jobs.JobTracker): seconds before the first status check, the growth factor per round and
+    # the longest wait between rounds.
+    JOB_POLL_INITIAL_DELAY = 2.0
+    JOB_POLL_BACKOFF = 1.5
+    JOB_POLL_MAX_DELAY = 30.0
+
+    # Circuit breaker per (endpoint, method) in ZenossAPI: it opens once BREAKER_FAILURE_RATIO of the last
+    # BREAKER_WINDOW calls (and at least BREAKER_MIN_CALLS) failed or took longer than BREAKER_SLOW_SECONDS, rejects
+    # calls for BREAKER_OPEN_SECONDS and then lets a single probe call decide whether to close again.
+    BREAKER_ENABLED = True
+    BREAKER_WINDOW = 20
+    BREAKER_MIN_CALLS = 5
+    BREAKER_FAILURE_RATIO = 0.5
+    BREAKER_SLOW_SECONDS = 30.0
+    BREAKER_OPEN_SECONDS = 30.0
+
+    # Build addDevice data from defaults gathered once and splice each call's data into a pre-encoded envelope. Off,
+    # both are rebuilt on every call as they used to be; only useful to measure the difference (python
+    # zenoss_stub.py --envelopes CALLS).
+    PRECOMPILED_PAYLOADS = True
+
+    # Requests one ZenossAPI client sends at once (0: no limit). Requests waiting for a slot go in priority order:
+    # interactive reads, then writes, then bulk work.
+    MAX_IN_FLIGHT = 0
+
+    # Identical reads (same router method and data) that overlap in time share one request. The default for new
+    # ZenossAPI clients (see their single_flight attribute). Off by default: a read that joins one sent before a write
+    # through another router (e.g. template_router before device_router) may not see that write.
+    SINGLE_FLIGHT = False
+
+    # Write-behind queues (ZenossAPI.write_behind): pending objects that trigger a flush, and the longest a write waits.
+    WRITE_BEHIND_MAX_SIZE = 200
+    WRITE_BEHIND_MAX_DELAY = 1.0
+
+    # Checkpoint journals (zenoss_journal.Journal): fsync after every item, not just flush.
+    JOURNAL_FSYNC = False
+
+    # Adaptive chunk sizes (batch_size=None in the bulk functions, limit=None in iter_oid_mappings): the p95 chunk
+    # latency in seconds to stay under, the size bounds, full-size chunks per decision, and the grow/shrink factors.
+    CHUNK_TARGET_P95 = 5.0
+    CHUNK_MIN_SIZE = 1
+    CHUNK_MAX_SIZE = 500
+    CHUNK_WINDOW = 8
+    CHUNK_GROWTH = 1.5
+    CHUNK_BACKOFF = 0.5
+
+    # Load generator (zenoss_load.LoadGenerator): the default mix of read methods and their relative weights, seconds
+    # per run, and significant decimal digits kept by the latency histograms.
+    LOAD_MIX = {'get_devices': 1, 'get_device_info': 4, 'get_templates': 1, 'get_oid_mappings': 1}
+    LOAD_DURATION = 30.0
+    LOAD_HISTOGRAM_DIGITS = 2
+
     # These values for these variables are set at the end of the file.
     # Declaring them here so that the IDE can find them.
     # (Prevent the IDE from complaining about undeclared variables)
@@ -31,6 +111,23 @@ class C(object):
     ERROR_VALUES_S_NO_MATCH_S = None
     ERROR_S_OBJECT_NO_ATTRIBUTE_S = None
     ERROR_GENERIC_UNKNOWN_EXCEPTION_S_S_S_S = None
+    ERROR_BATCH_EXPECTED_S_RESPONSES_GOT_S = None
+    ERROR_EXPORT_UNKNOWN_FORMAT_S = None
+    ERROR_SNAPSHOT_BAD_FILE_S = None
+    ERROR_SNAPSHOT_READ_ONLY_S = None
+    ERROR_SNAPSHOT_NO_UID_S = None
+    ERROR_OID_S_EXISTS_AS_S_NOT_S = None
+    ERROR_WORKFLOW_DUPLICATE_STEP_S = None
+    ERROR_WORKFLOW_STEP_S_UNKNOWN_S = None
+    ERROR_WORKFLOW_CYCLE_S = None
+    ERROR_WORKFLOW_COMPENSATE_S_FAILED_S = None
+    ERROR_CLI_UNKNOWN_INPUT_FORMAT_S = None
+    ERROR_BREAKER_OPEN_S_S_S = None
+    ERROR_WRITE_BEHIND_CLOSED = None
+    ERROR_LOAD_UNKNOWN_METHOD_S_S = None
+    ERROR_LOAD_NO_TARGET_S = None
+    ERROR_DEVICE_CLASS_TREE_S_GOT_S = None
+    ERROR_EVENTS_QUERY_GOT_S = None
 
     WARN_S_AND_S_CONFLICT = None
 
@@ -105,6 +202,108 @@ class C(object):
     API_DESCRIPTION = None
     API_CONNECTION_INFO = None
     API_CONTEXT_UID = None
+    API_ELAPSED = None
+    API_PARAMS = None
+    API_DEVICES_KEY = None
+    API_TOTAL_COUNT = None
+    API_CHILDREN = None
+    API_TEXT = None
+    API_COUNT = None
+    API_NEW_JOBS = None
+    API_JOB_ID = None
+    API_JOB_IDS = None
+    API_UUID = None
+    API_STATUS = None
+    API_EVENTS = None
+    API_EVID = None
+    API_EVIDS = None
+    API_EXCLUDE_IDS = None
+    API_ARCHIVE = None
+    API_ASOF = None
+    API_FIRST_TIME = None
+    API_LAST_TIME = None
+    API_STATE_CHANGE = None
+    API_EVENT_STATE = None
+    API_SEVERITY = None
+    API_SUMMARY = None
+    API_DEVICE = None
+
+    # Job statuses (JobsRouter getInfo 'status')
+    API_JOB_STATUS_PENDING = None
+    API_JOB_STATUS_STARTED = None
+    API_JOB_STATUS_RETRY = None
+    API_JOB_STATUS_SUCCESS = None
+    API_JOB_STATUS_FAILURE = None
+    API_JOB_STATUS_ABORTED = None
+    API_JOB_STATUS_REVOKED = None
+    API_JOB_STATUS_FINISHED = None
+    API_JOB_NOT_FOUND = None
+
+    # Event states (EventsRouter query 'eventState')
+    API_EVENT_STATE_NEW = None
+    API_EVENT_STATE_ACKNOWLEDGED = None
+    API_EVENT_STATE_CLOSED = None
+
+    # Bulk OID import report
+    OID_IMPORT_CREATED = None
+    OID_IMPORT_SKIPPED = None
+    OID_IMPORT_FAILED = None
+    OID_IMPORT_RATE = None
+
+    # OID index
+    OID_INDEX_MIBS = None
+    OID_INDEX_RECORDS = None
+
+    # Inventory export
+    EXPORT_FORMAT_JSONL = None
+    EXPORT_FORMAT_PARQUET = None
+    EXPORT_MANIFEST_SUFFIX = None
+    EXPORT_KIND = None
+    EXPORT_KIND_DEVICE = None
+    EXPORT_KIND_TEMPLATE = None
+    EXPORT_LISTING = None
+    EXPORT_INFO = None
+    EXPORT_FINGERPRINT = None
+    EXPORT_RECORD = None
+    EXPORT_FINGERPRINTS = None
+    EXPORT_KEYS = None
+    EXPORT_EXPORTED_AT = None
+    EXPORT_PATH = None
+
+    # Snapshot store
+    SNAPSHOT_MAGIC = None
+    SNAPSHOT_BOUND_TEMPLATES = None
+    SNAPSHOT_TEMPLATES = None
+    SNAPSHOT_INDEX_UIDS = None
+    SNAPSHOT_INDEX_NAMES = None
+    SNAPSHOT_INDEX_CLASSES = None
+    SNAPSHOT_INDEX_FIELDS = None
+    SNAPSHOT_DEVICES_PATH_PART = None
+
+    # Configuration diff
+    DIFF_HASH = None
+    DIFF_KIND = None
+    DIFF_NODE_DATA = None
+    DIFF_DETAILS = None
+    DIFF_ROOT = None
+    DIFF_KIND_ROOT = None
+    DIFF_KIND_DEVICE_CLASS = None
+    DIFF_KIND_TEMPLATE = None
+    DIFF_KIND_DATA_SOURCE = None
+    DIFF_KIND_DATA_POINT = None
+    DIFF_KIND_THRESHOLD = None
+    DIFF_KIND_GRAPH = None
+    DIFF_KIND_GRAPH_POINT = None
+    DIFF_KIND_BINDING = None
+    DIFF_ADDED = None
+    DIFF_REMOVED = None
+    DIFF_MODIFIED = None
+
+    # Template crawler
+    CRAWL_PARENT = None
+    CRAWL_VISITED = None
+    CRAWL_PENDING = None
+    CRAWL_DP_NAME = None
 
     # Production States
     API_PRODUCTION_STATE_PRODUCTION = 1000
@@ -181,11 +380,15 @@ class C(object):
     API_ROUTER_DEVICE_ENDPOINT = None
     API_ROUTER_TEMPLATE_ENDPOINT = None
     API_ROUTER_MIB_ENDPOINT = None
+    API_ROUTER_JOBS_ENDPOINT = None
+    API_ROUTER_EVENTS_ENDPOINT = None
 
     # API Endpoint Actions
     API_ACTION_DEVICE_ROUTER = None
     API_ACTION_TEMPLATE_ROUTER = None
     API_ACTION_MIB_ROUTER = None
+    API_ACTION_JOBS_ROUTER = None
+    API_ACTION_EVENTS_ROUTER = None
 
     # API Methods
     API_METHOD_GET_INFO = None
@@ -229,6 +432,16 @@ class C(object):
     API_METHOD_ADD_OID_MAPPING = None
     API_METHOD_GET_OID_MAPPINGS = None
 
+    # - Jobs (getInfo is API_METHOD_GET_INFO)
+    API_METHOD_ABORT_JOBS = None
+
+    # - Events
+    API_METHOD_QUERY = None
+    API_METHOD_ACKNOWLEDGE = None
+    API_METHOD_UNACKNOWLEDGE = None
+    API_METHOD_CLOSE = None
+    API_METHOD_REOPEN = None
+
     # API Data Source Types
     API_DATA_SOURCE_TYPE_APACHEMONITOR = None
     API_DATA_SOURCE_TYPE_BUILT_IN = None
@@ -284,6 +497,99 @@ class C(object):
 
     HEADER_CONTENT_TYPE = None
     HEADER_JSON = None
+    HEADER_ACCEPT_ENCODING = None
+    HEADER_CONTENT_ENCODING = None
+    HEADER_CONTENT_LENGTH = None
+
+    ENCODING_GZIP = None
+    ENCODING_DEFLATE = None
+    ENCODING_BR = None
+    ENCODING_IDENTITY = None
+
+    # Command line tool (zenoss_cli)
+    CLI_COMMAND = None
+    CLI_COMMAND_ADD = None
+    CLI_COMMAND_REMOVE = None
+    CLI_COMMAND_BIND = None
+    CLI_COMMAND_EXPORT = None
+    CLI_COMMAND_MONITOR = None
+    CLI_COMMAND_LOAD = None
+    CLI_FORMAT_CSV = None
+    CLI_FORMAT_YAML = None
+    CLI_HOSTNAME = None
+    CLI_TEMPLATES = None
+    CLI_ZID = None
+    CLI_TARGET_UID = None
+    CLI_WORKERS = None
+    CLI_KEY = None
+    CLI_SUMMARY = None
+    CLI_TOTAL = None
+    CLI_DONE = None
+    CLI_FAILED = None
+    CLI_THROUGHPUT = None
+    CLI_LATENCY = None
+    CLI_NUMERIC_COLUMNS = None
+    CLI_BOOLEAN_COLUMNS = None
+    CLI_TRUE = None
+    CLI_FALSE = None
+
+    # Byte counters (see ZenossAPI.byte_counters)
+    BYTES_REQUESTS = None
+    BYTES_SENT_WIRE = None
+    BYTES_SENT_DECODED = None
+    BYTES_RECEIVED_WIRE = None
+    BYTES_RECEIVED_DECODED = None
+
+    # Circuit breaker states and metrics (see ZenossAPI.breaker_metrics), request priorities (see PriorityGate)
+    BREAKER_CLOSED = None
+    BREAKER_OPEN = None
+    BREAKER_HALF_OPEN = None
+    BREAKER_STATE = None
+    BREAKER_CALLS = None
+    BREAKER_FAILURES = None
+    BREAKER_REJECTED = None
+    BREAKER_OPENED = None
+    BREAKER_CHANGED_AT = None
+    PRIORITY_INTERACTIVE = None
+    PRIORITY_WRITE = None
+    PRIORITY_BULK = None
+    GATE_SLOTS = None
+    GATE_IN_FLIGHT = None
+    GATE_WAITING = None
+    API_READ_METHOD_PREFIX = None
+    FLIGHT_CALLS = None
+    FLIGHT_SHARED = None
+    FLIGHT_DEDUPE_RATIO = None
+    WRITE_BEHIND_WRITES = None
+    WRITE_BEHIND_COALESCED = None
+    WRITE_BEHIND_CALLS = None
+    WRITE_BEHIND_PENDING = None
+    WRITE_BEHIND_CANCELLED = None
+    JOURNAL_JOB = None
+    JOURNAL_KEY = None
+    JOURNAL_AT = None
+    JOURNAL_SKIPPED = None
+    CHUNK_SIZE = None
+    CHUNK_P95 = None
+    CHUNK_OBSERVED = None
+    CHUNK_GROWN = None
+    CHUNK_SHRUNK = None
+    API_MIBS = None
+    DEVICE_CLASS_EXISTS = None
+    DEVICE_CLASS_PARENT_FAILED_S = None
+    LOAD_MODE = None
+    LOAD_MODE_OPEN = None
+    LOAD_MODE_CLOSED = None
+    LOAD_METHODS = None
+    LOAD_TOTAL = None
+    LOAD_COUNT = None
+    LOAD_ERRORS = None
+    LOAD_LAST_ERROR = None
+    LOAD_MIN = None
+    LOAD_MEAN = None
+    LOAD_MAX = None
+    LOAD_PERCENTILES = None
+    LOAD_MAX_BACKLOG = None
 
 # Load the YAML file to override the defaults above.
 try:
@@ -292,7 +598,7 @@ try:
     yams = fin.read()
     fin.close()
     try:
-        yamo = yaml.load(yams)
+        yamo = yaml.safe_load(yams) or {}
     except yaml.ParserError as e:
         logging.error('zenoss_defaults.yaml is incorrectly formatted. Bailing out.')
         raise e
@@ -330,6 +636,23 @@ C.ERROR_VALUES_S_NO_MATCH_S = 'Values %s had no match in key %s.'
 C.ERROR_S_OBJECT_NO_ATTRIBUTE_S = '%s object had no attribute %s'
 C.ERROR_GENERIC_UNKNOWN_EXCEPTION_S_S_S_S = 'An unknown exception occurred while making an API call to host %s.'\
                                       'Endpoint: %s -- Action: %s -- Method: %s'
+C.ERROR_BATCH_EXPECTED_S_RESPONSES_GOT_S = 'Batched API call expected %s responses. Got %s.'
+C.ERROR_EXPORT_UNKNOWN_FORMAT_S = 'Unknown export format %s. Expected "jsonl" or "parquet" (requires pyarrow).'
+C.ERROR_SNAPSHOT_BAD_FILE_S = '%s is not a Zenoss snapshot file.'
+C.ERROR_SNAPSHOT_READ_ONLY_S = 'Snapshots are read-only. %s needs the live API.'
+C.ERROR_SNAPSHOT_NO_UID_S = 'No object with uid %s in the snapshot.'
+C.ERROR_OID_S_EXISTS_AS_S_NOT_S = 'OID mapping %s already exists as %s. Not changing it to %s.'
+C.ERROR_WORKFLOW_DUPLICATE_STEP_S = 'Workflow already has a step named %s.'
+C.ERROR_WORKFLOW_STEP_S_UNKNOWN_S = 'Workflow step %s depends on unknown steps or values %s.'
+C.ERROR_WORKFLOW_CYCLE_S = 'Workflow steps %s depend on each other and can never run.'
+C.ERROR_WORKFLOW_COMPENSATE_S_FAILED_S = 'Undoing workflow step %s failed: %s'
+C.ERROR_CLI_UNKNOWN_INPUT_FORMAT_S = 'Unknown input format: %s. Expected csv or yaml.'
+C.ERROR_BREAKER_OPEN_S_S_S = 'Not calling %s %s: it failed too often recently. Trying again in %.0fs.'
+C.ERROR_WRITE_BEHIND_CLOSED = 'The write-behind queue is closed.'
+C.ERROR_LOAD_UNKNOWN_METHOD_S_S = 'The load generator can\'t call %s. Use one of: %s'
+C.ERROR_LOAD_NO_TARGET_S = 'Nothing for %s to read: no devices in the device class.'
+C.ERROR_DEVICE_CLASS_TREE_S_GOT_S = 'Could not read the device class tree under %s. Got: %s'
+C.ERROR_EVENTS_QUERY_GOT_S = 'The event query failed. Got: %s'
 
 C.WARN_S_AND_S_CONFLICT = 'Function arguments %s and %s conflict. Preserving data.'
 
@@ -404,6 +727,108 @@ C.API_DELETE = 'delete'
 C.API_DESCRIPTION = 'description'
 C.API_CONNECTION_INFO = 'connectionInfo'
 C.API_CONTEXT_UID = 'contextUid'
+C.API_ELAPSED = 'elapsed'  # not a Zenoss keyword; used in the per-uid results of the bulk functions.
+C.API_PARAMS = 'params'
+C.API_DEVICES_KEY = 'devices'
+C.API_TOTAL_COUNT = 'totalCount'
+C.API_CHILDREN = 'children'
+C.API_TEXT = 'text'
+C.API_COUNT = 'count'
+C.API_NEW_JOBS = 'new_jobs'
+C.API_JOB_ID = 'jobid'
+C.API_JOB_IDS = 'jobids'
+C.API_UUID = 'uuid'
+C.API_STATUS = 'status'
+C.API_EVENTS = 'events'
+C.API_EVID = 'evid'
+C.API_EVIDS = 'evids'
+C.API_EXCLUDE_IDS = 'excludeIds'
+C.API_ARCHIVE = 'archive'
+C.API_ASOF = 'asof'
+C.API_FIRST_TIME = 'firstTime'
+C.API_LAST_TIME = 'lastTime'
+C.API_STATE_CHANGE = 'stateChange'
+C.API_EVENT_STATE = 'eventState'
+C.API_SEVERITY = 'severity'
+C.API_SUMMARY = 'summary'
+C.API_DEVICE = 'device'
+
+C.API_JOB_STATUS_PENDING = 'PENDING'
+C.API_JOB_STATUS_STARTED = 'STARTED'
+C.API_JOB_STATUS_RETRY = 'RETRY'
+C.API_JOB_STATUS_SUCCESS = 'SUCCESS'
+C.API_JOB_STATUS_FAILURE = 'FAILURE'
+C.API_JOB_STATUS_ABORTED = 'ABORTED'
+C.API_JOB_STATUS_REVOKED = 'REVOKED'
+C.API_JOB_STATUS_FINISHED = (C.API_JOB_STATUS_SUCCESS, C.API_JOB_STATUS_FAILURE, C.API_JOB_STATUS_ABORTED,
+                             C.API_JOB_STATUS_REVOKED)
+# getInfo for a job the JobManager doesn't have fails with a NoSuchJobException
+C.API_JOB_NOT_FOUND = 'NoSuchJob'
+
+C.API_EVENT_STATE_NEW = 'New'
+C.API_EVENT_STATE_ACKNOWLEDGED = 'Acknowledged'
+C.API_EVENT_STATE_CLOSED = 'Closed'
+
+# Bulk OID import report
+C.OID_IMPORT_CREATED = 'created'
+C.OID_IMPORT_SKIPPED = 'skipped'
+C.OID_IMPORT_FAILED = 'failed'
+C.OID_IMPORT_RATE = 'rate'
+
+# OID index
+C.OID_INDEX_MIBS = 'mibs'
+C.OID_INDEX_RECORDS = 'records'
+
+# Inventory export
+C.EXPORT_FORMAT_JSONL = 'jsonl'
+C.EXPORT_FORMAT_PARQUET = 'parquet'
+C.EXPORT_MANIFEST_SUFFIX = '.manifest.json'
+C.EXPORT_KIND = 'kind'
+C.EXPORT_KIND_DEVICE = 'device'
+C.EXPORT_KIND_TEMPLATE = 'template'
+C.EXPORT_LISTING = 'listing'
+C.EXPORT_INFO = 'info'
+C.EXPORT_FINGERPRINT = 'fingerprint'
+C.EXPORT_RECORD = 'record'
+C.EXPORT_FINGERPRINTS = 'fingerprints'
+C.EXPORT_KEYS = 'keys'
+C.EXPORT_EXPORTED_AT = 'exported_at'
+C.EXPORT_PATH = 'path'
+
+# Snapshot store
+C.SNAPSHOT_MAGIC = b'ZSNAP001'
+C.SNAPSHOT_BOUND_TEMPLATES = 'bound_templates'
+C.SNAPSHOT_TEMPLATES = 'templates'
+C.SNAPSHOT_INDEX_UIDS = 'uids'
+C.SNAPSHOT_INDEX_NAMES = 'names'
+C.SNAPSHOT_INDEX_CLASSES = 'classes'
+C.SNAPSHOT_INDEX_FIELDS = 'fields'
+C.SNAPSHOT_DEVICES_PATH_PART = '/devices/'
+
+# Configuration diff
+C.DIFF_HASH = 'hash'
+C.DIFF_KIND = 'kind'
+C.DIFF_NODE_DATA = 'data'
+C.DIFF_DETAILS = 'details'
+C.DIFF_ROOT = 'root'
+C.DIFF_KIND_ROOT = 'root'
+C.DIFF_KIND_DEVICE_CLASS = 'device_class'
+C.DIFF_KIND_TEMPLATE = 'template'
+C.DIFF_KIND_DATA_SOURCE = 'datasource'
+C.DIFF_KIND_DATA_POINT = 'datapoint'
+C.DIFF_KIND_THRESHOLD = 'threshold'
+C.DIFF_KIND_GRAPH = 'graph'
+C.DIFF_KIND_GRAPH_POINT = 'graph_point'
+C.DIFF_KIND_BINDING = 'binding'
+C.DIFF_ADDED = 'added'
+C.DIFF_REMOVED = 'removed'
+C.DIFF_MODIFIED = 'modified'
+
+# Template crawler
+C.CRAWL_PARENT = 'parent'
+C.CRAWL_VISITED = 'visited'
+C.CRAWL_PENDING = 'pending'
+C.CRAWL_DP_NAME = 'dpName'
 
 C.API_KEYWORD_DEFAULTS = {
     C.API_TID: 1,
@@ -506,11 +931,15 @@ C.API_PATH_PART_GRAPH_POINTS = 'graphPoints'
 C.API_ROUTER_DEVICE_ENDPOINT = '/device_router'
 C.API_ROUTER_TEMPLATE_ENDPOINT = '/template_router'
 C.API_ROUTER_MIB_ENDPOINT = '/mib_router'
+C.API_ROUTER_JOBS_ENDPOINT = '/jobs_router'
+C.API_ROUTER_EVENTS_ENDPOINT = '/evconsole_router'
 
 # API Endpoint Actions
 C.API_ACTION_DEVICE_ROUTER = 'DeviceRouter'
 C.API_ACTION_TEMPLATE_ROUTER = 'TemplateRouter'
 C.API_ACTION_MIB_ROUTER = 'MibRouter'
+C.API_ACTION_JOBS_ROUTER = 'JobsRouter'
+C.API_ACTION_EVENTS_ROUTER = 'EventsRouter'
 
 # API Methods
 C.API_METHOD_GET_INFO = 'getInfo'
@@ -554,6 +983,15 @@ C.API_METHOD_DELETE_TEMPLATE = 'deleteTemplate'
 C.API_METHOD_ADD_OID_MAPPING = 'addOidMapping'
 C.API_METHOD_GET_OID_MAPPINGS = 'getOidMappings'
 
+# - Jobs
+C.API_METHOD_ABORT_JOBS = 'abort'
+# - Events
+C.API_METHOD_QUERY = 'query'
+C.API_METHOD_ACKNOWLEDGE = 'acknowledge'
+C.API_METHOD_UNACKNOWLEDGE = 'unacknowledge'
+C.API_METHOD_CLOSE = 'close'
+C.API_METHOD_REOPEN = 'reopen'
+
 # API Data Source Types
 # These were created by getting them directly from the API.
 C.API_DATA_SOURCE_TYPE_APACHEMONITOR = 'ApacheMonitor'
@@ -610,4 +1048,104 @@ C.API_LINE_TYPE_LINE = 'LINE'
 
 C.HEADER_CONTENT_TYPE = 'Content-Type'
 C.HEADER_JSON = {C.HEADER_CONTENT_TYPE: 'application/json'}
+C.HEADER_ACCEPT_ENCODING = 'Accept-Encoding'
+C.HEADER_CONTENT_ENCODING = 'Content-Encoding'
+C.HEADER_CONTENT_LENGTH = 'Content-Length'
+
+C.ENCODING_GZIP = 'gzip'
+C.ENCODING_DEFLATE = 'deflate'
+C.ENCODING_BR = 'br'
+C.ENCODING_IDENTITY = 'identity'
+
+C.CLI_COMMAND = 'command'
+C.CLI_COMMAND_ADD = 'add'
+C.CLI_COMMAND_REMOVE = 'remove'
+C.CLI_COMMAND_BIND = 'bind'
+C.CLI_COMMAND_EXPORT = 'export'
+C.CLI_COMMAND_MONITOR = 'monitor'
+C.CLI_COMMAND_LOAD = 'load'
+C.CLI_FORMAT_CSV = 'csv'
+C.CLI_FORMAT_YAML = 'yaml'
+C.CLI_HOSTNAME = 'hostname'
+C.CLI_TEMPLATES = 'templates'
+C.CLI_ZID = 'zid'
+C.CLI_TARGET_UID = 'target_uid'
+C.CLI_WORKERS = 'workers'
+C.CLI_KEY = 'key'
+C.CLI_SUMMARY = 'summary'
+C.CLI_TOTAL = 'total'
+C.CLI_DONE = 'done'
+C.CLI_FAILED = 'failed'
+C.CLI_THROUGHPUT = 'throughput'
+C.CLI_LATENCY = 'latency'
+# CSV columns sent as numbers. Everything else stays a string: serial numbers, communities, rack slots, ...
+C.CLI_NUMERIC_COLUMNS = (C.API_PRODUCTION_STATE, C.API_PRIORITY, C.API_SNMP_PORT, 'threshold_max', 'threshold_min',
+                         'graph_min_y', 'graph_max_y', C.CLI_WORKERS)
+# CSV columns sent as booleans, and the (lower case) cells that spell them.
+C.CLI_BOOLEAN_COLUMNS = (C.API_MODEL, 'graph', 'overwrite', 'delete_on_fail')
+C.CLI_TRUE = ('true', 'yes', 'y', 'on', '1')
+C.CLI_FALSE = ('false', 'no', 'n', 'off', '0')
+
+C.BYTES_REQUESTS = 'requests'
+C.BYTES_SENT_WIRE = 'sent_wire'
+C.BYTES_SENT_DECODED = 'sent_decoded'
+C.BYTES_RECEIVED_WIRE = 'received_wire'
+C.BYTES_RECEIVED_DECODED = 'received_decoded'
+
+C.BREAKER_CLOSED = 'closed'
+C.BREAKER_OPEN = 'open'
+C.BREAKER_HALF_OPEN = 'half_open'
+C.BREAKER_STATE = 'state'
+C.BREAKER_CALLS = 'calls'
+C.BREAKER_FAILURES = 'failures'
+C.BREAKER_REJECTED = 'rejected'
+C.BREAKER_OPENED = 'opened'
+C.BREAKER_CHANGED_AT = 'changed_at'
+C.PRIORITY_INTERACTIVE = 0
+C.PRIORITY_WRITE = 1
+C.PRIORITY_BULK = 2
+C.GATE_SLOTS = 'slots'
+C.GATE_IN_FLIGHT = 'in_flight'
+C.GATE_WAITING = 'waiting'
+# Router methods whose name starts with this only read (getDevices, getInfo, ...).
+C.API_READ_METHOD_PREFIX = 'get'
+
+C.FLIGHT_CALLS = 'calls'
+C.FLIGHT_SHARED = 'shared'
+C.FLIGHT_DEDUPE_RATIO = 'dedupe_ratio'
+
+C.WRITE_BEHIND_WRITES = 'writes'
+C.WRITE_BEHIND_COALESCED = 'coalesced'
+C.WRITE_BEHIND_CALLS = 'calls'
+C.WRITE_BEHIND_PENDING = 'pending'
+C.WRITE_BEHIND_CANCELLED = 'Cancelled out by a later toggle of the same binding.'
+
+C.JOURNAL_JOB = 'job'
+C.JOURNAL_KEY = 'key'
+C.JOURNAL_AT = 'at'
+C.JOURNAL_SKIPPED = 'Already done according to the journal.'
+
+C.CHUNK_SIZE = 'size'
+C.CHUNK_P95 = 'p95'
+C.CHUNK_OBSERVED = 'observed'
+C.CHUNK_GROWN = 'grown'
+C.CHUNK_SHRUNK = 'shrunk'
+
+C.API_MIBS = '/Mibs'
+
+C.DEVICE_CLASS_EXISTS = 'Already exists.'
+C.DEVICE_CLASS_PARENT_FAILED_S = 'Not created: its parent %s could not be created.'
 
+C.LOAD_MODE = 'mode'
+C.LOAD_MODE_OPEN = 'open'
+C.LOAD_MODE_CLOSED = 'closed'
+C.LOAD_METHODS = 'methods'
+C.LOAD_TOTAL = 'total'
+C.LOAD_COUNT = 'count'
+C.LOAD_ERRORS = 'errors'
+C.LOAD_LAST_ERROR = 'last_error'
+C.LOAD_MIN = 'min'
+C.LOAD_MEAN = 'mean'
+C.LOAD_MAX = 'max'
+C.LOAD_PERCENTILES = (50, 90, 99, 99.9)
+C.LOAD_MAX_BACKLOG = 'max_backlog'
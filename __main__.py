@@ -0,0 +1,9 @@
+import sys
+
+try:
+    from zenoss5_api.zenoss_cli import main
+except ImportError:
+    from zenoss_cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+import pytest
+
+try:
+    from zenoss5_api.zenoss_stub import StubZenoss
+except ImportError:
+    from zenoss_stub import StubZenoss
+
+
+@pytest.fixture
+def stub():
+    # A stub server with a few devices in /Server/Linux, stopped after the test.
+    server = StubZenoss(devices=5)
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def zap(stub):
+    return stub.api()
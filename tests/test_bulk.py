@@ -0,0 +1,35 @@
+try:
+    from zenoss5_api.CONSTS import C
+except ImportError:
+    from CONSTS import C
+
+
+def test_set_device_info_bulk_merges_updates_and_reports_each_uid(stub, zap):
+    uids = sorted(stub.devices)
+    missing = C.API_DEVICES_SERVER_LINUX_DEVICES + '/gone.example.com'
+    updates = [(uids[0], {C.API_COMMENTS: 'first'}), (uids[1], {C.API_COMMENTS: 'b'}),
+               (uids[0], {C.API_COMMENTS: 'later', C.API_PRIORITY: 5}), (missing, {C.API_COMMENTS: 'x'})]
+    outcomes = zap.set_device_info_bulk(updates, batch_size=2, workers=2)
+
+    assert sorted(outcomes) == sorted([uids[0], uids[1], missing])
+    assert outcomes[uids[0]][C.API_SUCCESS] and outcomes[uids[1]][C.API_SUCCESS]
+    assert not outcomes[missing][C.API_SUCCESS]
+    assert missing in outcomes[missing][C.API_MSG]
+    # Repeated updates to a uid are merged into one call, later values winning.
+    assert len([c for c in stub.calls if c[1] == C.API_METHOD_SET_INFO]) == 3
+    assert stub.devices[uids[0]][C.API_COMMENTS] == 'later' and stub.devices[uids[0]][C.API_PRIORITY] == 5
+    # Three calls, two per envelope.
+    assert zap.byte_counters()[C.BYTES_REQUESTS] == 2
+
+
+def test_a_failed_envelope_fails_each_of_its_calls(stub, zap):
+    stub.errors[C.API_METHOD_SET_INFO] = 503
+    outcomes = zap.set_production_levels(sorted(stub.devices), C.API_PRODUCTION_STATE_MAINTENANCE, batch_size=2)
+    assert len(outcomes) == len(stub.devices)
+    assert not [o for o in outcomes.values() if o[C.API_SUCCESS]]
+    assert all(o[C.API_MSG].startswith('503') for o in outcomes.values())
+
+    del stub.errors[C.API_METHOD_SET_INFO]
+    outcomes = zap.set_production_levels(sorted(stub.devices), C.API_PRODUCTION_STATE_MAINTENANCE, batch_size=1)
+    assert all(o[C.API_SUCCESS] for o in outcomes.values())
+    assert set(d[C.API_PRODUCTION_STATE] for d in stub.devices.values()) == set([C.API_PRODUCTION_STATE_MAINTENANCE])
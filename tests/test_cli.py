@@ -0,0 +1,69 @@
+import json
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api import zenoss_cli
+except ImportError:
+    from CONSTS import C
+    import zenoss_cli
+
+
+def _run(stub, tmp_path, argv, rows):
+    credentials = tmp_path / 'credentials.yaml'
+    credentials.write_text(u'admin: zenoss\n')
+    source = tmp_path / 'rows.json'
+    source.write_text(json.dumps(rows))
+    log = tmp_path / 'log.jsonl'
+    rc = zenoss_cli.main(['--host', stub.uri, '--credentials', str(credentials), '--log', str(log), '--quiet'] +
+                         argv + [str(source)])
+    return rc, [json.loads(line) for line in log.read_text().splitlines()]
+
+
+def _monitor_targets(stub):
+    return [data[C.API_TARGET_UID] for action, method, data in stub.calls if method == C.API_METHOD_ADD_TEMPLATE]
+
+
+def test_monitor_defaults_the_target_to_the_device_class(stub, tmp_path):
+    _run(stub, tmp_path, ['monitor'], [{C.CLI_ZID: 'Uptime', C.API_OID: '1.3.6.1.2.1.1.3.0'}])
+    assert _monitor_targets(stub) == [C.API_DEVICES_SERVER_LINUX]
+
+
+def test_monitor_accepts_device_classes_and_uids_as_targets(stub, tmp_path):
+    rows = [{C.CLI_ZID: 'A', C.API_OID: '1', C.CLI_TARGET_UID: '/Network/Cisco'},
+            {C.CLI_ZID: 'B', C.API_OID: '1', C.CLI_TARGET_UID: '/Devices/Network/Juniper'},
+            {C.CLI_ZID: 'C', C.API_OID: '1', C.CLI_TARGET_UID: '/zport/dmd/Devices/Server'}]
+    _run(stub, tmp_path, ['--workers', '1', 'monitor'], rows)
+    assert sorted(_monitor_targets(stub)) == ['/zport/dmd/Devices/Network/Cisco', '/zport/dmd/Devices/Network/Juniper',
+                                              '/zport/dmd/Devices/Server']
+
+
+def test_monitor_journals_the_template_uid(zap):
+    args = zenoss_cli.build_parser().parse_args(['monitor', '--device-class', '/Server/Windows'])
+    tasks = zenoss_cli._monitor_tasks(zap, [{C.CLI_ZID: 'Uptime', C.API_OID: '1'}], args, None)
+    assert tasks[0][2] == ['/zport/dmd/Devices/Server/Windows/rrdTemplates/Uptime']
+
+
+def test_every_device_class_option_takes_a_device_class(zap):
+    for command in (C.CLI_COMMAND_ADD, C.CLI_COMMAND_REMOVE, C.CLI_COMMAND_MONITOR, C.CLI_COMMAND_LOAD):
+        args = zenoss_cli.build_parser().parse_args([command])
+        assert args.device_class == C.API_DEVICE_CLASS_SERVER_LINUX
+        assert zenoss_cli._device_class_uid(args.device_class) == C.API_DEVICES_SERVER_LINUX
+    assert zenoss_cli._device_class_uid(C.API_DEVICES_SERVER_LINUX) == C.API_DEVICES_SERVER_LINUX
+
+
+def test_read_rows_keeps_strings_that_look_numeric(tmp_path):
+    path = tmp_path / 'devices.csv'
+    path.write_text(u'deviceName,serialNumber,snmpCommunity,rackSlot,productionState\n'
+                    u'web01,00123,12345,1e3,500\n')
+    rows = zenoss_cli.read_rows(str(path))
+    assert rows == [{'deviceName': 'web01', 'serialNumber': '00123', 'snmpCommunity': '12345', 'rackSlot': '1e3',
+                     'productionState': 500}]
+
+
+def test_read_rows_parses_monitor_booleans_and_thresholds(tmp_path):
+    path = tmp_path / 'monitors.csv'
+    path.write_text(u'zid,oid,threshold_max,threshold_min,graph,overwrite,delete_on_fail\n'
+                    u'Uptime,1.3.6.1.2.1.1.3.0,90,0.5,no,True,0\n')
+    rows = zenoss_cli.read_rows(str(path))
+    assert rows == [{'zid': 'Uptime', 'oid': '1.3.6.1.2.1.1.3.0', 'threshold_max': 90, 'threshold_min': 0.5,
+                     'graph': False, 'overwrite': True, 'delete_on_fail': False}]
@@ -0,0 +1,47 @@
+try:
+    from zenoss5_api.CONSTS import C
+except ImportError:
+    from CONSTS import C
+
+
+def test_compressed_responses_count_fewer_wire_bytes(stub, zap):
+    stub.compress_min_bytes = 0
+    zap.get_devices(C.API_DEVICES_SERVER_LINUX)
+    counters = zap.byte_counters()
+    assert counters[C.BYTES_REQUESTS] == 1
+    assert 0 < counters[C.BYTES_RECEIVED_WIRE] < counters[C.BYTES_RECEIVED_DECODED]
+    assert counters[C.BYTES_SENT_WIRE] == counters[C.BYTES_SENT_DECODED]  # request compression is off by default
+    zap.reset_byte_counters()
+    assert set(zap.byte_counters().values()) == set([0])
+
+
+def test_identity_responses_when_compression_is_not_accepted(stub, zap):
+    stub.compress_min_bytes = 0
+    accept_compressed = C.ACCEPT_COMPRESSED
+    try:
+        C.ACCEPT_COMPRESSED = False
+        zap.get_devices(C.API_DEVICES_SERVER_LINUX)
+    finally:
+        C.ACCEPT_COMPRESSED = accept_compressed
+    counters = zap.byte_counters()
+    assert counters[C.BYTES_RECEIVED_WIRE] == counters[C.BYTES_RECEIVED_DECODED]
+
+
+def test_compress_requests_only_gzips_large_bodies(stub):
+    zap = stub.api(compress_requests=True)
+    uids = sorted(stub.devices)
+    min_bytes = C.COMPRESS_REQUESTS_MIN_BYTES
+    try:
+        C.COMPRESS_REQUESTS_MIN_BYTES = 256
+        zap.get_devices(C.API_DEVICES_SERVER_LINUX)
+        small = zap.byte_counters()
+        zap.set_production_levels(uids, 300, batch_size=len(uids))  # one POST of five setInfo calls
+    finally:
+        C.COMPRESS_REQUESTS_MIN_BYTES = min_bytes
+    counters = zap.byte_counters()
+    assert small[C.BYTES_SENT_WIRE] == small[C.BYTES_SENT_DECODED]
+    sent_wire = counters[C.BYTES_SENT_WIRE] - small[C.BYTES_SENT_WIRE]
+    sent_decoded = counters[C.BYTES_SENT_DECODED] - small[C.BYTES_SENT_DECODED]
+    assert sent_decoded >= 256 and sent_wire < sent_decoded
+    # The stub decoded the gzipped body and applied it.
+    assert set(d[C.API_PRODUCTION_STATE] for d in stub.devices.values()) == set([300])
@@ -0,0 +1,86 @@
+import os
+import json
+
+import pytest
+import requests
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_crawler import TemplateBlueprint, TemplateCrawler, clone_template
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+    from zenoss_crawler import TemplateBlueprint, TemplateCrawler, clone_template
+
+WINDOWS = C.API_ENDPOINT + C.API_DEVICES + '/Server/Windows'
+
+
+def _template_uid(target_uid, name):
+    return target_uid + C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/' + name
+
+
+def _objects_under(stub, template_uid):
+    # The template's objects, by their path below the template.
+    return dict((uid[len(template_uid):], record) for uid, record in stub.template_objects.items()
+                if uid.startswith(template_uid + '/'))
+
+
+def _monitors(zap, names):
+    for i, name in enumerate(names):
+        zap.add_new_snmp_monitor(name, C.API_DEVICES_SERVER_LINUX, oid='1.3.6.1.2.1.1.%d.0' % i, threshold_max=i + 10)
+
+
+def test_clone_template_copies_the_template_and_reports_failed_targets(stub, zap):
+    _monitors(zap, ['Uptime'])
+    stub.device_classes.add(WINDOWS)
+    missing = C.API_ENDPOINT + C.API_DEVICES + '/Server/Missing'
+    src = _template_uid(C.API_DEVICES_SERVER_LINUX, 'Uptime')
+    results = clone_template(zap, src, [WINDOWS, missing], workers=2)
+
+    assert results[WINDOWS] == _template_uid(WINDOWS, 'Uptime')
+    assert isinstance(results[missing], ZenossError)
+    source, copy = _objects_under(stub, src), _objects_under(stub, results[WINDOWS])
+    assert sorted(copy) == sorted(source)
+    threshold = copy['/thresholds/Uptime_thresholds']
+    assert threshold[C.API_MAX_VAL] == 10
+    # The threshold refers to the copy's data point, not the source's.
+    dp_uid = results[WINDOWS] + '/datasources/Uptime_datasources/datapoints/Uptime_datasources'
+    assert threshold[C.API_DATA_POINTS] == [dp_uid]
+    assert copy['/datasources/Uptime_datasources'][C.API_OID] == '1.3.6.1.2.1.1.0.0'
+
+
+def test_apply_deletes_the_template_whatever_stops_it(stub, zap):
+    _monitors(zap, ['Uptime'])
+    stub.device_classes.add(WINDOWS)
+    blueprint = TemplateBlueprint.read(zap, _template_uid(C.API_DEVICES_SERVER_LINUX, 'Uptime'))
+
+    def drop(*args, **kwargs):
+        raise requests.exceptions.ConnectionError('Connection reset by peer')
+
+    zap.add_threshold = drop
+    with pytest.raises(requests.exceptions.ConnectionError):
+        blueprint.apply(zap, WINDOWS)
+    assert _template_uid(WINDOWS, 'Uptime') not in stub.template_objects
+    assert clone_template(zap, blueprint.uid, [WINDOWS])[WINDOWS].args == ('Connection reset by peer',)
+
+
+def test_crawl_resumes_from_its_checkpoint(stub, zap, tmp_path):
+    _monitors(zap, ['Uptime', 'Load', 'Users'])
+    everything = set(node[C.API_UID] for node in TemplateCrawler(zap).crawl())
+    checkpoint = str(tmp_path / 'crawl.json')
+
+    crawl = TemplateCrawler(zap, workers=1, checkpoint=checkpoint, checkpoint_every=1).crawl()
+    first = [next(crawl)[C.API_UID] for _ in range(10)]
+    crawl.close()
+    fin = open(checkpoint, 'r')
+    try:
+        saved = set(json.load(fin)[C.CRAWL_VISITED])
+    finally:
+        fin.close()
+    assert saved and saved < everything
+
+    rest = [node[C.API_UID] for node in TemplateCrawler(zap, checkpoint=checkpoint).crawl()]
+    assert not saved & set(rest)
+    assert set(first) | set(rest) == everything
+    assert not os.path.exists(checkpoint)
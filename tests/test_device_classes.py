@@ -0,0 +1,25 @@
+import pytest
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+
+def test_ensure_device_class_tree_creates_missing_parents_first(stub, zap):
+    outcomes = zap.ensure_device_class_tree(['/Server/Linux/Built/One', '/Server/Linux/Built/Two'])
+    root = C.API_ENDPOINT + C.API_DEVICES
+    assert outcomes[root + '/Server/Linux'] == {C.API_SUCCESS: True, C.API_MSG: C.DEVICE_CLASS_EXISTS}
+    assert all(outcomes[root + path][C.API_SUCCESS] for path in ('/Server/Linux/Built', '/Server/Linux/Built/One',
+                                                                '/Server/Linux/Built/Two'))
+    added = [data[C.API_ID] for action, method, data in stub.calls if method == C.API_METHOD_ADD_DEVICE_CLASS]
+    assert added == ['Built', 'One', 'Two']
+
+
+def test_ensure_device_class_tree_raises_the_get_tree_message(stub, zap):
+    stub.handlers[C.API_METHOD_GET_TREE] = lambda data: {C.API_SUCCESS: False, C.API_MSG: 'Not authorized'}
+    with pytest.raises(ZenossError) as e:
+        zap.ensure_device_class_tree(['/Server/Linux/Built'])
+    assert 'Not authorized' in str(e.value)
@@ -0,0 +1,59 @@
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_diff import ConfigSnapshot, diff
+except ImportError:
+    from CONSTS import C
+    from zenoss_diff import ConfigSnapshot, diff
+
+TEMPLATE_UID = C.API_DEVICES_SERVER_LINUX + C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/Uptime'
+THRESHOLD_UID = TEMPLATE_UID + '/thresholds/Uptime_thresholds'
+
+
+def _changes(changes):
+    return sorted((c.kind, c.uid, c.change) for c in changes)
+
+
+def test_diff_reports_only_what_changed(stub, zap, tmp_path):
+    zap.add_new_snmp_monitor('Uptime', C.API_DEVICES_SERVER_LINUX, oid='1.3.6.1.2.1.1.3.0', threshold_max=10)
+    old = ConfigSnapshot.capture(zap)
+    path = str(tmp_path / 'old.json')
+    old.save(path)
+    old = ConfigSnapshot.load(path)
+    assert diff(old, ConfigSnapshot.capture(zap)) == []
+
+    zap.set_template_info(THRESHOLD_UID, maxval=20)
+    zap.add_new_snmp_monitor('Load', C.API_DEVICES_SERVER_LINUX, oid='1.3.6.1.4.1.2021.10.1.3.1')
+    new = ConfigSnapshot.capture(zap)
+    load_uid = C.API_DEVICES_SERVER_LINUX + C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/Load'
+    # An added template is one change, not one per object in it. Binding Load changed the class' bindings.
+    assert _changes(diff(old, new)) == sorted([
+        (C.DIFF_KIND_BINDING, C.API_DEVICES_SERVER_LINUX, C.DIFF_MODIFIED),
+        (C.DIFF_KIND_TEMPLATE, load_uid, C.DIFF_ADDED),
+        (C.DIFF_KIND_THRESHOLD, THRESHOLD_UID, C.DIFF_MODIFIED)])
+    threshold = [c for c in diff(old, new) if c.kind == C.DIFF_KIND_THRESHOLD][0]
+    assert (threshold.before[C.API_MAX_VAL], threshold.after[C.API_MAX_VAL]) == (10, 20)
+
+    zap.delete_template(load_uid)
+    assert (C.DIFF_KIND_TEMPLATE, load_uid, C.DIFF_REMOVED) in _changes(diff(new, ConfigSnapshot.capture(zap)))
+
+
+def test_diff_compares_details_only_for_changed_objects(stub, zap):
+    fetched = []
+
+    def threshold_details(data):
+        fetched.append(data[C.API_UID])
+        return {C.API_SUCCESS: True, 'record': dict(stub.template_objects[data[C.API_UID]])}
+
+    stub.handlers[(C.API_ACTION_TEMPLATE_ROUTER, C.API_METHOD_GET_THRESHOLD_DETAILS)] = threshold_details
+    zap.add_new_snmp_monitor('Uptime', C.API_DEVICES_SERVER_LINUX, oid='1.3.6.1.2.1.1.3.0', threshold_max=10)
+    first = ConfigSnapshot.capture(zap)
+    zap.set_template_info(THRESHOLD_UID, maxval=20)
+    second = ConfigSnapshot.capture(zap)
+    assert _changes(diff(first, second, api=zap)) == [(C.DIFF_KIND_THRESHOLD, THRESHOLD_UID, C.DIFF_MODIFIED)]
+    assert fetched == [THRESHOLD_UID]
+    assert second.details[THRESHOLD_UID]['record'][C.API_MAX_VAL] == 20
+
+    # The next diff compares the cached details with fresh ones.
+    zap.set_template_info(THRESHOLD_UID, maxval=30)
+    change, = diff(second, ConfigSnapshot.capture(zap), api=zap)
+    assert (change.before['record'][C.API_MAX_VAL], change.after['record'][C.API_MAX_VAL]) == (20, 30)
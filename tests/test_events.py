@@ -0,0 +1,180 @@
+import time
+import threading
+
+import pytest
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_events import EventPoller
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+    from zenoss_events import EventPoller
+
+
+def _raise_events(stub, count, start=None):
+    start = time.time() - 1000 if start is None else start
+    # Three events per second, so pages and watermarks fall in the middle of equal timestamps.
+    return [stub.add_fake_event('dev%d' % (i % 7), 'problem %d' % i, severity=i % 6, at=start + i // 3)
+            for i in range(count)]
+
+
+def test_iter_events_pages_newest_first(stub, zap):
+    _raise_events(stub, 250)
+    events = list(zap.iter_events(page_size=40))
+    assert len(events) == 250
+    assert len(set(e[C.API_EVID] for e in events)) == 250
+    times = [e[C.API_LAST_TIME] for e in events]
+    assert times == sorted(times, reverse=True)
+    queries = [call for call in stub.calls if call[1] == C.API_METHOD_QUERY]
+    assert len(queries) == 7
+    assert [call[2][C.API_START] for call in queries] == [0, 40, 80, 120, 160, 200, 240]
+
+
+def test_iter_events_filter_since_and_keys(stub, zap):
+    start = time.time() - 1000
+    _raise_events(stub, 300, start=start)
+    since = stub.event_time(start + 50)
+    events = list(zap.iter_events(params={C.API_SEVERITY: [5, 4]}, since=since, keys=[C.API_SUMMARY], page_size=10))
+    assert events
+    assert all(e[C.API_LAST_TIME] >= since for e in events)
+    assert all(set(e) == set([C.API_EVID, C.API_LAST_TIME, C.API_SUMMARY]) for e in events)
+    expected = [e for e in stub.events.values() if e[C.API_SEVERITY] in (5, 4) and e[C.API_LAST_TIME] >= since]
+    assert len(events) == len(expected)
+
+
+def test_iter_events_does_not_repeat_events_pushed_down_a_page(stub, zap):
+    _raise_events(stub, 30)
+    events = []
+    for event in zap.iter_events(page_size=10):
+        events.append(event)
+        if len(events) == 5:
+            # New events arriving mid-read shift the later pages by one.
+            stub.add_fake_event('late', 'arrived while paging')
+    evids = [e[C.API_EVID] for e in events]
+    assert len(evids) == len(set(evids))
+    assert set(e[C.API_EVID] for e in stub.events.values() if e[C.API_DEVICE] != 'late') <= set(evids)
+
+
+def test_iter_events_failed_query_raises(stub, zap):
+    stub.errors[C.API_METHOD_QUERY] = 500
+    with pytest.raises(ZenossError, match='500'):
+        list(zap.iter_events())
+
+
+def test_poller_returns_only_new_or_changed_events(stub, zap):
+    raised = _raise_events(stub, 120)
+    poller = EventPoller(zap, page_size=50)
+    first = poller.poll()
+    assert len(first) == 120
+    assert poller.watermark[C.API_LAST_TIME] == max(e[C.API_LAST_TIME] for e in raised)
+
+    del stub.calls[:]
+    assert poller.poll() == []
+    # An idle poll reads one page per watched field.
+    assert len(stub.calls) == 2
+
+    new = stub.add_fake_event('devX', 'brand new')
+    repeated = stub.add_fake_event('dev0', 'problem 0', at=time.time())
+    acknowledged = raised[10][C.API_EVID]
+    zap.acknowledge_events([acknowledged])
+    changed = poller.poll()
+    assert sorted(e[C.API_EVID] for e in changed) == sorted([new[C.API_EVID], repeated[C.API_EVID], acknowledged])
+    assert poller.poll() == []
+
+
+def test_poller_sees_a_second_change_within_the_same_second(stub, zap):
+    raised = _raise_events(stub, 10)
+    poller = EventPoller(zap)
+    poller.poll()
+    evid = raised[3][C.API_EVID]
+    zap.acknowledge_events([evid])
+    assert [e[C.API_EVID] for e in poller.poll()] == [evid]
+    # Closed in the same second as the acknowledge: stateChange doesn't move, eventState does.
+    zap.close_events([evid])
+    changed = poller.poll()
+    assert [e[C.API_EVID] for e in changed] == [evid]
+    assert changed[0][C.API_EVENT_STATE] == C.API_EVENT_STATE_CLOSED
+
+
+def test_poller_resumes_from_a_saved_watermark(stub, zap):
+    _raise_events(stub, 60)
+    poller = EventPoller(zap)
+    poller.poll()
+    resumed = EventPoller(zap, watermark=poller.watermark)
+    again = resumed.poll()
+    # Only the events at the watermark are returned once more, not the whole console.
+    assert 0 < len(again) < 60
+    assert all(e[C.API_LAST_TIME] == poller.watermark[C.API_LAST_TIME] for e in again)
+    assert resumed.poll() == []
+
+
+def test_poller_returns_an_event_iter_events_skipped_on_the_next_poll(stub, zap):
+    _raise_events(stub, 30)
+    # lastTime alone, so that a stateChange pass can't find the event instead.
+    poller = EventPoller(zap, fields=(C.API_LAST_TIME,), page_size=10)
+    poller.poll()
+    now = time.time()
+    new = [stub.add_fake_event('devN', 'new %d' % i, at=now + i) for i in range(25)]
+    query = stub.handlers[(C.API_ACTION_EVENTS_ROUTER, C.API_METHOD_QUERY)]
+    pages = []
+
+    def leave_after_the_first_page(data):
+        result = query(data)
+        pages.append(result[C.API_EVENTS])
+        if len(pages) == 1:
+            # The newest event goes away after the first page, so the second page starts one event later.
+            del stub.events[pages[0][0][C.API_EVID]]
+        return result
+
+    stub.handlers[(C.API_ACTION_EVENTS_ROUTER, C.API_METHOD_QUERY)] = leave_after_the_first_page
+    returned = set(e[C.API_EVID] for e in poller.poll())
+    skipped = set(e[C.API_EVID] for e in new) - returned
+    assert skipped == set([new[-11][C.API_EVID]])
+
+    stub.handlers[(C.API_ACTION_EVENTS_ROUTER, C.API_METHOD_QUERY)] = query
+    assert [e[C.API_EVID] for e in poller.poll()] == [new[-11][C.API_EVID]]
+    assert poller.poll() == []
+
+
+def test_poller_follow_stops(stub, zap):
+    _raise_events(stub, 3)
+    stop = threading.Event()
+    events = []
+    for event in EventPoller(zap).follow(interval=0.01, stop=stop):
+        events.append(event)
+        if len(events) == 3:
+            stop.set()
+    assert len(events) == 3
+
+
+def test_acknowledge_and_close_bulk_batch_the_calls(stub, zap):
+    evids = [e[C.API_EVID] for e in _raise_events(stub, 250)]
+    del stub.calls[:]
+    outcomes = zap.acknowledge_events_bulk(evids, evids_per_call=40, batch_size=3)
+    assert len(outcomes) == 250 and all(o[C.API_SUCCESS] for o in outcomes.values())
+    calls = [call for call in stub.calls if call[1] == C.API_METHOD_ACKNOWLEDGE]
+    # Envelopes run concurrently, so the calls arrive in any order.
+    assert sorted(len(call[2][C.API_EVIDS]) for call in calls) == [10] + [40] * 6
+    assert all(e[C.API_EVENT_STATE] == C.API_EVENT_STATE_ACKNOWLEDGED for e in stub.events.values())
+
+    outcomes = zap.close_events_bulk(evids[:100])
+    assert all(o[C.API_SUCCESS] for o in outcomes.values())
+    states = [stub.events[evid][C.API_EVENT_STATE] for evid in evids]
+    assert states.count(C.API_EVENT_STATE_CLOSED) == 100
+
+
+def test_bulk_reports_failed_envelopes_per_event(stub, zap):
+    evids = [e[C.API_EVID] for e in _raise_events(stub, 5)]
+    stub.errors[C.API_METHOD_CLOSE] = 503
+    outcomes = zap.close_events_bulk(evids, evids_per_call=2)
+    assert sorted(outcomes) == sorted(evids)
+    assert not [o for o in outcomes.values() if o[C.API_SUCCESS]]
+    assert all(o[C.API_MSG].startswith('503') for o in outcomes.values())
+
+
+def test_event_actions_require_evids(zap):
+    # Without evids, acknowledge would act on every event.
+    with pytest.raises(TypeError):
+        zap.acknowledge_events()
@@ -0,0 +1,38 @@
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_export import ZenossExporter, iter_export
+except ImportError:
+    from CONSTS import C
+    from zenoss_export import ZenossExporter, iter_export
+
+
+def _info_calls(stub):
+    return sorted(data[C.API_UID] for action, method, data in stub.calls if method == C.API_METHOD_GET_INFO)
+
+
+def test_export_reuses_unchanged_info_from_the_previous_export(stub, zap, tmp_path):
+    exporter = ZenossExporter(zap, page_size=2, workers=2, processes=0)
+    keys = [C.API_NAME, 'description']
+    first = exporter.export_devices(str(tmp_path / 'first.jsonl'), info_keys=keys)
+    assert len(_info_calls(stub)) == 5
+
+    changed = sorted(stub.devices)[3]
+    stub.devices[changed]['description'] = 'moved'
+    del stub.calls[:]
+    second = exporter.export_devices(str(tmp_path / 'second.jsonl'), info_keys=keys, previous=first[C.EXPORT_PATH])
+    assert _info_calls(stub) == [changed]
+
+    records = dict((r[C.API_UID], r) for r in iter_export(second[C.EXPORT_PATH]))
+    assert sorted(records) == sorted(stub.devices)
+    assert records[changed][C.EXPORT_INFO]['description'] == 'moved'
+    assert all(r[C.EXPORT_INFO][C.API_NAME] == r[C.API_NAME] for r in records.values())
+
+
+def test_export_can_overwrite_its_previous_export(stub, zap, tmp_path):
+    exporter = ZenossExporter(zap, page_size=2, workers=2, processes=0)
+    path = str(tmp_path / 'devices.jsonl')
+    exporter.export_devices(path, info_keys=[C.API_NAME])
+    del stub.calls[:]
+    exporter.export_devices(path, info_keys=[C.API_NAME], previous=path)
+    assert _info_calls(stub) == []
+    assert len([r for r in iter_export(path) if C.EXPORT_INFO in r]) == 5
@@ -0,0 +1,150 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_flow import ChunkSizer, CircuitBreaker, PriorityGate
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+    from zenoss_flow import ChunkSizer, CircuitBreaker, PriorityGate
+
+
+def test_breaker_opens_on_server_errors_and_a_probe_closes_it(stub, zap):
+    stub.errors[C.API_METHOD_GET_DEVICES] = 503
+    for i in range(C.BREAKER_MIN_CALLS):
+        assert zap.get_devices(C.API_DEVICES_SERVER_LINUX)[0] == 503
+    with pytest.raises(ZenossError):
+        zap.get_devices(C.API_DEVICES_SERVER_LINUX)
+    (name, metrics), = zap.breaker_metrics().items()
+    assert name[1] == C.API_METHOD_GET_DEVICES
+    assert (metrics[C.BREAKER_STATE], metrics[C.BREAKER_REJECTED]) == (C.BREAKER_OPEN, 1)
+    assert zap.get_device_info(sorted(stub.devices)[0])[C.API_RESULT][C.API_SUCCESS]  # other methods are unaffected
+
+    # Once open_seconds have passed, one call probes the server.
+    del stub.errors[C.API_METHOD_GET_DEVICES]
+    zap._breaker(*name).changed_at -= C.BREAKER_OPEN_SECONDS
+    assert zap.get_devices(C.API_DEVICES_SERVER_LINUX)[C.API_RESULT][C.API_SUCCESS]
+    assert zap.breaker_metrics()[name][C.BREAKER_STATE] == C.BREAKER_CLOSED
+    # The rejected call never reached the server: the failures, the other method and the probe did.
+    assert zap.byte_counters()[C.BYTES_REQUESTS] == C.BREAKER_MIN_CALLS + 2
+
+
+def test_breaker_counts_slow_calls_and_a_failed_probe_reopens_it():
+    breaker = CircuitBreaker(('device_router', 'getDevices'), min_calls=2, slow_seconds=1.0, open_seconds=60)
+    breaker.after(False, 0.1)
+    breaker.after(False, 5.0)
+    assert breaker.state == C.BREAKER_OPEN
+    breaker.changed_at -= 60
+    assert breaker.before() is True
+    with pytest.raises(ZenossError):
+        breaker.before()  # only one probe at a time
+    breaker.after(True, 0.1, probe=True)
+    assert breaker.state == C.BREAKER_OPEN
+    assert breaker.metrics()[C.BREAKER_OPENED] == 2
+
+
+def test_gate_hands_free_slots_out_by_priority():
+    gate = PriorityGate(slots=1)
+    gate.acquire(C.PRIORITY_BULK)
+    order = []
+
+    def wait(priority):
+        gate.acquire(priority)
+        order.append(priority)
+        gate.release()
+
+    threads = []
+    for priority in (C.PRIORITY_BULK, C.PRIORITY_WRITE, C.PRIORITY_INTERACTIVE, C.PRIORITY_BULK):
+        threads.append(threading.Thread(target=wait, args=(priority,)))
+        threads[-1].start()
+        deadline = time.time() + 5
+        while sum(gate.metrics()[C.GATE_WAITING].values()) < len(threads) and time.time() < deadline:
+            time.sleep(0.01)
+    assert gate.metrics()[C.GATE_IN_FLIGHT] == 1
+    gate.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == [C.PRIORITY_INTERACTIVE, C.PRIORITY_WRITE, C.PRIORITY_BULK, C.PRIORITY_BULK]
+    assert gate.metrics() == {C.GATE_SLOTS: 1, C.GATE_IN_FLIGHT: 0, C.GATE_WAITING: {}}
+
+
+def test_client_never_has_more_than_max_in_flight_requests(stub):
+    zap = stub.api(max_in_flight=2)
+    post, lock = zap._post, threading.Lock()
+    in_flight = [0, 0]  # now, most
+
+    def counted(uri, body, headers):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        try:
+            time.sleep(0.02)
+            return post(uri, body, headers)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    zap._post = counted
+    pool = ThreadPoolExecutor(max_workers=8)
+    try:
+        list(pool.map(zap.get_device_info, sorted(stub.devices) * 4))
+    finally:
+        pool.shutdown()
+    assert in_flight[1] == 2
+
+
+def test_chunk_sizer_grows_under_the_target_and_backs_off_over_it():
+    sizer = ChunkSizer(size=10, target_p95=1.0, max_size=20, window=2, growth=1.5, backoff=0.5)
+    sizer.observe(10, 0.1)
+    sizer.observe(4, 5.0)  # a short last chunk says nothing about the size
+    assert sizer.size == 10
+    sizer.observe(10, 0.1)
+    assert sizer.size == 15
+    for i in range(2):
+        sizer.observe(15, 0.1)
+    assert sizer.size == 20  # capped at max_size
+    for i in range(2):
+        sizer.observe(20, 0.8)
+    assert sizer.size == 20  # close to the target: stay
+    for i in range(2):
+        sizer.observe(20, 2.0)
+    assert sizer.size == 10
+    sizer.observe(10, 0.1, ok=False)  # a failed chunk shrinks the size at once
+    assert sizer.metrics()[C.CHUNK_SIZE] == 5
+    assert (sizer.metrics()[C.CHUNK_GROWN], sizer.metrics()[C.CHUNK_SHRUNK]) == (2, 2)
+
+
+def test_adaptive_bulk_requests_follow_the_sizer(stub, zap, tmpdir):
+    name = C.API_ROUTER_DEVICE_ENDPOINT + '/' + C.API_METHOD_SET_INFO
+    sizer = zap.chunk_sizer(name)
+    sizer.size, sizer.window, sizer.target_p95 = 1, 1, 60.0
+    uids = sorted(stub.devices)
+    outcomes = zap.set_device_info_bulk([(uid, {'comments': 'x'}) for uid in uids], batch_size=None, workers=1)
+    assert all(outcome[C.API_SUCCESS] for outcome in outcomes.values()) and len(outcomes) == len(uids)
+    assert zap.chunk_metrics()[name][C.CHUNK_SIZE] > 1
+
+    stub.errors[C.API_METHOD_SET_INFO] = 503
+    size = sizer.size
+    zap.set_device_info_bulk([(uid, {'comments': 'y'}) for uid in uids], batch_size=None, workers=1)
+    assert sizer.size < size
+
+    path = str(tmpdir.join('sizes.json'))
+    zap.save_chunk_sizes(path)
+    other = stub.api()
+    other.load_chunk_sizes(path)
+    assert other.chunk_sizer(name).size == sizer.size
+
+
+def test_adaptive_oid_pages_grow_while_fast(stub, zap):
+    uid = C.API_ENDPOINT + C.API_MIBS + '/mibs/STUB-MIB'
+    stub.add_fake_mib(uid, mappings=100)
+    sizer = zap.chunk_sizer(C.API_ROUTER_MIB_ENDPOINT + '/' + C.API_METHOD_GET_OID_MAPPINGS)
+    sizer.size, sizer.window, sizer.target_p95 = 10, 1, 60.0
+    assert [r[C.API_ID] for r in zap.iter_oid_mappings(uid, limit=None)] == [r[C.API_ID] for r in stub.mibs[uid]]
+    limits = [c[2][C.API_LIMIT] for c in stub.calls if c[1] == C.API_METHOD_GET_OID_MAPPINGS]
+    assert limits[:3] == [10, 15, 22]
@@ -0,0 +1,38 @@
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_api import ZenossAPI
+except ImportError:
+    from CONSTS import C
+    from zenoss_api import ZenossAPI
+
+
+def test_fingerprint_ignores_key_order_and_whitespace():
+    assert ZenossAPI.fingerprint({'a': 1, 'b': [1, 2]}) == ZenossAPI.fingerprint({'b': [1, 2], 'a': 1})
+    assert ZenossAPI.fingerprint({'a': 1}) != ZenossAPI.fingerprint({'a': 2})
+
+
+def test_get_if_changed_only_transforms_a_changed_response(stub, zap):
+    transformed = []
+
+    def names(results):
+        transformed.append(results)
+        return sorted(d[C.API_NAME] for d in results[C.API_RESULT][C.API_DEVICES_KEY])
+
+    changed, value = zap.get_if_changed(zap.get_devices, C.API_DEVICES_SERVER_LINUX, transform=names)
+    assert changed and len(value) == 5
+    # Same response, new tid: the previous value comes back without running the transform.
+    assert zap.get_if_changed(zap.get_devices, C.API_DEVICES_SERVER_LINUX, transform=names) == (False, value)
+    assert len(transformed) == 1
+    assert len([c for c in stub.calls if c[1] == C.API_METHOD_GET_DEVICES]) == 2  # the request is still made
+
+    stub.add_fake_device(C.API_DEVICES_SERVER_LINUX + '/devices/new.example.com')
+    changed, value = zap.get_if_changed(zap.get_devices, C.API_DEVICES_SERVER_LINUX, transform=names)
+    assert changed and 'new.example.com' in value and len(transformed) == 2
+
+
+def test_get_if_changed_keys_on_the_arguments(stub, zap):
+    assert zap.get_if_changed(zap.get_devices, C.API_DEVICES_SERVER_LINUX)[0]
+    assert zap.get_if_changed(zap.get_devices, C.API_DEVICES_SERVER_LINUX, limit=2)[0]
+    assert not zap.get_if_changed(zap.get_devices, C.API_DEVICES_SERVER_LINUX, limit=2)[0]
+    zap.forget_fingerprints()
+    assert zap.get_if_changed(zap.get_devices, C.API_DEVICES_SERVER_LINUX, limit=2)[0]
@@ -0,0 +1,51 @@
+import requests
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_jobs import JobTracker
+except ImportError:
+    from CONSTS import C
+    from zenoss_jobs import JobTracker
+
+
+def test_add_devices_records_a_transport_error_as_the_chunks_outcome(stub, zap):
+    stub.handlers[C.API_METHOD_ADD_DEVICE] = lambda data: {
+        C.API_SUCCESS: True, C.API_NEW_JOBS: [{C.API_UUID: 'job-' + data[C.API_DEVICE_NAME]}]}
+    api_batch_request = zap.api_batch_request
+
+    def flaky(endpoint, action, method, data_list, **kwargs):
+        if any(data[C.API_DEVICE_NAME] == 'bad' for data in data_list):
+            raise requests.exceptions.ConnectionError('Connection reset by peer')
+        return api_batch_request(endpoint, action, method, data_list, **kwargs)
+
+    zap.api_batch_request = flaky
+    tracker = JobTracker(zap, batch_size=2, workers=2)
+    outcomes = tracker.add_devices(['a', 'b', 'bad', 'c', 'd', 'e'], C.API_DEVICE_CLASS_SERVER_LINUX)
+    assert sorted(outcomes) == ['a', 'b', 'bad', 'c', 'd', 'e']
+    assert [h for h, o in sorted(outcomes.items()) if not o[C.API_SUCCESS]] == ['bad', 'c']
+    assert outcomes['bad'][C.API_MSG] == 'Connection reset by peer'
+    assert outcomes['a'][C.API_NEW_JOBS] == ['job-a']
+    assert sorted(tracker.jobs) == ['job-a', 'job-b', 'job-d', 'job-e']
+
+
+def test_only_jobs_zenoss_cannot_find_count_as_finished(stub, zap):
+    tracker = JobTracker(zap, initial_delay=0, max_delay=0)
+    gone, flaky = tracker.track(['gone-job', zap.new_jobs(zap.add_device('host1', C.API_DEVICE_CLASS_SERVER_LINUX))[0]])
+    get_job_info = stub.get_job_info
+    failures = [1]
+
+    def fail_once(data):
+        if data.get(C.API_JOB_ID) == flaky and failures:
+            failures.pop()
+            return {C.API_SUCCESS: False, C.API_MSG: 'Unauthorized'}
+        return get_job_info(data)
+
+    stub.handlers[(C.API_ACTION_JOBS_ROUTER, C.API_METHOD_GET_INFO)] = fail_once
+    infos = tracker.poll()
+    assert infos[gone][C.API_STATUS] is None
+    assert flaky not in infos
+    assert tracker.pending() == [flaky]
+
+    done, not_done = tracker.wait_all(timeout=5)
+    assert not not_done
+    assert done[flaky][C.API_STATUS] == C.API_JOB_STATUS_SUCCESS
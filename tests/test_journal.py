@@ -0,0 +1,51 @@
+import json
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_journal import Journal
+except ImportError:
+    from CONSTS import C
+    from zenoss_journal import Journal
+
+
+def _set_info_uids(stub):
+    return [c[2][C.API_UID] for c in stub.calls if c[1] == C.API_METHOD_SET_INFO]
+
+
+def test_rerun_resumes_after_a_torn_last_line(stub, zap, tmpdir):
+    path = str(tmpdir.join('maintenance.journal'))
+    uids = sorted(stub.devices)
+    with Journal(path, job='maintenance') as journal:
+        zap.set_production_levels(uids[:2], 300, journal=journal)
+    # The crash cut the third item short.
+    with open(path, 'a') as fout:
+        fout.write('{"job":"maintenance","key":"%s","ui' % uids[2])
+    del stub.calls[:]
+
+    with Journal(path, job='maintenance') as journal:
+        assert len(journal) == 2 and journal.pending(uids) == uids[2:]
+        assert journal.uid(uids[0]) == uids[0]
+        outcomes = zap.set_production_levels(uids, 300, journal=journal)
+    assert sorted(_set_info_uids(stub)) == uids[2:]
+    assert [outcomes[uid][C.API_MSG] for uid in uids[:2]] == [C.JOURNAL_SKIPPED] * 2
+    assert all(outcome[C.API_SUCCESS] for outcome in outcomes.values())
+
+    # The items written after the torn line start on a line of their own.
+    with open(path) as fin:
+        lines = fin.read().splitlines()
+    assert len(lines) == 6 and [json.loads(line)[C.JOURNAL_KEY] for line in lines[3:]]
+    assert Journal(path, job='maintenance').pending(uids) == []
+
+
+def test_jobs_share_a_file_and_failures_are_not_recorded(stub, zap, tmpdir):
+    path = str(tmpdir.join('shared.journal'))
+    uids = sorted(stub.devices)
+    with Journal(path, job='comments') as journal:
+        outcomes = zap.set_device_info_bulk([(uids[0], {'comments': 'x'}), ('/zport/dmd/Devices/nothing', {})],
+                                            journal=journal)
+    assert not outcomes['/zport/dmd/Devices/nothing'][C.API_SUCCESS]
+    with Journal(path, job='maintenance') as journal:
+        assert len(journal) == 0
+        journal.record('other')
+    assert Journal(path, job='comments').pending(uids[:1] + ['/zport/dmd/Devices/nothing']) == \
+        ['/zport/dmd/Devices/nothing']
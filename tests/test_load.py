@@ -0,0 +1,26 @@
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_load import LoadGenerator
+except ImportError:
+    from CONSTS import C
+    from zenoss_load import LoadGenerator
+
+
+def test_single_flight_is_set_on_the_generators_own_client(stub):
+    zap = stub.api(single_flight=True)
+    seen = []
+    get_info = stub.handlers[C.API_METHOD_GET_INFO]
+
+    def handler(data):
+        # Runs while the generator is running.
+        seen.append(zap.single_flight)
+        return get_info(data)
+
+    stub.handlers[C.API_METHOD_GET_INFO] = handler
+    generator = LoadGenerator(zap, mix={'get_device_info': 1}, workers=2, single_flight=False, seed=1)
+    report = generator.run(requests=10)
+    assert report[C.LOAD_COUNT] == 10
+    assert seen and set(seen) == set([True])
+    assert generator.client is not zap and generator.client.single_flight is False
+    assert generator.client.byte_counters()[C.BYTES_REQUESTS] == 10
+    assert zap.single_flight is True
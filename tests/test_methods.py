@@ -0,0 +1,56 @@
+import json
+import inspect
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_api import ZenossAPI
+except ImportError:
+    from CONSTS import C
+    from zenoss_api import ZenossAPI
+
+
+def test_generated_methods_have_real_signatures():
+    assert str(inspect.signature(ZenossAPI.get_tree)) == '(api, zid, validate_success=False)'
+    assert str(inspect.signature(ZenossAPI.get_tree_async)) == '(api, zid, validate_success=False)'
+    assert str(inspect.signature(ZenossAPI.set_device_info)) == '(api, validate_success=False, **kwargs)'
+    assert list(inspect.signature(ZenossAPI.get_tree_batch).parameters) == ['api', 'calls', 'batch_size', 'workers']
+
+
+def test_generated_methods_are_named_and_documented():
+    for name in ZenossAPI.router_methods:
+        for suffix in ('', '_async', '_batch', '_payload'):
+            func = getattr(ZenossAPI, name + suffix)
+            assert func.__name__ == name + suffix
+            assert func.__doc__.startswith(name + suffix + '(')
+    assert ':param zid: ' in ZenossAPI.get_tree.__doc__
+    assert ':param calls: ' in ZenossAPI.get_tree_batch.__doc__
+
+
+def test_signature_binds_like_the_call(stub, zap):
+    bound = inspect.signature(ZenossAPI.get_devices).bind(zap, uid='/zport/dmd/Devices', limit=2)
+    results = ZenossAPI.get_devices(*bound.args, **bound.kwargs)
+    assert len(results['result']['devices']) == 2
+
+
+def test_payload_builders_build_what_the_call_sends(stub, zap):
+    assert str(inspect.signature(ZenossAPI.remove_devices_payload)) == \
+        '(api, uids, uid, hash_check=1, action=\'delete\', delete_events=True)'
+    zap.remove_devices(['/zport/dmd/Devices/Server/Linux/devices/host1'], '/zport/dmd/Devices')
+    assert stub.calls[-1][2] == zap.remove_devices_payload(['/zport/dmd/Devices/Server/Linux/devices/host1'],
+                                                           '/zport/dmd/Devices')
+
+
+def test_precompiled_payloads_encode_the_same_envelope(zap):
+    precompiled = C.PRECOMPILED_PAYLOADS
+    envelopes = []
+    try:
+        for setting in (False, True):
+            C.PRECOMPILED_PAYLOADS = setting
+            payload = zap.add_device_payload('host1', C.API_DEVICE_CLASS_SERVER_LINUX, title='one')
+            envelopes.append(json.loads(zap._encode_envelope(C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_ADD_DEVICE,
+                                                             [payload], 7).decode('utf-8')))
+    finally:
+        C.PRECOMPILED_PAYLOADS = precompiled
+    assert envelopes[0] == envelopes[1]
+    assert envelopes[1][C.API_DATA][0][C.API_TITLE] == 'one'
+    assert envelopes[1][C.API_DATA][0][C.API_COLLECTOR] == C.API_KEYWORD_DEFAULTS[C.API_COLLECTOR]
@@ -0,0 +1,46 @@
+try:
+    from zenoss5_api.CONSTS import C
+except ImportError:
+    from CONSTS import C
+
+MIB_UID = C.API_ENDPOINT + C.API_MIBS + '/mibs/STUB-MIB'
+
+
+def test_import_oid_mappings_adds_only_what_is_missing(stub, zap):
+    stub.add_fake_mib(MIB_UID, mappings=3)
+    existing = stub.mibs[MIB_UID][0]
+    table = '\n'.join([
+        '# name oid [nodetype]',
+        '%s .%s' % (existing[C.API_ID], existing[C.API_OID]),  # already there
+        '%s 1.3.6.1.4.1.99999.42' % stub.mibs[MIB_UID][1][C.API_ID],  # there, with another oid
+        'ifSpeed, 1.3.6.1.2.1.2.2.1.5, column',
+        '',
+        'sysUpTime 1.3.6.1.2.1.1.3',
+        'sysUpTime 1.3.6.1.2.1.1.3  # listed twice',
+    ])
+    report = zap.import_oid_mappings(MIB_UID, table, batch_size=2, workers=2)
+
+    assert sorted(report[C.OID_IMPORT_CREATED]) == ['ifSpeed', 'sysUpTime']
+    assert report[C.OID_IMPORT_SKIPPED] == [existing[C.API_ID], 'sysUpTime']  # the second sysUpTime
+    assert list(report[C.OID_IMPORT_FAILED]) == [stub.mibs[MIB_UID][1][C.API_ID]]
+    assert report[C.OID_IMPORT_RATE] > 0
+    added = dict((m[C.API_ID], m) for m in stub.mibs[MIB_UID][3:])
+    assert sorted(added) == ['ifSpeed', 'sysUpTime']
+    assert (added['ifSpeed'][C.API_OID], added['ifSpeed'][C.API_NODE_TYPE]) == ('1.3.6.1.2.1.2.2.1.5', 'column')
+    assert added['sysUpTime'][C.API_NODE_TYPE] == C.API_KEYWORD_DEFAULTS[C.API_NODE_TYPE]
+
+
+def test_import_oid_mappings_reports_calls_zenoss_refused(stub, zap):
+    stub.add_fake_mib(MIB_UID, mappings=0)
+    add_oid_mapping = stub.handlers[C.API_METHOD_ADD_OID_MAPPING]
+    stub.handlers[C.API_METHOD_ADD_OID_MAPPING] = lambda data: {C.API_SUCCESS: False, C.API_MSG: 'Bad oid'} \
+        if data[C.API_ID] == 'bad' else add_oid_mapping(data)
+    report = zap.import_oid_mappings(MIB_UID, [('good', '1.3.6.1.2.1.1.1'), ('bad', 'x.y')])
+    assert report[C.OID_IMPORT_CREATED] == ['good']
+    assert report[C.OID_IMPORT_FAILED] == {'bad': 'Bad oid'}
+
+
+def test_iter_oid_mappings_reads_every_page(stub, zap):
+    stub.add_fake_mib(MIB_UID, mappings=250)
+    assert len(list(zap.iter_oid_mappings(MIB_UID, limit=100))) == 250
+    assert [c[2][C.API_START] for c in stub.calls if c[1] == C.API_METHOD_GET_OID_MAPPINGS] == [0, 100, 200]
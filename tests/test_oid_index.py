@@ -0,0 +1,70 @@
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_oid_index import OidIndex
+except ImportError:
+    from CONSTS import C
+    from zenoss_oid_index import OidIndex
+
+MIB_UID = C.API_ENDPOINT + C.API_MIBS + '/mibs/IF-MIB'
+
+
+def _mapping(name, oid):
+    return {C.API_UID: '%s/nodes/%s' % (MIB_UID, name), C.API_ID: name, C.API_OID: oid, C.API_NODE_TYPE: 'column'}
+
+
+def _if_mib(stub):
+    stub.mibs[MIB_UID] = [_mapping('ifTable', '1.3.6.1.2.1.2.2'), _mapping('ifInOctets', '1.3.6.1.2.1.2.2.1.10'),
+                          _mapping('ifOutOctets', '1.3.6.1.2.1.2.2.1.16'), _mapping('sysUpTime', '1.3.6.1.2.1.1.3')]
+    return stub.mibs[MIB_UID]
+
+
+def test_lookup_and_longest_prefix(stub, zap):
+    _if_mib(stub)
+    index = OidIndex([MIB_UID]).build(zap, limit=2)
+    assert len(index) == 4
+    assert index.lookup('.1.3.6.1.2.1.1.3')[C.API_ID] == 'sysUpTime'
+    assert index.lookup('1.3.6.1.2.1.2.2.1') is None  # an inner node, not a mapping
+    assert index.resolve('1.3.6.1.2.1.2.2.1.10.5') == 'ifInOctets.5'
+    assert index.resolve('1.3.6.1.2.1.2.2.1.16') == 'ifOutOctets'
+    assert index.resolve('1.3.6.1.2.1.2.2.1.99.1') == 'ifTable.1.99.1'  # falls back to the shorter prefix
+    assert index.resolve('1.3.6.1.4.1.1') == '1.3.6.1.4.1.1'
+    assert [oid for oid, record in index.subtree('1.3.6.1.2.1.2')] == \
+        ['1.3.6.1.2.1.2.2', '1.3.6.1.2.1.2.2.1.10', '1.3.6.1.2.1.2.2.1.16']
+
+
+def test_remove_prunes_only_empty_branches(stub, zap):
+    _if_mib(stub)
+    index = OidIndex([MIB_UID]).build(zap)
+    assert index.remove('1.3.6.1.2.1.2.2.1.10')
+    assert index.resolve('1.3.6.1.2.1.2.2.1.10.5') == 'ifTable.1.10.5'
+    assert index.lookup('1.3.6.1.2.1.2.2.1.16')[C.API_ID] == 'ifOutOctets'
+    assert not index.remove('1.3.6.1.2.1.9')
+    assert index.remove('1.3.6.1.2.1.1.3')
+    mib2 = index.root
+    for component in (1, 3, 6, 1, 2, 1):
+        mib2 = mib2[1][component]
+    assert sorted(mib2[1]) == [2]  # '1.3.6.1.2.1.1' led only to sysUpTime
+
+
+def test_refresh_touches_only_what_changed(stub, zap):
+    mappings = _if_mib(stub)
+    index = OidIndex([MIB_UID]).build(zap)
+    mappings[1] = dict(mappings[1], **{C.API_NODE_TYPE: 'scalar'})
+    del mappings[3]
+    mappings.append(_mapping('ifSpeed', '1.3.6.1.2.1.2.2.1.5'))
+    assert index.refresh(zap) == {C.DIFF_ADDED: 1, C.DIFF_MODIFIED: 1, C.DIFF_REMOVED: 1}
+    assert index.lookup('1.3.6.1.2.1.2.2.1.10')[C.API_NODE_TYPE] == 'scalar'
+    assert index.lookup('1.3.6.1.2.1.1.3') is None
+    assert index.resolve('1.3.6.1.2.1.2.2.1.5.2') == 'ifSpeed.2'
+    assert index.refresh(zap) == {C.DIFF_ADDED: 0, C.DIFF_MODIFIED: 0, C.DIFF_REMOVED: 0}
+
+
+def test_save_and_load_round_trip(stub, zap, tmpdir):
+    _if_mib(stub)
+    index = OidIndex([MIB_UID]).build(zap)
+    path = str(tmpdir.join('oids.json'))
+    index.save(path)
+    loaded = OidIndex.load(path)
+    assert loaded.mib_uids == [MIB_UID]
+    assert list(loaded.subtree()) == list(index.subtree())
+    assert loaded.fingerprints == index.fingerprints
@@ -0,0 +1,54 @@
+import pytest
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_paths import PathIndex, PathMatcher
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+    from zenoss_paths import PathIndex, PathMatcher
+
+TEMPLATE_UID = C.API_DEVICES_SERVER_LINUX + C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/Uptime'
+
+
+def _records(*uids):
+    return [{C.API_UID: uid} for uid in uids]
+
+
+def test_matcher_checks_components_from_either_end():
+    matcher = PathMatcher({1: '__eq__', -2: '__eq__', -1: 'startswith'}, {1: 'zport', -2: 'datasources', -1: 'Up'})
+    assert matcher.match(TEMPLATE_UID + '/datasources/Uptime_datasources')
+    assert not matcher.match(TEMPLATE_UID + '/thresholds/Uptime_thresholds')
+    assert not matcher.match('/zport')  # too short for the checks, rather than an IndexError
+    odd = PathMatcher({-1: lambda part, value: int(part) % value == 1}, {-1: 2})
+    assert [odd.match('/a/%d' % i) for i in range(4)] == [False, True, False, True]
+
+
+def test_filter_keeps_data_order_and_first_raises_when_nothing_matches():
+    data = _records('/a/x/1', '/b/y/2', '/a/y/3') + [{C.API_ID: 'no uid'}]
+    matcher = PathMatcher({1: '__eq__'}, {1: 'a'})
+    assert matcher.filter(data) == ['/a/x/1', '/a/y/3']
+    assert matcher.filter(data, records=True) == [data[0], data[2]]
+    assert matcher.first(data) == '/a/x/1'
+    with pytest.raises(ZenossError):
+        PathMatcher({1: '__eq__'}, {1: 'c'}).first(data)
+    assert PathMatcher({0: '__eq__'}, {0: 'Device'}, key=C.API_ID).filter([{C.API_ID: 'Device'}]) == ['Device']
+
+
+def test_index_answers_the_same_as_a_scan(stub, zap):
+    for name in ('Uptime', 'Load', 'Memory'):
+        zap.add_new_snmp_monitor(name, C.API_DEVICES_SERVER_LINUX, oid='1.3.6.1.4.1.2021.10.1.3.1')
+    data = [dict(o) for o in stub.template_objects.values()]
+    index = PathIndex(data)
+    queries = [({-2: '__eq__'}, {-2: C.API_PATH_PART_DATA_SOURCES}),
+               ({-2: '__eq__', -1: 'startswith'}, {-2: C.API_PATH_PART_THRESHOLDS, -1: 'Lo'}),
+               ({-3: '__eq__', -1: '__eq__'}, {-3: 'Memory_datasources', -1: 'Memory_datasources'}),
+               ({-1: 'endswith'}, {-1: '_graphDefs'}),
+               ({-2: '__eq__'}, {-2: 'nothing'})]
+    for checks, values in queries:
+        matcher = PathMatcher(checks, values)
+        assert index.filter(matcher) == matcher.filter(data)
+    assert len(index.query({-2: '__eq__'}, {-2: C.API_PATH_PART_DATA_SOURCES})) == 3
+    assert index.query({-3: '__eq__', -1: '__eq__'}, {-3: 'Memory_datasources', -1: 'Memory_datasources'},
+                       records=True)[0][C.API_NAME] == 'Memory_datasources'
@@ -0,0 +1,68 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from zenoss5_api.CONSTS import C
+except ImportError:
+    from CONSTS import C
+
+
+def _hold_reads(zap):
+    # Every getInfo response waits until released before it reaches the client, so reads can be lined up behind
+    # one in flight. Stub handlers run one at a time, so the wait can't be in a handler.
+    started, release = threading.Event(), threading.Event()
+    post = zap._post
+
+    def held(uri, body, headers):
+        r = post(uri, body, headers)
+        if C.API_METHOD_GET_INFO.encode('utf-8') in body:
+            started.set()
+            release.wait(5)
+        return r
+
+    zap._post = held
+    return started, release
+
+
+def _get_info_calls(stub):
+    return [c for c in stub.calls if c[1] == C.API_METHOD_GET_INFO]
+
+
+def _wait_for_reads(zap, count):
+    deadline = time.time() + 5
+    while zap.single_flight_metrics()[C.FLIGHT_CALLS] < count and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_concurrent_identical_reads_share_one_request(stub):
+    zap = stub.api(single_flight=True)
+    uid = sorted(stub.devices)[0]
+    started, release = _hold_reads(zap)
+    pool = ThreadPoolExecutor(max_workers=2)
+    first = pool.submit(zap.get_device_info, uid)
+    assert started.wait(5)
+    second = pool.submit(zap.get_device_info, uid)
+    _wait_for_reads(zap, 2)
+    release.set()
+    assert first.result() == second.result()
+    assert len(_get_info_calls(stub)) == 1
+    pool.shutdown()
+
+
+def test_a_read_after_a_write_does_not_join_a_read_from_before_it(stub):
+    zap = stub.api(single_flight=True)
+    uid = sorted(stub.devices)[0]
+    started, release = _hold_reads(zap)
+    pool = ThreadPoolExecutor(max_workers=2)
+    before = pool.submit(zap.get_device_info, uid)
+    assert started.wait(5)
+    zap.set_device_info(uid=uid, comments='changed')
+    after = pool.submit(zap.get_device_info, uid)
+    _wait_for_reads(zap, 2)
+    release.set()
+    assert after.result()[C.API_RESULT][C.API_DATA]['comments'] == 'changed'
+    assert before.result()
+    assert len(_get_info_calls(stub)) == 2
+    assert zap.single_flight_metrics()[C.FLIGHT_SHARED] == 0
+    pool.shutdown()
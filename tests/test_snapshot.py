@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_snapshot import SnapshotStore, ZenossSnapshotAPI, build_snapshot
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+    from zenoss_snapshot import SnapshotStore, ZenossSnapshotAPI, build_snapshot
+
+
+@pytest.fixture
+def snapshot(stub, zap, tmp_path):
+    path = str(tmp_path / 'devices.snap')
+    build_snapshot(zap, path, page_size=2, workers=2, templates=False).close()
+    return path
+
+
+def test_store_cache_is_bounded(stub, snapshot):
+    with SnapshotStore(snapshot, cache_size=2) as store:
+        for uid in sorted(stub.devices):
+            assert store.device(uid)[C.EXPORT_LISTING][C.API_UID] == uid
+        assert list(store._cache) == sorted(stub.devices)[-2:]
+        store.device(sorted(stub.devices)[-2])
+        assert list(store._cache) == [sorted(stub.devices)[-1], sorted(stub.devices)[-2]]
+
+
+def test_get_devices_only_decodes_the_page(stub, snapshot):
+    store = SnapshotStore(snapshot, cache_size=0)
+    decoded = []
+    read_blob = store._read_blob
+
+    def counting(offset, length):
+        decoded.append(offset)
+        return read_blob(offset, length)
+
+    store._read_blob = counting
+    api = ZenossSnapshotAPI(store)
+    results = api.get_devices(start=1, limit=2, sort=C.API_NAME, direction='DESC',
+                              params={C.API_PRODUCTION_STATE: [1000]})
+    names = sorted((d[C.API_NAME] for d in stub.devices.values()), reverse=True)
+    assert [d[C.API_NAME] for d in results[C.API_RESULT][C.API_DEVICES_KEY]] == names[1:3]
+    assert results[C.API_RESULT][C.API_TOTAL_COUNT] == 5
+    assert len(decoded) == 2
+    store.close()
+
+
+def test_build_snapshot_removes_the_partial_file_on_error(stub, zap, tmp_path):
+    def fail(uid, validate_success=False):
+        raise ZenossError('getBoundTemplates failed for %s' % uid)
+
+    zap.get_bound_templates = fail
+    path = str(tmp_path / 'devices.snap')
+    with pytest.raises(ZenossError):
+        build_snapshot(zap, path, page_size=2, workers=2)
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,48 @@
+import pytest
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+TEMPLATE_UID = C.API_DEVICES_SERVER_LINUX + C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/Interfaces'
+OIDS = [('ifInOctets', '1.3.6.1.2.1.2.2.1.10.1'), ('ifOutOctets', '1.3.6.1.2.1.2.2.1.16.1'),
+        ('ifSpeed', '1.3.6.1.2.1.2.2.1.5.1')]
+
+
+def test_matrix_builds_one_template_for_every_oid(stub, zap):
+    thresholds = {'traffic': {C.API_DATA_POINTS: ['ifInOctets', 'ifOutOctets'], C.API_MAX_VAL: 1000}}
+    zap.add_snmp_monitor_matrix('Interfaces', C.API_DEVICES_SERVER_LINUX, OIDS, thresholds=thresholds,
+                                graph_units='bytes')
+    for name, oid in OIDS:
+        assert stub.template_objects['%s/datasources/%s' % (TEMPLATE_UID, name)][C.API_OID] == oid
+    threshold = stub.template_objects[TEMPLATE_UID + '/thresholds/traffic']
+    assert threshold[C.API_MAX_VAL] == 1000 and C.API_MIN_VAL not in threshold
+    graph = TEMPLATE_UID + '/graphDefs/Interfaces_graphDefs'
+    assert stub.template_objects[graph]['units'] == 'bytes'
+    points = sorted(uid.rsplit('/', 1)[-1] for uid in stub.template_objects if uid.startswith(graph + '/'))
+    assert points == ['ifInOctets', 'ifOutOctets', 'ifSpeed', 'traffic']  # the threshold existed before its points
+    assert 'Interfaces' in stub.bound_templates[C.API_DEVICES_SERVER_LINUX]
+    methods = [method for action, method, data in stub.calls]
+    assert methods.count(C.API_METHOD_ADD_TEMPLATE) == 1
+    assert C.API_METHOD_GET_DATA_SOURCES not in methods  # uids are built, not listed back
+
+
+def test_matrix_leaves_an_existing_template_alone(stub, zap):
+    zap.add_snmp_monitor_matrix('Interfaces', C.API_DEVICES_SERVER_LINUX, OIDS[:1])
+    del stub.calls[:]
+    assert zap.add_snmp_monitor_matrix('Interfaces', C.API_DEVICES_SERVER_LINUX, OIDS) is True
+    assert [method for action, method, data in stub.calls] == [C.API_METHOD_GET_TEMPLATES]
+    assert TEMPLATE_UID + '/datasources/ifSpeed' not in stub.template_objects
+
+
+def test_matrix_deletes_the_template_when_a_step_fails(stub, zap):
+    set_info = stub.handlers[(C.API_ACTION_TEMPLATE_ROUTER, C.API_METHOD_SET_INFO)]
+    stub.handlers[(C.API_ACTION_TEMPLATE_ROUTER, C.API_METHOD_SET_INFO)] = lambda data: \
+        {C.API_SUCCESS: False, C.API_MSG: 'Invalid OID'} if data.get(C.API_OID) == OIDS[2][1] else set_info(data)
+    with pytest.raises(ZenossError):
+        zap.add_snmp_monitor_matrix('Interfaces', C.API_DEVICES_SERVER_LINUX, OIDS)
+    assert not [uid for uid in stub.template_objects if uid.startswith(TEMPLATE_UID)]
+    assert 'Interfaces' not in stub.bound_templates.get(C.API_DEVICES_SERVER_LINUX, [])
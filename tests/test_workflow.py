@@ -0,0 +1,50 @@
+import pytest
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_workflow import Ref, Workflow
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+    from zenoss_workflow import Ref, Workflow
+
+TEMPLATE_UID = C.API_DEVICES_SERVER_LINUX + C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/Uptime'
+
+
+def test_workflow_runs_dependencies_first_and_compensates_in_reverse():
+    calls, undone = [], []
+    wf = Workflow(workers=4)
+    wf.add('a', lambda: calls.append('a') or 1, step={'compensate': undone.append})
+    wf.add('b', lambda a: calls.append('b') or a + 1, Ref('a'), step={'compensate': undone.append})
+
+    def fail(b):
+        raise ZenossError('boom')
+
+    wf.add('c', fail, Ref('b'))
+    with pytest.raises(ZenossError):
+        wf.run()
+    assert calls == ['a', 'b']
+    assert undone == [2, 1]
+    assert set(wf.timings) == set(['a', 'b', 'c'])
+
+
+def test_add_new_snmp_monitor_builds_and_binds_the_template(stub, zap):
+    zap.add_new_snmp_monitor('Uptime', C.API_DEVICES_SERVER_LINUX, oid='1.3.6.1.2.1.1.3.0', threshold_max=10)
+    ds = stub.template_objects[TEMPLATE_UID + '/datasources/Uptime_datasources']
+    assert ds[C.API_OID] == '1.3.6.1.2.1.1.3.0'
+    assert stub.template_objects[TEMPLATE_UID + '/thresholds/Uptime_thresholds'][C.API_MAX_VAL] == 10
+    assert TEMPLATE_UID + '/graphDefs/Uptime_graphDefs/graphPoints/Uptime_datasources' in stub.template_objects
+    assert 'Uptime' in stub.bound_templates[C.API_DEVICES_SERVER_LINUX]
+
+
+def test_add_new_snmp_monitor_deletes_the_template_when_binding_fails(stub, zap):
+    def fail(uid, template_ids):
+        raise ZenossError('setBoundTemplates failed')
+
+    zap.set_bound_templates = fail
+    with pytest.raises(ZenossError):
+        zap.add_new_snmp_monitor('Uptime', C.API_DEVICES_SERVER_LINUX, oid='1.3.6.1.2.1.1.3.0')
+    assert not [uid for uid in stub.template_objects if uid.startswith(TEMPLATE_UID)]
+    methods = [method for action, method, data in stub.calls]
+    assert methods[-1] == C.API_METHOD_DELETE_TEMPLATE
@@ -0,0 +1,66 @@
+import pytest
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+TEMPLATE_UID = C.API_DEVICES_SERVER_LINUX + C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/Uptime'
+
+
+def _set_info_calls(stub):
+    return [c for c in stub.calls if c[1] == C.API_METHOD_SET_INFO]
+
+
+def test_writes_to_the_same_device_are_merged(stub, zap):
+    first, second = sorted(stub.devices)[:2]
+    with zap.write_behind(max_delay=60) as wb:
+        futures = [wb.set_device_info(first, comments='one', rackSlot='1'), wb.set_device_info(second, comments='b'),
+                   wb.set_device_info(first, comments='two')]
+        assert not _set_info_calls(stub)
+        assert wb.flush() == 2
+        assert [f.result(5)[C.API_RESULT][C.API_SUCCESS] for f in futures] == [True] * 3
+        assert wb.metrics() == {C.WRITE_BEHIND_WRITES: 3, C.WRITE_BEHIND_COALESCED: 1, C.WRITE_BEHIND_CALLS: 2,
+                                C.WRITE_BEHIND_PENDING: 0}
+    assert (stub.devices[first]['comments'], stub.devices[first]['rackSlot']) == ('two', '1')
+    assert [c[2][C.API_UID] for c in _set_info_calls(stub)] == [first, second]
+
+
+def test_binding_toggles_that_cancel_out_are_not_sent(stub, zap):
+    first, second = sorted(stub.devices)[:2]
+    with zap.write_behind(max_delay=60) as wb:
+        cancelled = [wb.bind_or_unbind_template(first, TEMPLATE_UID), wb.bind_or_unbind_template(first, TEMPLATE_UID)]
+        kept = [wb.bind_or_unbind_template(second, TEMPLATE_UID) for i in range(3)]
+    assert [f.result(5)[C.API_RESULT][C.API_MSG] for f in cancelled] == [C.WRITE_BEHIND_CANCELLED] * 2
+    assert all(f.result(5)[C.API_RESULT][C.API_SUCCESS] for f in kept)
+    calls = [c[2] for c in stub.calls if c[1] == C.API_METHOD_BIND_OR_UNBIND_TEMPLATE]
+    assert calls == [{C.API_UID: second, C.API_TEMPLATE_UID: TEMPLATE_UID}]
+    assert 'Uptime' not in stub.bound_templates[first] and 'Uptime' in stub.bound_templates[second]
+
+
+def test_failed_writes_fail_their_futures_only(stub, zap):
+    uid = sorted(stub.devices)[0]
+    with zap.write_behind(max_delay=60) as wb:
+        ok = wb.set_device_info(uid, comments='fine')
+        missing = wb.set_template_info(TEMPLATE_UID + '/datasources/nothing', oid='1.3.6')
+    assert ok.result(5)[C.API_RESULT][C.API_SUCCESS]
+    with pytest.raises(ZenossError):
+        missing.result(5)
+    with pytest.raises(ZenossError):
+        wb.set_device_info(uid, comments='too late')
+
+
+def test_max_size_and_max_delay_flush_without_being_asked(stub, zap):
+    uids = sorted(stub.devices)
+    wb = zap.write_behind(max_size=2, max_delay=60)
+    try:
+        wb.set_device_info(uids[0], comments='a')
+        full = wb.set_device_info(uids[1], comments='b')
+        assert full.done()  # flushed in the writing thread
+    finally:
+        wb.close()
+    with zap.write_behind(max_delay=0.05) as wb:
+        assert wb.set_device_info(uids[2], comments='c').result(5)[C.API_RESULT][C.API_SUCCESS]
+    assert [stub.devices[uid]['comments'] for uid in uids[:3]] == ['a', 'b', 'c']
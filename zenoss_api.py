@@ -1,26 +1,118 @@
+import copy
 import json
+import time
 import yaml
+import zlib
+import hashlib
 import socket
 import logging
 import requests
-from collections import Iterable
+import functools
+import threading
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 try:
     from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_workflow import Workflow
+    from zenoss5_api.zenoss_paths import PathMatcher
+    from zenoss5_api.zenoss_flow import CircuitBreaker, PriorityGate, ChunkSizer
+    from zenoss5_api.zenoss_write_behind import WriteBehind
+    from zenoss5_api.zenoss_methods import ROUTER_METHODS
 except ImportError:
     from CONSTS import C
-
-
-class ZenossError(Exception):
-    pass
+    from zenoss_base import ZenossError
+    from zenoss_workflow import Workflow
+    from zenoss_paths import PathMatcher
+    from zenoss_flow import CircuitBreaker, PriorityGate, ChunkSizer
+    from zenoss_write_behind import WriteBehind
+    from zenoss_methods import ROUTER_METHODS
+
+# requests (urllib3) only decodes 'br' responses when one of these is installed, so only ask for it then.
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
 
 
 class ZenossAPI(object):
-    def __init__(self, credentials, host=C.API_URI_HOST, ssl_verify=C.SSL_VERIFY):
+    # Shared by all instances; see _encode_envelope.
+    _envelope_prefixes = {}
+
+    # addDevice arguments with their defaults, built once (after zenoss_defaults.yaml was applied) instead of on every
+    # call. deviceName and deviceClass come first to keep the order Zenoss' own UI sends.
+    _add_device_keys = (C.API_COLLECTOR, C.API_MODEL, C.API_TITLE, C.API_PRODUCTION_STATE, C.API_PRIORITY,
+                        C.API_SNMP_COMMUNITY, C.API_SNMP_PORT, C.API_TAG, C.API_RACK_SLOT, C.API_SERIAL_NUMBER,
+                        C.API_HW_MANUFACTURER, C.API_HW_PRODUCT_NAME, C.API_OS_MANUFACTURER, C.API_OS_PRODUCT_NAME,
+                        C.API_COMMENTS)
+    _add_device_template = dict([(C.API_DEVICE_NAME, None), (C.API_DEVICE_CLASS, None)] +
+                                [(k, C.API_KEYWORD_DEFAULTS[k]) for k in _add_device_keys])
+
+    def __init__(self, credentials, host=C.API_URI_HOST, ssl_verify=C.SSL_VERIFY, compress_requests=C.COMPRESS_REQUESTS,
+                 max_in_flight=C.MAX_IN_FLIGHT, single_flight=C.SINGLE_FLIGHT):
+        """
+        :param credentials: See _credentials_check.
+        :param host: String, the Zenoss host name.
+        :param ssl_verify: Boolean
+        :param compress_requests: Boolean, gzip request bodies of at least C.COMPRESS_REQUESTS_MIN_BYTES. Only enable
+                                  it when the server (or a proxy in front of it) accepts 'Content-Encoding: gzip'.
+        :param max_in_flight: Int, requests this client sends at once, queued by priority beyond that (see
+                              PriorityGate). 0 for no limit.
+        :param single_flight: Boolean, identical reads (same router method and data) that overlap in time share one
+                              request. A read never joins one sent before a write through the same router started or
+                              finished. Can be changed later through the single_flight attribute.
+        """
         self.credentials = self._credentials_check(credentials)
         self.host = self._host_check(host)
-        self.tid = self._generate_transaction_id()
         self.ssl_verify = ssl_verify
+        self.compress_requests = compress_requests
+        self._init_state(max_in_flight, single_flight)
+
+    def _init_state(self, max_in_flight=C.MAX_IN_FLIGHT, single_flight=C.SINGLE_FLIGHT):
+        # Per-client runtime state, kept apart from __init__ so that subclasses that skip the credentials and host
+        # checks (e.g. zenoss_snapshot.ZenossSnapshotAPI) still get it.
+        self.tid = self._generate_transaction_id()
+        # Generators can't be advanced from two threads at once; the bulk functions share this object across workers.
+        self._tid_lock = threading.Lock()
+        self._fingerprints = {}
+        self._fingerprints_lock = threading.Lock()
+        self._bytes = dict.fromkeys([C.BYTES_REQUESTS, C.BYTES_SENT_WIRE, C.BYTES_SENT_DECODED, C.BYTES_RECEIVED_WIRE,
+                                     C.BYTES_RECEIVED_DECODED], 0)
+        self._bytes_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._gate = PriorityGate(max_in_flight)
+        self.single_flight = single_flight
+        self._flights = {}
+        self._write_generations = {}  # uri -> writes started plus writes finished
+        self._flight_counts = dict.fromkeys([C.FLIGHT_CALLS, C.FLIGHT_SHARED], 0)
+        self._flights_lock = threading.Lock()
+        self._sizers = {}
+        self._saved_sizes = {}
+        self._sizers_lock = threading.Lock()
+
+    def clone(self, max_in_flight=None, single_flight=None):
+        """
+        A client for the same host with the same credentials and settings, but its own runtime state: transaction
+        ids, byte counters, circuit breakers, in-flight cap and single-flight reads. Changing one client doesn't
+        affect the other.
+        :param max_in_flight: Int, default this client's.
+        :param single_flight: Boolean, default this client's.
+        :return: ZenossAPI, or the subclass this client is.
+        """
+        api = copy.copy(self)
+        api._init_state(self._gate.slots if max_in_flight is None else max_in_flight,
+                        self.single_flight if single_flight is None else single_flight)
+        return api
 
     def _host_check(self, host):
         try:
@@ -87,6 +179,47 @@ class ZenossAPI(object):
             raise ZenossError(C.ERROR_S_OBJECT_NO_ATTRIBUTE_S % (type(json_obj), C.API_RESULT))
         return None, None
 
+    @staticmethod
+    def fingerprint(obj):
+        """
+        :param obj: Any json-serializable object, e.g. an API response.
+        :return: String, a hash of the canonical (sorted keys, no whitespace) JSON of obj.
+        """
+        return hashlib.sha1(json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def get_if_changed(self, method, *args, **kwargs):
+        """
+        Call a read method and compare the response with the previous response to the same call.
+        e.g. changed, templates = zap.get_if_changed(zap.get_templates, C.API_ENDPOINT + C.API_DEVICES,
+                                                     transform=build_index)
+        :param method: A read method of this object, e.g. self.get_templates
+        :param args: Passed to method.
+        :param kwargs: Passed to method, except 'transform': a function of the response (e.g. parsing or indexing)
+                       that is only run when the response changed. Its previous output is returned otherwise.
+        :return: (changed, value). value is the transformed response, or the raw response without a transform.
+        """
+        transform = kwargs.pop('transform', None)
+        key = (getattr(method, '__name__', repr(method)),
+               json.dumps([args, kwargs], sort_keys=True, default=repr))
+
+        results = method(*args, **kwargs)
+        # The envelope's tid differs on every call; only the result is compared.
+        fp = self.fingerprint(results[C.API_RESULT] if isinstance(results, dict) and C.API_RESULT in results
+                              else results)
+        with self._fingerprints_lock:
+            previous = self._fingerprints.get(key)
+        if previous and previous[0] == fp:
+            return False, previous[1]
+
+        value = transform(results) if transform else results
+        with self._fingerprints_lock:
+            self._fingerprints[key] = (fp, value)
+        return True, value
+
+    def forget_fingerprints(self):
+        with self._fingerprints_lock:
+            self._fingerprints.clear()
+
     def _generate_transaction_id(self, start=0):
         # TODO: If zenoss accepts strings here & logs the values, we should make the TID include the hostname.
         # This will make changes trace-able.
@@ -95,8 +228,176 @@ class ZenossAPI(object):
             yield tid
             tid += 1
 
+    def _next_tid(self):
+        with self._tid_lock:
+            return next(self.tid)
+
+    def executor(self):
+        """
+        :return: ThreadPoolExecutor with C.BULK_WORKERS threads that the generated *_async methods run on. Created on
+                 first use and shared for the life of the client. From asyncio code, await
+                 asyncio.wrap_future(api.get_tree_async(...)).
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(1, C.BULK_WORKERS))
+            return self._executor
+
+    def _breaker(self, endpoint, method):
+        with self._breakers_lock:
+            breaker = self._breakers.get((endpoint, method))
+            if breaker is None:
+                breaker = self._breakers[(endpoint, method)] = CircuitBreaker((endpoint, method))
+            return breaker
+
+    def breaker_metrics(self):
+        """
+        :return: Dict of {(endpoint, method): {'state': 'closed'|'open'|'half_open', 'calls': Int, 'failures': Int,
+                 'rejected': Int, 'opened': Int, 'changed_at': epoch seconds}} for every method called so far.
+        """
+        with self._breakers_lock:
+            breakers = list(self._breakers.items())
+        return dict((name, breaker.metrics()) for name, breaker in breakers)
+
+    def reset_breakers(self):
+        with self._breakers_lock:
+            self._breakers = {}
+
+    def gate_metrics(self):
+        """
+        :return: Dict, {'slots': Int, 'in_flight': Int, 'waiting': {priority: Int}}. See PriorityGate.
+        """
+        return self._gate.metrics()
+
+    def _single_flight(self, key, func):
+        # The first caller for key runs func; callers arriving while it runs wait for and share its outcome.
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+            self._flight_counts[C.FLIGHT_CALLS] += 1
+            self._flight_counts[C.FLIGHT_SHARED] += int(not leader)
+        if not leader:
+            return flight.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.set_exception(e)
+            raise
+        with self._flights_lock:
+            del self._flights[key]
+        flight.set_result(result)
+        return result
+
+    def single_flight_metrics(self):
+        """
+        :return: Dict, {'calls': Int, 'shared': Int, 'dedupe_ratio': Float}. calls counts the reads that could be
+                 shared, shared the ones answered by a request another caller already had in flight.
+        """
+        with self._flights_lock:
+            metrics = dict(self._flight_counts)
+        metrics[C.FLIGHT_DEDUPE_RATIO] = float(metrics[C.FLIGHT_SHARED]) / metrics[C.FLIGHT_CALLS] \
+            if metrics[C.FLIGHT_CALLS] else 0.0
+        return metrics
+
+    def _send(self, endpoint, method, uri, body, headers, priority=None):
+        # _post behind the circuit breaker for (endpoint, method) and the in-flight cap. Reads default to the
+        # interactive priority, writes to the write priority; the bulk functions pass C.PRIORITY_BULK.
+        read = method.startswith(C.API_READ_METHOD_PREFIX)
+        if priority is None:
+            priority = C.PRIORITY_INTERACTIVE if read else C.PRIORITY_WRITE
+        if not read:
+            self._count_write(uri)
+        breaker = self._breaker(endpoint, method) if C.BREAKER_ENABLED else None
+        probe = breaker.before() if breaker else False
+
+        self._gate.acquire(priority)
+        start = time.time()
+        failed = True
+        try:
+            r = self._post(uri, body, headers)
+            # 4xx other than 429 is the caller's mistake, not a sign the router is struggling.
+            failed = r.status_code >= 500 or r.status_code == 429
+            return r
+        finally:
+            self._gate.release()
+            if breaker:
+                breaker.after(failed, time.time() - start, probe)
+            if not read:
+                self._count_write(uri)
+
+    def _count_write(self, uri):
+        # Called as a write to uri starts and again as it finishes, so single-flight reads issued on either side of
+        # either moment get different keys.
+        with self._flights_lock:
+            self._write_generations[uri] = self._write_generations.get(uri, 0) + 1
+
+    def byte_counters(self):
+        """
+        :return: Dict of request count and bytes sent/received, both as sent over the wire (after compression) and
+                 decoded, e.g. {'requests': 3, 'sent_wire': 410, 'sent_decoded': 410, 'received_wire': 5120,
+                 'received_decoded': 90112}
+        """
+        with self._bytes_lock:
+            return dict(self._bytes)
+
+    def reset_byte_counters(self):
+        with self._bytes_lock:
+            for k in self._bytes:
+                self._bytes[k] = 0
+
+    def _encode_envelope(self, action, method, data, tid):
+        # Only the data and tid differ between calls to the same router method, so the rest of the envelope is
+        # encoded once per (action, method) and the per-call parts are spliced in.
+        if not C.PRECOMPILED_PAYLOADS:
+            return json.dumps({C.API_ACTION: action, C.API_METHOD: method, C.API_DATA: data,
+                               C.API_TID: tid}).encode('utf-8')
+        prefix = self._envelope_prefixes.get((action, method))
+        if prefix is None:
+            prefix = ('{"%s":%s,"%s":%s,"%s":' % (C.API_ACTION, json.dumps(action), C.API_METHOD, json.dumps(method),
+                                                  C.API_DATA)).encode('utf-8')
+            self._envelope_prefixes[(action, method)] = prefix
+        return b''.join((prefix, json.dumps(data, separators=(',', ':')).encode('utf-8'),
+                         (',"%s":%d}' % (C.API_TID, tid)).encode('utf-8')))
+
+    def _post(self, uri, body, headers):
+        headers = dict(headers or {})
+        if C.ACCEPT_COMPRESSED:
+            encodings = [C.ENCODING_GZIP, C.ENCODING_DEFLATE] + ([C.ENCODING_BR] if brotli is not None else [])
+            headers.setdefault(C.HEADER_ACCEPT_ENCODING, ', '.join(encodings))
+        else:
+            # requests asks for gzip on its own unless told otherwise.
+            headers.setdefault(C.HEADER_ACCEPT_ENCODING, C.ENCODING_IDENTITY)
+
+        sent = body
+        if self.compress_requests and len(body) >= C.COMPRESS_REQUESTS_MIN_BYTES:
+            # wbits=31 writes a gzip header and trailer (zlib.compress alone would be a bare zlib stream).
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            sent = compressor.compress(body) + compressor.flush()
+            headers[C.HEADER_CONTENT_ENCODING] = C.ENCODING_GZIP
+
+        r = requests.post(uri, auth=self.credentials, data=sent, headers=headers, verify=bool(self.ssl_verify))
+
+        # r.content is already decoded. urllib3 counts the bytes it read off the socket; fall back to the header.
+        decoded = len(r.content)
+        tell = getattr(r.raw, 'tell', None)
+        wire = tell() if tell else 0
+        if not wire:
+            wire = int(r.headers.get(C.HEADER_CONTENT_LENGTH) or decoded)
+        with self._bytes_lock:
+            self._bytes[C.BYTES_REQUESTS] += 1
+            self._bytes[C.BYTES_SENT_WIRE] += len(sent)
+            self._bytes[C.BYTES_SENT_DECODED] += len(body)
+            self._bytes[C.BYTES_RECEIVED_WIRE] += wire
+            self._bytes[C.BYTES_RECEIVED_DECODED] += decoded
+        return r
+
     def api_request(self, endpoint, action, method, data=[{}], headers=C.HEADER_JSON, raise_json_exception=False,
-                    validate_success=False):
+                    validate_success=False, priority=None):
         """
         :param endpoint: String, e.g. C.API_ROUTER_DEVICE_ENDPOINT - 'device_router'
         :param action: String, e.g. C.API_ACTION_DEVICE_ROUTER - 'DeviceRouter'
@@ -105,24 +406,39 @@ class ZenossAPI(object):
         :param headers: Dict, It's here if you need to set something other than a json content type or add something extra.
         :param raise_json_exception: Boolean, when true, raise an error if the json from the API is incorrectly formatted.
         :param validate_success: Boolean, when true, will check if the Zenoss API returned 'success=true' in the JSON response.
+        :param priority: Int, C.PRIORITY_INTERACTIVE, C.PRIORITY_WRITE or C.PRIORITY_BULK. Default: interactive for
+                         reads (get* methods), write otherwise. Only matters when max_in_flight is set.
         :return: When zenoss responds with status code 200: the unpacked json object (e.g. list, dict)
                  When zenoss responds with any other status code, a tuple (status_code, raw_text)
+        :raises ZenossError: also when the circuit breaker for endpoint and method is open.
         """
         # TODO: Look at content-type in header to see if we got json back. Throw exception if HTML.
 
         uri = (self.host or C.API_URI)+C.API_ENDPOINT+endpoint
-        payload = {C.API_ACTION: action, C.API_METHOD: method, C.API_DATA: data if isinstance(data, list) else [data],
-                   C.API_TID: next(self.tid)}
-        logging.debug(json.dumps(payload, indent=2))
+        body = self._encode_envelope(action, method, data if isinstance(data, list) else [data], self._next_tid())
+        # Pretty-printing (and re-parsing the response for it) costs more than the call's own encoding; skip it
+        # unless it will be logged.
+        debug = logging.root.isEnabledFor(logging.DEBUG)
+        if debug:
+            logging.debug(json.dumps(json.loads(body.decode('utf-8')), indent=2))
 
         try:
-            r = requests.post(uri, auth=self.credentials, data=json.dumps(payload),
-                              headers=headers, verify=bool(self.ssl_verify))
+            if self.single_flight and method.startswith(C.API_READ_METHOD_PREFIX):
+                # Identical reads already in flight share that request; each caller still parses its own copy. The
+                # write generation keeps a read issued after a write to this router from joining one issued before.
+                with self._flights_lock:
+                    generation = self._write_generations.get(uri, 0)
+                key = (uri, generation, action, method, json.dumps(data, sort_keys=True, separators=(',', ':')))
+                r = self._single_flight(key, functools.partial(self._send, endpoint, method, uri, body, headers,
+                                                               priority))
+            else:
+                r = self._send(endpoint, method, uri, body, headers, priority)
             logging.debug('Status code: %s' % r.status_code)
-            try:
-                logging.debug('Result: %s' % json.dumps(json.loads(r.text), indent=2))
-            except ValueError:
-                logging.debug('Result: %s' % r.text)
+            if debug:
+                try:
+                    logging.debug('Result: %s' % json.dumps(json.loads(r.text), indent=2))
+                except ValueError:
+                    logging.debug('Result: %s' % r.text)
 
             # TODO: we should be checking the status code and react+log accordingly.
             if r.status_code == 200:
@@ -143,475 +459,485 @@ class ZenossAPI(object):
             # TODO: log it, then log e, then raise e.
             raise e
 
-    ####################################################################################################################
-    #  DEVICE functions
-    ####################################################################################################################
-    def get_devices(self, validate_success=False):
-        """
-        :param validate_success:
-        :return:
-        """
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_GET_DEVICES, validate_success=validate_success)
-
-    def add_device(self, hostname, device_class, validate_success=False, **kwargs):
-        """
-        :param hostname:
-        :param device_class:
-        :param validate_success:
-        :param kwargs:
-        :return:
-        """
-        payload = {C.API_DEVICE_NAME: hostname,
-                   C.API_DEVICE_CLASS: device_class,
-                   C.API_COLLECTOR: C.API_KEYWORD_DEFAULTS[C.API_COLLECTOR],
-                   C.API_MODEL: C.API_KEYWORD_DEFAULTS[C.API_MODEL],
-                   C.API_TITLE: C.API_KEYWORD_DEFAULTS[C.API_TITLE],
-                   C.API_PRODUCTION_STATE: C.API_KEYWORD_DEFAULTS[C.API_PRODUCTION_STATE],
-                   C.API_PRIORITY: C.API_KEYWORD_DEFAULTS[C.API_PRIORITY],
-                   C.API_SNMP_COMMUNITY: C.API_KEYWORD_DEFAULTS[C.API_SNMP_COMMUNITY],
-                   C.API_SNMP_PORT: C.API_KEYWORD_DEFAULTS[C.API_SNMP_PORT],
-                   C.API_TAG: C.API_KEYWORD_DEFAULTS[C.API_TAG],
-                   C.API_RACK_SLOT: C.API_KEYWORD_DEFAULTS[C.API_RACK_SLOT],
-                   C.API_SERIAL_NUMBER: C.API_KEYWORD_DEFAULTS[C.API_SERIAL_NUMBER],
-                   C.API_HW_MANUFACTURER: C.API_KEYWORD_DEFAULTS[C.API_HW_MANUFACTURER],
-                   C.API_HW_PRODUCT_NAME: C.API_KEYWORD_DEFAULTS[C.API_HW_PRODUCT_NAME],
-                   C.API_OS_MANUFACTURER: C.API_KEYWORD_DEFAULTS[C.API_OS_MANUFACTURER],
-                   C.API_OS_PRODUCT_NAME: C.API_KEYWORD_DEFAULTS[C.API_OS_PRODUCT_NAME],
-                   C.API_COMMENTS: C.API_KEYWORD_DEFAULTS[C.API_COMMENTS]}
-
-        payload.update(kwargs)
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_ADD_DEVICE, data=[payload], validate_success=validate_success)
-
-    def remove_devices(self, uids, uid, hash_check=C.API_KEYWORD_DEFAULTS[C.API_HASH_CHECK], action=C.API_DELETE,
-                       delete_events=C.API_KEYWORD_DEFAULTS[C.API_DELETE_EVENTS], validate_success=False):
-        # {"action": "DeviceRouter", "method": "removeDevices", "data": [
-        #     {"uids": ["/zport/dmd/Devices/Server/Linux/devices/etestv-joshui01.postdirect.com"], "hashcheck": 1,
-        #      "uid": "/zport/dmd/Devices/Server", "action": "delete", "deleteEvents": true}], "type": "rpc", "tid": 29}
-        payload = [{C.API_UIDS: uids,
-                    C.API_UID: uid,
-                    C.API_HASH_CHECK: hash_check,
-                    C.API_ACTION: action,
-                    C.API_DELETE_EVENTS: delete_events}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_REMOVE_DEVICES,
-                                data=payload, validate_success=validate_success)
-
-    def add_device_class_node(self, zid, context_uid, description=C.API_KEYWORD_DEFAULTS[C.API_DESCRIPTION],
-                              connection_info=C.API_KEYWORD_DEFAULTS[C.API_CONNECTION_INFO],
-                              ztype=C.API_KEYWORD_DEFAULTS[C.API_TYPE], validate_success=False):
-        # {"action": "DeviceRouter", "method": "addDeviceClassNode", "data": [
-        #     {"id": "TerraformBuilt", "description": "", "connectionInfo": [], "type": "organizer",
-        #      "contextUid": "/zport/dmd/Devices/Server/Linux"}], "type": "rpc", "tid": 15}
-        payload = [{
-            C.API_ID: zid,
-            C.API_DESCRIPTION: description,
-            C.API_CONNECTION_INFO: connection_info,
-            C.API_TYPE: ztype,
-            C.API_CONTEXT_UID: context_uid
-        }]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_ADD_DEVICE_CLASS,
-                                data=payload, validate_success=validate_success)
-
-    def bind_or_unbind_template(self, uid, template_uid, validate_success=False):
-        """
-        :param uid:
-        :param template_uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid, C.API_TEMPLATE_UID: template_uid}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_BIND_OR_UNBIND_TEMPLATE, data=payload, validate_success=validate_success)
-
-    def get_device_info(self, uid, keys=None, validate_success=False):
-        """
-        :param uid:
-        :param keys:
-        :param validate_success:
-        :return:
-        """
-        keys = self._non_str_iterable(keys)
-        payload = [{C.API_UID: uid, C.API_KEYS: keys}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_GET_INFO, data=payload, validate_success=validate_success)
-
-    def get_tree(self, zid, validate_success=False):
-        """
-        :param zid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_ID: zid}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_GET_TREE,
-                                data=payload, validate_success=validate_success)
-
-    def get_bound_templates(self, uid, validate_success=False):
-        """
-        :param uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_GET_BOUND_TEMPLATES, data=payload, validate_success=validate_success)
-
-    def get_unbound_templates(self, uid, validate_success=False):
-        """
-        :param uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_GET_UNBOUND_TEMPLATES, data=payload, validate_success=validate_success)
-
-    def add_local_template(self, device_uid, template_id, validate_success=False):
-        """
-        :param device_uid:
-        :param template_id:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_DEVICE_UID: device_uid, C.API_TEMPLATE_ID: template_id}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_ADD_LOCAL_TEMPLATE, data=payload, validate_success=validate_success)
-
-    def remove_local_template(self, device_uid, template_uid, validate_success=False):
-        """
-        :param device_uid:
-        :param template_uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_DEVICE_UID: device_uid, C.API_TEMPLATE_UID: template_uid}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_REMOVE_LOCAL_TEMPLATE, data=payload, validate_success=validate_success)
-
-    def get_local_templates(self, uid, query=None, validate_success=False):
-        """
-        :param uid:
-        :param query:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid, C.API_QUERY: query}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_GET_LOCAL_TEMPLATES, data=payload, validate_success=validate_success)
-
-    def set_bound_templates(self, uid, template_ids, validate_success=False):
+    def api_batch_request(self, endpoint, action, method, data_list, headers=C.HEADER_JSON,
+                          raise_json_exception=False, priority=None):
         """
-        :param uid:
-        :param template_ids:
-        :param validate_success:
-        :return:
+        Send several calls of the same router method in one Ext.Direct envelope (a JSON list of requests).
+        :param endpoint: String, e.g. C.API_ROUTER_DEVICE_ENDPOINT - 'device_router'
+        :param action: String, e.g. C.API_ACTION_DEVICE_ROUTER - 'DeviceRouter'
+        :param method: String, e.g. C.API_METHOD_SET_INFO - 'setInfo'
+        :param data_list: List of dicts, one dict of 'method' arguments per call.
+        :param headers: Dict, It's here if you need to set something other than a json content type or add something extra.
+        :param raise_json_exception: Boolean, when true, raise an error if the json from the API is incorrectly formatted.
+        :param priority: Int, see api_request.
+        :return: When zenoss responds with status code 200: a list of unpacked json objects in the order of data_list
+                 When zenoss responds with any other status code, a tuple (status_code, raw_text)
         """
-        payload = [{C.API_UID: uid, C.API_TEMPLATE_IDS: self._non_str_iterable(template_ids)}]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
-                                C.API_METHOD_SET_BOUND_TEMPLATES, data=payload, validate_success=validate_success)
+        uri = (self.host or C.API_URI)+C.API_ENDPOINT+endpoint
+        tids = [self._next_tid() for data in data_list]
+        body = b''.join((b'[', b','.join(self._encode_envelope(action, method, [data], tid)
+                                          for data, tid in zip(data_list, tids)), b']'))
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(json.dumps(json.loads(body.decode('utf-8')), indent=2))
+
+        r = self._send(endpoint, method, uri, body, headers, priority)
+        logging.debug('Status code: %s' % r.status_code)
+        if r.status_code != 200:
+            return r.status_code, r.text
+
+        results = self._load_json(r.text, raise_exception=raise_json_exception)
+        if isinstance(results, dict):
+            # A single call is answered with a bare object rather than a list.
+            results = [results]
+        if not isinstance(results, list) or len(results) != len(tids):
+            raise ZenossError(C.ERROR_BATCH_EXPECTED_S_RESPONSES_GOT_S %
+                              (len(tids), len(results) if isinstance(results, list) else None))
+
+        # Ext.Direct does not promise to answer in order, so line the responses back up by transaction ID.
+        by_tid = dict((result.get(C.API_TID), result) for result in results)
+        return [by_tid.get(tid) for tid in tids]
+
+    def api_bulk_request(self, endpoint, action, method, data_list, key=C.API_UID, batch_size=C.BULK_BATCH_SIZE,
+                         workers=C.BULK_WORKERS, journal=None):
+        """
+        Run one router method over many argument dicts, batch_size calls per Ext.Direct envelope and 'workers'
+        envelopes at once. Failures are reported per call rather than raised.
+        :param endpoint: String, e.g. C.API_ROUTER_DEVICE_ENDPOINT - 'device_router'
+        :param action: String, e.g. C.API_ACTION_DEVICE_ROUTER - 'DeviceRouter'
+        :param method: String, e.g. C.API_METHOD_SET_INFO - 'setInfo'
+        :param data_list: List of dicts, one dict of 'method' arguments per call.
+        :param key: String, the argument that identifies each call in the returned dict.
+        :param batch_size: Int, calls per envelope. 1 sends plain (unbatched) requests, None picks the size
+                           adaptively (see chunk_sizer).
+        :param workers: Int, envelopes in flight at once.
+        :param journal: zenoss_journal.Journal. Calls whose data[key] it already holds are skipped (reported as
+                        successful with msg C.JOURNAL_SKIPPED); successful calls are added to it as they finish.
+        :return: Dict of {data[key]: {'success': Boolean, 'msg': String, 'elapsed': seconds}}
+        """
+        outcomes = {}
+        if journal is not None:
+            for data in data_list:
+                if data[key] in journal:
+                    outcomes[data[key]] = {C.API_SUCCESS: True, C.API_MSG: C.JOURNAL_SKIPPED, C.API_ELAPSED: 0.0}
+            # Skip before chunking, so the remaining work still fills whole envelopes.
+            data_list = [data for data in data_list if data[key] not in outcomes]
+
+        def run(chunk):
+            chunk_outcomes, ok = self._bulk_chunk(endpoint, action, method, chunk, key)
+            if journal is not None:
+                for data in chunk:
+                    if chunk_outcomes[data[key]][C.API_SUCCESS]:
+                        journal.record(data[key], uid=data.get(C.API_UID))
+            return [chunk_outcomes], ok
+
+        for chunk_outcomes in self._run_chunks(endpoint + '/' + method, data_list, run, batch_size, workers):
+            outcomes.update(chunk_outcomes)
+        return outcomes
+
+    def api_batch_calls(self, endpoint, action, method, data_list, batch_size=C.BULK_BATCH_SIZE,
+                        workers=C.BULK_WORKERS):
+        """
+        Like api_bulk_request, but returns every call's full response.
+        :param endpoint: String, e.g. C.API_ROUTER_DEVICE_ENDPOINT - 'device_router'
+        :param action: String, e.g. C.API_ACTION_DEVICE_ROUTER - 'DeviceRouter'
+        :param method: String, e.g. C.API_METHOD_GET_INFO - 'getInfo'
+        :param data_list: List of dicts, one dict of 'method' arguments per call.
+        :param batch_size: Int, calls per envelope. 1 sends plain (unbatched) requests, None picks the size
+                           adaptively (see chunk_sizer).
+        :param workers: Int, envelopes in flight at once.
+        :return: List of responses in the order of data_list. Calls in an envelope that failed as a whole get
+                 {'result': {'success': False, 'msg': String}}.
+        """
+        def run(chunk):
+            return self._chunk_results(endpoint, action, method, chunk)
+
+        return self._run_chunks(endpoint + '/' + method, data_list, run, batch_size, workers)
+
+    def _run_chunks(self, name, items, run, batch_size, workers):
+        """
+        Cut items into chunks and run them 'workers' at a time. With batch_size None, each chunk is cut when it is
+        submitted, at the size chunk_sizer(name) currently asks for, and its latency is fed back to the sizer.
+        :param name: String, the chunk sizer's key.
+        :param items: List
+        :param run: Function(chunk) -> (list of results, Boolean: False if the chunk failed as a whole).
+        :param batch_size: Int or None.
+        :param workers: Int
+        :return: List, the results of all chunks in the order of items.
+        """
+        sizer = self.chunk_sizer(name) if batch_size is None else None
+        batch_size = None if sizer else max(1, batch_size)
+
+        def timed(chunk):
+            start = time.time()
+            results, ok = run(chunk)
+            if sizer:
+                sizer.observe(len(chunk), time.time() - start, ok)
+            return results
+
+        chunk_results = {}  # offset -> results
+        pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            offset = 0
+            running = {}
+            while offset < len(items) or running:
+                while offset < len(items) and len(running) < max(1, workers):
+                    size = sizer.size if sizer else batch_size
+                    running[pool.submit(timed, items[offset:offset+size])] = offset
+                    offset += size
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk_results[running.pop(future)] = future.result()
+        finally:
+            pool.shutdown()
+        results = []
+        for offset in sorted(chunk_results):
+            results.extend(chunk_results[offset])
+        return results
+
+    def _chunk_results(self, endpoint, action, method, chunk):
+        # Returns (results, False if the envelope failed as a whole).
+        try:
+            if len(chunk) == 1:
+                results = self.api_request(endpoint, action, method, data=[chunk[0]], priority=C.PRIORITY_BULK)
+                results = results if isinstance(results, tuple) else [results]
+            else:
+                results = self.api_batch_request(endpoint, action, method, chunk, priority=C.PRIORITY_BULK)
+            if isinstance(results, tuple):
+                # Non-200 status code for the whole envelope.
+                return [{C.API_RESULT: {C.API_SUCCESS: False, C.API_MSG: '%s: %s' % results}}] * len(chunk), False
+        except (ZenossError, requests.exceptions.RequestException) as e:
+            return [{C.API_RESULT: {C.API_SUCCESS: False, C.API_MSG: str(e)}}] * len(chunk), False
+        return results, True
+
+    def _bulk_chunk(self, endpoint, action, method, chunk, key):
+        start = time.time()
+        results, ok = self._chunk_results(endpoint, action, method, chunk)
+        elapsed = time.time() - start
+
+        outcomes = {}
+        for data, result in zip(chunk, results):
+            result = (result or {}).get(C.API_RESULT) or {}
+            outcomes[data[key]] = {C.API_SUCCESS: bool(result.get(C.API_SUCCESS)),
+                                   C.API_MSG: result.get(C.API_MSG, ''),
+                                   C.API_ELAPSED: elapsed}
+        return outcomes, ok
+
+    def chunk_sizer(self, name):
+        """
+        The adaptive sizer behind batch_size=None (and iter_oid_mappings' limit=None) for one operation, created at
+        C.BULK_BATCH_SIZE (or the size load_chunk_sizes read) on first use.
+        :param name: String, '/<endpoint>/<method>', e.g. '/device_router/setInfo'.
+        :return: ChunkSizer
+        """
+        with self._sizers_lock:
+            if name not in self._sizers:
+                self._sizers[name] = ChunkSizer(size=self._saved_sizes.get(name, C.BULK_BATCH_SIZE))
+            return self._sizers[name]
+
+    def chunk_metrics(self):
+        """
+        :return: Dict of {'/<endpoint>/<method>': {'size': Int, 'p95': seconds, 'observed': Int, 'grown': Int,
+                 'shrunk': Int}}
+        """
+        with self._sizers_lock:
+            sizers = dict(self._sizers)
+        return dict((name, sizer.metrics()) for name, sizer in sizers.items())
+
+    def save_chunk_sizes(self, path):
+        """
+        Write the chunk sizes picked so far to a JSON file, so the next run can start from them.
+        :param path: String
+        """
+        sizes = dict(self._saved_sizes)
+        sizes.update((name, metrics[C.CHUNK_SIZE]) for name, metrics in self.chunk_metrics().items())
+        fout = open(path, 'w')
+        try:
+            json.dump(sizes, fout, indent=2, sort_keys=True)
+        finally:
+            fout.close()
 
-    def set_device_info(self, validate_success=False, **kwargs):
+    def load_chunk_sizes(self, path):
         """
-        :param validate_success:
-        :param kwargs:
-        :return:
+        Start the adaptive sizers from the sizes save_chunk_sizes wrote. A missing file is not an error.
+        :param path: String
         """
-        # {"action": "DeviceRouter", "method": "setInfo", "data":
-        # [{"uid": "/zport/dmd/Devices/Server/Linux/devices/eprov-legacyws01.postdirect.com",
-        # "productionState": 1000}], "type": "rpc", "tid": 36}
-        payload = [kwargs]
-        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_SET_INFO,
-                                data=payload, validate_success=validate_success)
-
+        try:
+            fin = open(path, 'r')
+        except IOError:
+            logging.info('No saved chunk sizes in %s' % path)
+            return
+        try:
+            sizes = json.load(fin)
+        finally:
+            fin.close()
+        with self._sizers_lock:
+            self._saved_sizes.update(sizes)
+            for name, size in sizes.items():
+                if name in self._sizers:
+                    self._sizers[name] = ChunkSizer(size=size)
 
     ####################################################################################################################
-    #  TEMPLATE functions
+    #  DEVICE functions
     ####################################################################################################################
-    def add_template(self, zid, target_uid, validate_success=False):
-        """
-        :param zid: The name to give the template.
-        :param target_uid: The device path the template should apply to (e.g. /Server/Linux)
-        :param validate_success: Validate that the API returned 'success=true' in the response.
-        :return: When zenoss responds with status code 200: the unpacked json object (e.g. list, dict)
-                 When zenoss responds with any other status code, a tuple (status_code, raw_text)
-        """
-        payload = [{C.API_ID: zid, C.API_TARGET_UID: target_uid}]
-
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_ADD_TEMPLATE, data=payload, validate_success=validate_success)
-
-    def get_templates(self, zid='', validate_success=False):
-        """
-        :param zid: String: not used. Exists to mirror Zenoss API and to support any future implementation.
-        :param validate_success: Boolean, Validate that the API returned 'success=true' in the response.
-        :return:
-        """
-        payload = [{C.API_ID: zid}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_TEMPLATES, data=payload, validate_success=validate_success)
-
-    def add_data_source(self, template_uid, name, data_source_type=C.API_DATA_SOURCE_TYPE_SNMP, validate_success=False):
-        """
-        :param template_uid:
-        :param name:
-        :param data_source_type:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_TEMPLATE_UID: template_uid, C.API_NAME: name, C.API_TYPE: data_source_type}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_ADD_DATA_SOURCE, data=payload, validate_success=validate_success)
-
-    def get_data_sources(self, uid, validate_success=False):
-        """
-        :param uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_DATA_SOURCES, data=payload, validate_success=validate_success)
-
-    def get_data_source_details(self, uid, validate_success=False):
-        """
-        :param uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_DATA_SOURCE_DETAILS, data=payload, validate_success=validate_success)
-
-    def get_data_source_types(self, query=None, validate_success=False):
-        """
-        :param query:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_QUERY: query or C.API_KEYWORD_DEFAULTS[C.API_QUERY]}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_DATA_SOURCE_TYPES, data=payload, validate_success=validate_success)
-
-    def add_data_point(self, data_source_uid, name, validate_success=False):
-        """
-        :param data_source_uid:
-        :param name:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_DATA_SOURCE_UID: data_source_uid, C.API_NAME: name}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_ADD_DATA_POINT, data=payload, validate_success=validate_success)
-
-    def get_data_points(self, uid, query=C.API_KEYWORD_DEFAULTS[C.API_QUERY], validate_success=False):
-        """
-        :param uid:
-        :param query:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid, C.API_QUERY: query}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_DATA_POINTS, data=payload, validate_success=validate_success)
-
-    def add_graph_definition(self, template_uid, graph_definition_id, validate_success=False):
-        """
-        :param template_uid:
-        :param graph_definition_id:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_TEMPLATE_UID: template_uid, C.API_GRAPH_DEFINITION_ID: graph_definition_id}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_ADD_GRAPH_DEFINITION, data=payload, validate_success=validate_success)
-
-    def add_data_point_to_graph(self, data_point_uid, graph_uid,
-                                include_thresholds=C.API_KEYWORD_DEFAULTS[C.API_INCLUDE_THRESHOLDS],
-                                validate_success=False):
-        """
-        :param data_point_uid:
-        :param graph_uid:
-        :param include_thresholds:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_DATA_POINT_UID: data_point_uid, C.API_GRAPH_UID: graph_uid,
-                    C.API_INCLUDE_THRESHOLDS: include_thresholds}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_ADD_DATA_POINT_TO_GRAPH, data=payload, validate_success=validate_success)
-
-    def set_graph_definition(self, uid, miny=C.API_KEYWORD_DEFAULTS[C.API_MINY],
-                             maxy=C.API_KEYWORD_DEFAULTS[C.API_MAXY], units='', validate_success=False, **kwargs):
-        """
-        :param uid:
-        :param miny:
-        :param maxy:
-        :param units:
-        :param validate_success:
-        :param kwargs:
-        :return:
-        """
-        kwargs.update({C.API_UID: uid, C.API_MINY: miny, C.API_MAXY: maxy, C.API_UNITS: units})
-        payload = [kwargs]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_SET_GRAPH_DEFINITION, data=payload, validate_success=validate_success)
-
-    def get_template_info(self, uid, validate_success=False):
-        """
-        :param uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                         C.API_METHOD_GET_INFO, data=payload, validate_success=validate_success)
-
-    def set_template_info(self, uid, validate_success=False, **kwargs):
+    # The plain one-call wrappers for the device, template, MIB and jobs routers (get_tree, get_device_info,
+    # add_template, ...) are generated from zenoss_methods.ROUTER_METHODS, along with their _async, _batch and
+    # _payload forms.
+    def add_device(self, hostname, device_class, validate_success=False, **kwargs):
         """
-        :param uid:
+        :param hostname:
+        :param device_class:
         :param validate_success:
         :param kwargs:
         :return:
         """
-        kwargs.update({C.API_UID: uid})
-        payload = [kwargs]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                         C.API_METHOD_SET_INFO, data=payload, validate_success=validate_success)
+        return self.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_ADD_DEVICE,
+                                data=[self.add_device_payload(hostname, device_class, **kwargs)],
+                                validate_success=validate_success)
 
-    def get_threshold_types(self, query=C.API_KEYWORD_DEFAULTS[C.API_QUERY], validate_success=False):
+    @staticmethod
+    def device_uid(hostname, device_class):
         """
-        :param query:
-        :param validate_success:
-        :return:
+        :param hostname: String
+        :param device_class: String, e.g. C.API_DEVICE_CLASS_SERVER_LINUX
+        :return: String, the uid addDevice gives the device, e.g. '/zport/dmd/Devices/Server/Linux/devices/host1'
         """
-        payload = [{C.API_QUERY: query}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_THRESHOLD_TYPES, data=payload, validate_success=validate_success)
+        return '%s%s%s%s' % (C.API_ENDPOINT + C.API_DEVICES, device_class, C.SNAPSHOT_DEVICES_PATH_PART, hostname)
 
-    def add_threshold(self, uid, threshold_type, threshold_id, data_points, validate_success=False):
+    def add_device_payload(self, hostname, device_class, **kwargs):
         """
-        :param uid:
-        :param threshold_type:
-        :param threshold_id:
-        :param data_points:
-        :param validate_success:
-        :return:
+        The addDevice data add_device sends, for callers that batch addDevice calls themselves.
+        :param hostname: String
+        :param device_class: String, e.g. C.API_DEVICE_CLASS_SERVER_LINUX
+        :param kwargs: Other addDevice arguments, as for add_device.
+        :return: Dict
         """
-        payload = [{C.API_UID: uid, C.API_THRESHOLD_ID: threshold_id, C.API_THRESHOLD_TYPE: threshold_type,
-                    C.API_DATA_POINTS: data_points}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_ADD_THRESHOLD, data=payload, validate_success=validate_success)
+        if C.PRECOMPILED_PAYLOADS:
+            payload = dict(self._add_device_template)
+            payload[C.API_DEVICE_NAME] = hostname
+            payload[C.API_DEVICE_CLASS] = device_class
+        else:
+            payload = dict([(C.API_DEVICE_NAME, hostname), (C.API_DEVICE_CLASS, device_class)] +
+                           [(k, C.API_KEYWORD_DEFAULTS[k]) for k in self._add_device_keys])
+        payload.update(kwargs)
+        return payload
 
-    def get_threshold_details(self, uid, validate_success=False):
+    ####################################################################################################################
+    #  MIB functions
+    ####################################################################################################################
+    def iter_oid_mappings(self, uid, limit=C.API_KEYWORD_DEFAULTS[C.API_LIMIT]):
         """
-        :param uid:
-        :param validate_success:
-        :return:
+        :param uid: String, the MIB module uid, e.g. '/zport/dmd/Mibs/mibs/IF-MIB'
+        :param limit: Int, page size. None picks it adaptively (see chunk_sizer).
+        :return: Generator of every OID mapping record, one getOidMappings page at a time.
         """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_THRESHOLD_DETAILS, data=payload, validate_success=validate_success)
+        sizer = None
+        if limit is None:
+            sizer = self.chunk_sizer(C.API_ROUTER_MIB_ENDPOINT + '/' + C.API_METHOD_GET_OID_MAPPINGS)
+        start = 0
+        while True:
+            page_size = sizer.size if sizer else limit
+            page_start = time.time()
+            try:
+                results = self.get_oid_mappings(uid, start=start, limit=page_size, validate_success=True)
+            except ZenossError:
+                if sizer:
+                    sizer.observe(page_size, time.time() - page_start, ok=False)
+                raise
+            if sizer:
+                sizer.observe(page_size, time.time() - page_start)
+            data, success = self._get_result_data(results)
+            for record in data or []:
+                yield record
+            start += len(data or [])
+            if not data or len(data) < page_size or start >= results[C.API_RESULT].get(C.API_COUNT, start + 1):
+                break
+
+    def parse_oid_table(self, text):
+        """
+        :param text: String, one mapping per line: 'name oid [nodetype]', separated by whitespace or commas.
+                     Blank lines and '#' comments are ignored.
+        :return: List of (name, oid, nodetype) tuples.
+        """
+        entries = []
+        for line in text.splitlines():
+            fields = line.split('#', 1)[0].replace(',', ' ').split()
+            if len(fields) >= 2:
+                entries.append((fields[0], fields[1].lstrip('.'),
+                                fields[2] if len(fields) > 2 else C.API_KEYWORD_DEFAULTS[C.API_NODE_TYPE]))
+        return entries
+
+    def import_oid_mappings(self, uid, entries, batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS):
+        """
+        Add the OID mappings that the MIB module doesn't have yet.
+        :param uid: String, the MIB module uid.
+        :param entries: List of (name, oid) or (name, oid, nodetype) tuples, or a table string for parse_oid_table.
+        :param batch_size: Int, addOidMapping calls per Ext.Direct envelope.
+        :param workers: Int, envelopes in flight at once.
+        :return: Dict, {'created': [names], 'skipped': [names], 'failed': {name: msg}, 'elapsed': seconds,
+                        'rate': created mappings per second}
+        """
+        start = time.time()
+        if isinstance(entries, str):
+            entries = self.parse_oid_table(entries)
+
+        existing = dict((m.get(C.API_ID) or m.get(C.API_NAME), m.get(C.API_OID, '').lstrip('.'))
+                        for m in self.iter_oid_mappings(uid))
+        report = {C.OID_IMPORT_CREATED: [], C.OID_IMPORT_SKIPPED: [], C.OID_IMPORT_FAILED: {}}
+        data_list = []
+        for entry in entries:
+            zid, oid = entry[0], entry[1].lstrip('.')
+            node_type = entry[2] if len(entry) > 2 else C.API_KEYWORD_DEFAULTS[C.API_NODE_TYPE]
+            if zid in existing:
+                if existing[zid] == oid:
+                    report[C.OID_IMPORT_SKIPPED].append(zid)
+                else:
+                    report[C.OID_IMPORT_FAILED][zid] = C.ERROR_OID_S_EXISTS_AS_S_NOT_S % (zid, existing[zid], oid)
+                continue
+            existing[zid] = oid  # duplicates within 'entries' are only sent once.
+            data_list.append({C.API_UID: uid, C.API_ID: zid, C.API_OID: oid, C.API_NODE_TYPE: node_type})
+
+        outcomes = self.api_bulk_request(C.API_ROUTER_MIB_ENDPOINT, C.API_ACTION_MIB_ROUTER,
+                                         C.API_METHOD_ADD_OID_MAPPING, data_list, key=C.API_ID,
+                                         batch_size=batch_size, workers=workers)
+        for zid, outcome in outcomes.items():
+            if outcome[C.API_SUCCESS]:
+                report[C.OID_IMPORT_CREATED].append(zid)
+            else:
+                report[C.OID_IMPORT_FAILED][zid] = outcome[C.API_MSG]
 
-    def get_data_point_details(self, uid, validate_success=False):
-        """
-        :param uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_DATA_POINT_DETAILS, data=payload, validate_success=validate_success)
+        report[C.API_ELAPSED] = time.time() - start
+        report[C.OID_IMPORT_RATE] = len(report[C.OID_IMPORT_CREATED]) / max(report[C.API_ELAPSED], 1e-6)
+        return report
 
-    def get_thresholds(self, uid, query=C.API_KEYWORD_DEFAULTS[C.API_QUERY], validate_success=False):
-        """
-        :param uid:
-        :param query:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid, C.API_QUERY: query}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_THRESHOLDS, data=payload, validate_success=validate_success)
-
-    def get_graphs(self, uid, query=C.API_KEYWORD_DEFAULTS[C.API_QUERY], validate_success=False):
+    ####################################################################################################################
+    #  JOB functions
+    ####################################################################################################################
+    def new_jobs(self, results):
         """
-        :param uid:
-        :param query:
-        :param validate_success: UNUSED: The API response does not include a 'success' value for this function!!!
-        :return:
+        :param results: The response of a call that queues jobs, e.g. add_device(..., model=True)
+        :return: List of job ids (uuids) from the response's 'new_jobs'.
         """
-        payload = [{C.API_UID: uid, C.API_QUERY: query}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_GRAPHS, data=payload, validate_success=False)
+        result = results.get(C.API_RESULT) if isinstance(results, dict) else None
+        return [job[C.API_UUID] for job in (result or {}).get(C.API_NEW_JOBS) or [] if job.get(C.API_UUID)]
 
-    def get_graph_definition(self, uid, validate_success=False):
+    def get_jobs_info(self, jobids, batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS):
         """
-        :param uid:
-        :param validate_success:
-        :return:
+        :param jobids: List of job uuids.
+        :param batch_size: Int, getInfo calls per Ext.Direct envelope.
+        :param workers: Int, envelopes in flight at once.
+        :return: Dict of {jobid: job record}. Jobs Zenoss couldn't find map to {'status': None, 'msg': String}. Jobs
+                 whose getInfo failed for any other reason, or whose envelope failed as a whole (connection error,
+                 non-200 status), are left out.
         """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_GRAPH_DEFINITION, data=payload, validate_success=validate_success)
+        jobids = list(jobids)
+        chunks = [jobids[i:i+max(1, batch_size)] for i in range(0, len(jobids), max(1, batch_size))]
 
-    def get_graph_points(self, uid, validate_success=False):
-        """
-        :param uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_GET_GRAPH_POINTS, data=payload, validate_success=validate_success)
+        def run(chunk):
+            try:
+                results = self.api_batch_request(C.API_ROUTER_JOBS_ENDPOINT, C.API_ACTION_JOBS_ROUTER,
+                                                 C.API_METHOD_GET_INFO, [{C.API_JOB_ID: j} for j in chunk],
+                                                 priority=C.PRIORITY_BULK)
+            except (ZenossError, requests.exceptions.RequestException) as e:
+                results = str(e)
+            if not isinstance(results, list):
+                logging.warning('Could not check %d jobs: %s' % (len(chunk), results))
+                return {}
+
+            infos = {}
+            for jobid, result in zip(chunk, results):
+                result = (result or {}).get(C.API_RESULT) or {}
+                if result.get(C.API_SUCCESS) and result.get(C.API_DATA):
+                    infos[jobid] = result[C.API_DATA]
+                elif C.API_JOB_NOT_FOUND in (result.get(C.API_MSG) or ''):
+                    infos[jobid] = {C.API_STATUS: None, C.API_MSG: result[C.API_MSG]}
+                else:
+                    logging.warning('Could not check job %s: %s' % (jobid, result.get(C.API_MSG, result)))
+            return infos
 
-    def delete_template(self, uid, validate_success=False):
-        """
-        :param uid:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid}]
-        return self.api_request(C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER,
-                                C.API_METHOD_DELETE_TEMPLATE, data=payload, validate_success=validate_success)
+        infos = {}
+        pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            for chunk_infos in pool.map(run, chunks):
+                infos.update(chunk_infos)
+        finally:
+            pool.shutdown()
+        return infos
 
     ####################################################################################################################
-    #  MIB functions
+    #  EVENT functions
     ####################################################################################################################
-    def add_oid_mapping(self, uid, zid, oid, node_type=C.API_KEYWORD_DEFAULTS[C.API_NODE_TYPE], validate_success=False):
-        """
-        :param uid:
-        :param zid:
-        :param oid:
-        :param node_type:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid, C.API_ID: zid, C.API_OID: oid, C.API_NODE_TYPE: node_type}]
-        return self.api_request(C.API_ROUTER_MIB_ENDPOINT, C.API_ACTION_MIB_ROUTER, C.API_METHOD_ADD_OID_MAPPING,
-                                data=payload, validate_success=validate_success)
-
-    def get_oid_mappings(self, uid, direction=C.API_KEYWORD_DEFAULTS[C.API_DIR],
-                         sort=C.API_KEYWORD_DEFAULTS[C.API_SORT], start=C.API_KEYWORD_DEFAULTS[C.API_START],
-                         page=C.API_KEYWORD_DEFAULTS[C.API_PAGE], limit=C.API_KEYWORD_DEFAULTS[C.API_LIMIT],
-                         validate_success=False):
-        """
-        :param uid:
-        :param direction:
-        :param sort:
-        :param start:
-        :param page:
-        :param limit:
-        :param validate_success:
-        :return:
-        """
-        payload = [{C.API_UID: uid,
-                    C.API_DIR: direction,
-                    C.API_SORT: sort,
-                    C.API_START: start,
-                    C.API_PAGE: page,
-                    C.API_LIMIT: limit}]
-        return self.api_request(C.API_ROUTER_MIB_ENDPOINT, C.API_ACTION_MIB_ROUTER, C.API_METHOD_GET_OID_MAPPINGS,
-                         data=payload, validate_success=validate_success)
+    # query_events, acknowledge_events, close_events, ... are generated from zenoss_methods.ROUTER_METHODS.
+    def iter_events(self, params=None, since=None, uid=None, sort=C.API_LAST_TIME, archive=False, keys=None,
+                    page_size=C.EVENTS_PAGE_SIZE):
+        """
+        Stream the events matching a filter, newest first, one query page at a time. The pages are read by offset
+        from a result that keeps changing. Events that arrive while the pages are read push the rest down a page;
+        they may show up, but nothing is yielded twice. Events that leave the result or move up (e.g. a repeat
+        that bumps lastTime) pull the rest up a page, and the event that moves across the page boundary is
+        skipped. EventPoller reads every range twice to catch those.
+        :param params: Dict, the event console filter, e.g. {'severity': [5, 4], 'device': 'web01'}.
+        :param since: Stop at events whose 'sort' value is older than this, e.g. lastTime '2016-07-01 00:00:00'.
+        :param uid: String, only events of this device or organizer.
+        :param sort: String, the event field to order by (and that 'since' applies to).
+        :param archive: Boolean, read the event archive instead of the active events.
+        :param keys: List of event fields to return. evid and the sort field are always included.
+        :param page_size: Int, events per query call.
+        :return: Generator of event dicts.
+        """
+        if keys is not None:
+            keys = list(keys) + [k for k in (C.API_EVID, sort) if k not in keys]
+        seen = set()
+        start = 0
+        while True:
+            results = self.query_events(params=params, uid=uid, start=start, limit=page_size, sort=sort,
+                                        direction='DESC', archive=archive, keys=keys, validate_success=True)
+            if isinstance(results, tuple):
+                raise ZenossError(C.ERROR_EVENTS_QUERY_GOT_S % ('%s: %s' % results))
+            events = results[C.API_RESULT].get(C.API_EVENTS) or []
+            for event in events:
+                value = event.get(sort)
+                if since is not None and value is not None and value < since:
+                    return
+                if event.get(C.API_EVID) not in seen:
+                    seen.add(event.get(C.API_EVID))
+                    yield event
+            start += len(events)
+            if len(events) < page_size or start >= results[C.API_RESULT].get(C.API_TOTAL_COUNT, start + 1):
+                return
+
+    def _events_bulk(self, batch, evids, evids_per_call, batch_size, workers):
+        evids = list(evids)
+        per_call = max(1, evids_per_call)
+        chunks = [evids[i:i+per_call] for i in range(0, len(evids), per_call)]
+        outcomes = {}
+        for chunk, response in zip(chunks, batch([{'evids': chunk} for chunk in chunks], batch_size=batch_size,
+                                                 workers=workers)):
+            result = (response or {}).get(C.API_RESULT) or {}
+            for evid in chunk:
+                outcomes[evid] = {C.API_SUCCESS: bool(result.get(C.API_SUCCESS)), C.API_MSG: result.get(C.API_MSG, '')}
+        return outcomes
+
+    def acknowledge_events_bulk(self, evids, evids_per_call=C.EVENTS_PER_CALL, batch_size=C.BULK_BATCH_SIZE,
+                                workers=C.BULK_WORKERS):
+        """
+        :param evids: Iterable of event ids.
+        :param evids_per_call: Int, event ids per acknowledge call.
+        :param batch_size: Int, acknowledge calls per Ext.Direct envelope.
+        :param workers: Int, envelopes in flight at once.
+        :return: Dict of {evid: {'success': Boolean, 'msg': String}}
+        """
+        return self._events_bulk(self.acknowledge_events_batch, evids, evids_per_call, batch_size, workers)
+
+    def close_events_bulk(self, evids, evids_per_call=C.EVENTS_PER_CALL, batch_size=C.BULK_BATCH_SIZE,
+                          workers=C.BULK_WORKERS):
+        """
+        :param evids: Iterable of event ids.
+        :param evids_per_call: Int, event ids per close call.
+        :param batch_size: Int, close calls per Ext.Direct envelope.
+        :param workers: Int, envelopes in flight at once.
+        :return: Dict of {evid: {'success': Boolean, 'msg': String}}
+        """
+        return self._events_bulk(self.close_events_batch, evids, evids_per_call, batch_size, workers)
 
     ####################################################################################################################
     #  Convenience functions
@@ -619,113 +945,204 @@ class ZenossAPI(object):
     def _payload_filter(self, d):
         # Zenoss alerting behavior is sometimes conditional on what is and is not set. This filter prevents us from
         # setting values that have a blank value.
-        return dict(filter(lambda v: v is not None, d.values()))
+        return dict((k, v) for k, v in d.items() if v is not None)
 
     def _path_validator(self, data, key, checks, values):
-        for d in data:
-            if key in d:
-                path_parts = d[key].split('/')
-                for k, v in checks.items():
-                    func = getattr(path_parts[k], v)
-                    if not func(values[k]):
-                        break
-                else:
-                    # This else statement only happens when we didn't hit the 'break' statement (the loop
-                    # completed and therefore, we found our match)
-                    return d[key]
-        # This 'else' belongs to the 'for' loop
-        else:
-            raise ZenossError(C.ERROR_VALUES_S_NO_MATCH_S % (values.values(), key))
+        # First match or ZenossError. Use PathMatcher/PathIndex directly for all matches or repeated queries.
+        return PathMatcher(checks, values, key=key).first(data)
 
     def add_new_snmp_monitor(self, zid, target_uid, oid='', threshold_max=None, threshold_min=None,  graph=True,
                              graph_min_y=-1, graph_max_y=-1, graph_units='', graph_line_type=C.API_LINE_TYPE_LINE,
-                             rpn=None, overwrite=False, delete_on_fail=True):
-
-        # declare that this is a thing so if we fail immediately, the 'except' statement doesn't blow up.
-        template_uid = ''
+                             rpn=None, overwrite=False, delete_on_fail=True, workers=C.BULK_WORKERS):
 
         # If we already have the template and we don't want to overwrite it, simply return True.
-        try:
-            if not overwrite:
-                results = self.get_templates(C.API_ENDPOINT+C.API_DEVICES)
-                # TODO: is this REALLY any better? (see commit ID 7da529ce79c496f3170664503b3e52bfb362e6d9 - lines 535-538)
-                try:
-                    if self._path_validator(results[C.API_RESULT], C.API_ID, {0: '__eq__'}, {0: zid}):
-                        # It exists and we don't want to overwrite it.
-                        return True
-                except ZenossError:
-                    # It didn't exist, so ignore the error and create it.
-                    pass
-
-            if not target_uid.startswith(C.API_ENDPOINT):
-                target_uid = C.API_ENDPOINT + target_uid
-
-            datasource_name = '%s_%s' % (zid, C.API_PATH_PART_DATA_SOURCES)
-            threshold_name = '%s_%s' % (zid, C.API_PATH_PART_THRESHOLDS)
-            graph_name = '%s_%s' % (zid, C.API_PATH_PART_GRAPH_DEFS)
-
-            results = self.add_template(zid, target_uid, validate_success=True)  # create template
-            data, success = self._get_result_data(results, data_key=C.API_NODE_CONFIG)
-            template_uid = self._path_validator([data], C.API_UID, {-2: '__eq__', -1: '__eq__'},
-                                                {-2: C.API_TEMPLATE_TYPE_RRD_TEMPLATES[1:], -1: zid})
-
-            self.add_data_source(template_uid, datasource_name, data_source_type=C.API_DATA_SOURCE_TYPE_SNMP,
-                                 validate_success=True)
-
-            results = self.get_data_sources(template_uid, validate_success=True)
-            data, success = self._get_result_data(results)
-            datasource_uid = self._path_validator(data, C.API_UID, {-2: '__eq__', -1: '__eq__'},
-                                                  {-2: C.API_PATH_PART_DATA_SOURCES, -1: datasource_name})
-
-            results = self.get_data_points(template_uid, validate_success=True)
+        if not overwrite:
+            results = self.get_templates(C.API_ENDPOINT+C.API_DEVICES)
+            # TODO: is this REALLY any better? (see commit ID 7da529ce79c496f3170664503b3e52bfb362e6d9 - lines 535-538)
+            try:
+                if self._path_validator(results[C.API_RESULT], C.API_ID, {0: '__eq__'}, {0: zid}):
+                    # It exists and we don't want to overwrite it.
+                    return True
+            except ZenossError:
+                # It didn't exist, so ignore the error and create it.
+                pass
+
+        if not target_uid.startswith(C.API_ENDPOINT):
+            target_uid = C.API_ENDPOINT + target_uid
+
+        datasource_name = '%s_%s' % (zid, C.API_PATH_PART_DATA_SOURCES)
+        threshold_name = '%s_%s' % (zid, C.API_PATH_PART_THRESHOLDS)
+        graph_name = '%s_%s' % (zid, C.API_PATH_PART_GRAPH_DEFS)
+
+        def find(part, name, check='__eq__', data_key=C.API_DATA):
+            # Pick the uid of 'name' under 'part' out of a listing response.
+            def extract(results):
+                if data_key is None:
+                    # Note that the Zenoss is inconsistent here: No 'success' and no 'data' values returned from the API.
+                    data = results[C.API_RESULT]
+                else:
+                    data, success = self._get_result_data(results, data_key=data_key)
+                    data = [data] if isinstance(data, dict) else data
+                return self._path_validator(data, C.API_UID, {-2: '__eq__', -1: check}, {-2: part, -1: name})
+            return extract
+
+        def delete_template(template_uid):
+            if overwrite:
+                logging.warn(C.WARN_S_AND_S_CONFLICT % ('delete_on_fail', 'overwrite'))
+            else:
+                self.delete_template(template_uid)
+
+        # Each step names the uid it produces; steps that use Ref(<uid>) wait for it. The data source and graph
+        # branches only meet at add_data_point_to_graph, so they run side by side.
+        wf = Workflow(workers=workers)
+        template_uid = wf.add('template_uid', self.add_template, zid, target_uid, validate_success=True,
+                              step={'extract': find(C.API_TEMPLATE_TYPE_RRD_TEMPLATES[1:], zid,
+                                                    data_key=C.API_NODE_CONFIG),
+                                    'compensate': delete_template if delete_on_fail else None})
+
+        wf.add('add_data_source', self.add_data_source, template_uid, datasource_name,
+               data_source_type=C.API_DATA_SOURCE_TYPE_SNMP, validate_success=True)
+        datasource_uid = wf.add('datasource_uid', self.get_data_sources, template_uid, validate_success=True,
+                                step={'extract': find(C.API_PATH_PART_DATA_SOURCES, datasource_name),
+                                      'after': ['add_data_source']})
+        # Yes, the last check here really should be the dataSOURCE name (not dataPOINT).
+        datapoint_uid = wf.add('datapoint_uid', self.get_data_points, template_uid, validate_success=True,
+                               step={'extract': find(C.API_PATH_PART_DATA_POINTS, datasource_name),
+                                     'after': ['add_data_source']})
+        wf.add('set_oid', self.set_template_info, datasource_uid, validate_success=True, **{C.API_OID: oid})
+
+        wf.add('add_threshold', self.add_threshold, template_uid, C.API_THRESHOLD_MIN_MAX, threshold_name,
+               [datapoint_uid], validate_success=True)
+        threshold_uid = wf.add('threshold_uid', self.get_thresholds, template_uid, validate_success=True,
+                               step={'extract': find(C.API_PATH_PART_THRESHOLDS, threshold_name),
+                                     'after': ['add_threshold']})
+        payload = self._payload_filter({C.API_MAX_VAL: threshold_max, C.API_MIN_VAL: threshold_min})
+        if payload:
+            wf.add('set_threshold', self.set_template_info, threshold_uid, validate_success=True, **payload)
+
+        if graph:
+            wf.add('add_graph_definition', self.add_graph_definition, template_uid, graph_name,
+                   validate_success=True)
+            graph_uid = wf.add('graph_uid', self.get_graphs, template_uid,
+                               step={'extract': find(C.API_PATH_PART_GRAPH_DEFS, graph_name, data_key=None),
+                                     'after': ['add_graph_definition']})
+            # The threshold has to exist for include_thresholds to pick it up.
+            wf.add('add_data_point_to_graph', self.add_data_point_to_graph, datapoint_uid, graph_uid,
+                   include_thresholds=True, validate_success=True, step={'after': ['add_threshold']})
+            graph_point_uid = wf.add('graph_point_uid', self.get_graph_points, graph_uid, validate_success=True,
+                                     step={'extract': find(C.API_PATH_PART_GRAPH_POINTS, datasource_name, 'endswith'),
+                                           'after': ['add_data_point_to_graph']})
+            payload = self._payload_filter({C.API_LINE_TYPE: graph_line_type, C.API_RPN: rpn})  # example RPN '8640000,/'
+            if payload:
+                wf.add('set_graph_point', self.set_template_info, graph_point_uid, validate_success=True, **payload)
+            wf.add('set_graph_definition', self.set_graph_definition, graph_uid, miny=graph_min_y, maxy=graph_max_y,
+                   units=graph_units, validate_success=True)
+
+        self._add_bind_steps(wf, target_uid, zid)
+        values = wf.run()
+        logging.debug('add_new_snmp_monitor step timings: %s' % wf.timings)
+        return values['bind_templates']
+
+    def add_snmp_monitor_matrix(self, zid, target_uid, oids, thresholds=None, graphs=None, graph_units='',
+                                graph_min_y=-1, graph_max_y=-1, overwrite=False, delete_on_fail=True,
+                                workers=C.BULK_WORKERS):
+        """
+        One template with a data source (and its data point) per OID, instead of one template per OID as
+        add_new_snmp_monitor does. Object uids are built from the template layout rather than listed back, and every
+        call runs as soon as the objects it needs exist.
+        :param zid: The name to give the template.
+        :param target_uid: The device path the template should apply to (e.g. /Server/Linux)
+        :param oids: Dict of {data source name: oid}, or a list of (name, oid) tuples.
+        :param thresholds: Dict of {threshold name: {'dataPoints': [data source names], 'minval': x, 'maxval': y}}.
+                           MinMax thresholds; either value may be omitted.
+        :param graphs: Dict of {graph name: [data source names]}. Default: one graph with every data point.
+                       Pass {} for no graphs.
+        :param graph_units: String, units for every graph.
+        :param graph_min_y: Int, see set_graph_definition.
+        :param graph_max_y: Int, see set_graph_definition.
+        :param overwrite: Boolean, when false and the template exists, do nothing and return True.
+        :param delete_on_fail: Boolean, delete the half-built template if any call fails.
+        :param workers: Int, calls in flight at once.
+        :return: See bind_templates
+        """
+        oids = list(oids.items()) if isinstance(oids, dict) else list(oids)
+        if graphs is None:
+            graphs = {'%s_%s' % (zid, C.API_PATH_PART_GRAPH_DEFS): [name for name, oid in oids]}
+        thresholds = thresholds or {}
+
+        if not overwrite:
+            results = self.get_templates(C.API_ENDPOINT+C.API_DEVICES)
+            try:
+                if self._path_validator(results[C.API_RESULT], C.API_ID, {0: '__eq__'}, {0: zid}):
+                    return True
+            except ZenossError:
+                pass
+
+        if not target_uid.startswith(C.API_ENDPOINT):
+            target_uid = C.API_ENDPOINT + target_uid
+        template_uid = '%s%s/%s' % (target_uid, C.API_TEMPLATE_TYPE_RRD_TEMPLATES, zid)
+
+        def ds_uid(name):
+            return '%s/%s/%s' % (template_uid, C.API_PATH_PART_DATA_SOURCES, name)
+
+        def dp_uid(name):
+            # Zenoss names the data point of a new SNMP data source after the data source.
+            return '%s/%s/%s' % (ds_uid(name), C.API_PATH_PART_DATA_POINTS, name)
+
+        def uid_of(part, name):
+            return '%s/%s/%s' % (template_uid, part, name)
+
+        wf = Workflow(workers=workers)
+        wf.add('template', self.add_template, zid, target_uid, validate_success=True,
+               step={'compensate': (lambda results: self.delete_template(template_uid)) if delete_on_fail else None})
+        for name, oid in oids:
+            wf.add('ds:' + name, self.add_data_source, template_uid, name,
+                   data_source_type=C.API_DATA_SOURCE_TYPE_SNMP, validate_success=True, step={'after': ['template']})
+            wf.add('oid:' + name, self.set_template_info, ds_uid(name), validate_success=True,
+                   step={'after': ['ds:' + name]}, **{C.API_OID: oid})
+        for name, t in thresholds.items():
+            dps = t.get(C.API_DATA_POINTS, [])
+            wf.add('threshold:' + name, self.add_threshold, template_uid, C.API_THRESHOLD_MIN_MAX, name,
+                   [dp_uid(dp) for dp in dps], validate_success=True, step={'after': ['ds:' + dp for dp in dps]})
+            payload = self._payload_filter({C.API_MIN_VAL: t.get(C.API_MIN_VAL), C.API_MAX_VAL: t.get(C.API_MAX_VAL)})
+            if payload:
+                wf.add('threshold_values:' + name, self.set_template_info, uid_of(C.API_PATH_PART_THRESHOLDS, name),
+                       validate_success=True, step={'after': ['threshold:' + name]}, **payload)
+        for name, dps in graphs.items():
+            wf.add('graph:' + name, self.add_graph_definition, template_uid, name, validate_success=True,
+                   step={'after': ['template']})
+            wf.add('graph_definition:' + name, self.set_graph_definition, uid_of(C.API_PATH_PART_GRAPH_DEFS, name),
+                   miny=graph_min_y, maxy=graph_max_y, units=graph_units, validate_success=True,
+                   step={'after': ['graph:' + name]})
+            for dp in dps:
+                # include_thresholds only picks up thresholds that already exist.
+                after = ['graph:' + name, 'ds:' + dp] + ['threshold:' + t for t in thresholds
+                                                         if dp in thresholds[t].get(C.API_DATA_POINTS, [])]
+                wf.add('graph_point:%s:%s' % (name, dp), self.add_data_point_to_graph, dp_uid(dp),
+                       uid_of(C.API_PATH_PART_GRAPH_DEFS, name), include_thresholds=True, validate_success=True,
+                       step={'after': after})
+
+        self._add_bind_steps(wf, target_uid, zid)
+        values = wf.run()
+        logging.debug('add_snmp_monitor_matrix step timings: %s' % wf.timings)
+        return values['bind_templates']
+
+    def _add_bind_steps(self, wf, uid, template_uids):
+        # Binding as the last step of a template workflow: if it raises, the template steps' compensations (e.g.
+        # delete_template) run as for any other failure, and if a later failure rolls back a bind that changed
+        # something, the bindings read beforehand are put back.
+        def bound_templates(results):
             data, success = self._get_result_data(results)
-            # Yes, the last check here really should be the dataSOURCE name (not dataPOINT).
-            datapoint_uid = self._path_validator(data, C.API_UID, {-2: '__eq__', -1: '__eq__'},
-                                                 {-2: C.API_PATH_PART_DATA_POINTS, -1: datasource_name})
+            return [r[0] for r in data] if success and data else None
 
-            self.set_template_info(datasource_uid, validate_success=True, **{C.API_OID: oid})
+        def unbind(result):
+            # Only a setBoundTemplates response means the bind changed anything.
+            if isinstance(result, dict) and wf.values.get('bound_templates') is not None:
+                self.set_bound_templates(uid, wf.values['bound_templates'])
 
-            self.add_threshold(template_uid, C.API_THRESHOLD_MIN_MAX, threshold_name, [datapoint_uid],
-                               validate_success=True)
-
-            results = self.get_thresholds(template_uid, validate_success=True)
-            data, success = self._get_result_data(results)
-            threshold_uid = self._path_validator(data, C.API_UID, {-2: '__eq__', -1: '__eq__'},
-                                                 {-2: C.API_PATH_PART_THRESHOLDS, -1: threshold_name})
-
-            payload = self._payload_filter({C.API_MAX_VAL: threshold_max, C.API_MIN_VAL: threshold_min})
-            if payload:
-                self.set_template_info(threshold_uid, validate_success=True, **payload)
-
-            if graph:
-                self.add_graph_definition(template_uid, graph_name, validate_success=True)  # create graph
-
-                # Note that the Zenoss is inconsistent here: No 'success' and no 'data' values returned from the API.
-                results = self.get_graphs(template_uid)
-                graph_uid = self._path_validator(results[C.API_RESULT], C.API_UID, {-2: '__eq__', -1: '__eq__'},
-                                            {-2: C.API_PATH_PART_GRAPH_DEFS, -1: graph_name})
-
-                self.add_data_point_to_graph(datapoint_uid, graph_uid, include_thresholds=True, validate_success=True)
-
-                results = self.get_graph_points(graph_uid, validate_success=True)
-                data, success = self._get_result_data(results)
-                graph_point_datasource_uid = self._path_validator(data, C.API_UID, {-2: '__eq__', -1: 'endswith'},
-                                                                  {-2: C.API_PATH_PART_GRAPH_POINTS, -1: datasource_name})
-
-                payload = self._payload_filter({C.API_LINE_TYPE: graph_line_type, C.API_RPN: rpn})  # example RPN '8640000,/'
-                if payload:
-                    self.set_template_info(graph_point_datasource_uid, validate_success=True, **payload)
-                self.set_graph_definition(graph_uid, miny=graph_min_y, maxy=graph_max_y, units=graph_units,
-                                          validate_success=True)
-            return self.bind_templates(target_uid, zid)
-        except ZenossError as e:
-            if delete_on_fail:
-                if overwrite:
-                    logging.warn(C.WARN_S_AND_S_CONFLICT % ('delete_on_fail', 'overwrite'))
-                elif template_uid:
-                    # If we don't have a template UID, then nothing happened, so nothing to delete.
-                    self.delete_template(template_uid)
-            raise e
+        wf.add('bound_templates', self.get_bound_templates, uid, step={'extract': bound_templates})
+        wf.add('bind_templates', self.bind_templates, uid, template_uids,
+               step={'after': [s.name for s in wf.steps], 'compensate': unbind})
 
     def bind_templates(self, uid, template_uids):
         """
@@ -743,7 +1160,7 @@ class ZenossAPI(object):
         data, success = self._get_result_data(results)
         if success and data:
             bound_template_uids = [r[0] for r in data]
-            add_template_ids = filter(lambda tid: tid not in bound_template_uids, template_uids)
+            add_template_ids = [tid for tid in template_uids if tid not in bound_template_uids]
             if add_template_ids:
                 return self.set_bound_templates(uid, add_template_ids+bound_template_uids)
             return True  # Template was already bound
@@ -791,6 +1208,79 @@ class ZenossAPI(object):
                                           connection_info=connection_info, ztype=ztype,
                                           validate_success=validate_success)
 
+    @staticmethod
+    def device_class_uid(path):
+        """
+        :param path: String, a device class, e.g. '/Server/Linux/TerraformBuilt', or its uid.
+        :return: String, the device class uid, e.g. '/zport/dmd/Devices/Server/Linux/TerraformBuilt'
+        """
+        root = C.API_ENDPOINT + C.API_DEVICES
+        path = path.rstrip('/')
+        if path == root or path.startswith(root + '/'):
+            return path
+        return root + '/' + path.lstrip('/')
+
+    def ensure_device_class_tree(self, paths, description=C.API_KEYWORD_DEFAULTS[C.API_DESCRIPTION],
+                                 connection_info=C.API_KEYWORD_DEFAULTS[C.API_CONNECTION_INFO],
+                                 batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS):
+        """
+        Create every device class in paths along with any missing parents, e.g.
+        ensure_device_class_tree(['/Server/Linux/TerraformBuilt/ThisIsATest', '/Server/Linux/TerraformBuilt/Other'])
+        Reads the existing tree once with getTree, then creates the missing classes one depth level at a time:
+        parents before children, the classes of a level all at once (siblings share envelopes).
+        :param paths: Iterable of device classes (see device_class_uid).
+        :param description: String, description of the created classes.
+        :param connection_info: List, connectionInfo of the created classes.
+        :param batch_size: Int, addDeviceClassNode calls per envelope.
+        :param workers: Int, envelopes in flight at once.
+        :return: Dict of {uid: {'success': Boolean, 'msg': String}} for every class in paths and their parents.
+                 Classes that already existed have msg C.DEVICE_CLASS_EXISTS.
+        """
+        root = C.API_ENDPOINT + C.API_DEVICES
+        results = self.get_tree(root)
+        if isinstance(results, tuple):
+            raise ZenossError(C.ERROR_DEVICE_CLASS_TREE_S_GOT_S % (root, '%s: %s' % results))
+        tree = results.get(C.API_RESULT)
+        if not isinstance(tree, list):
+            # A failed getTree answers with {'success': False, 'msg': ...} instead of the list of nodes.
+            raise ZenossError(C.ERROR_DEVICE_CLASS_TREE_S_GOT_S % (root, (tree or {}).get(C.API_MSG) or tree))
+        existing = set()
+        stack = list(tree)
+        while stack:
+            node = stack.pop()
+            existing.add(node.get(C.API_UID))
+            stack.extend(node.get(C.API_CHILDREN) or [])
+
+        outcomes = {}
+        levels = {}  # depth -> missing uids
+        for path in paths:
+            uid = self.device_class_uid(path)
+            parts = [part for part in uid[len(root):].split('/') if part]
+            for depth in range(1, len(parts) + 1):
+                node_uid = root + '/' + '/'.join(parts[:depth])
+                if node_uid in existing:
+                    outcomes[node_uid] = {C.API_SUCCESS: True, C.API_MSG: C.DEVICE_CLASS_EXISTS}
+                elif node_uid not in outcomes:
+                    outcomes[node_uid] = None
+                    levels.setdefault(depth, []).append(node_uid)
+
+        for depth in sorted(levels):
+            uids = []
+            for uid in sorted(levels[depth]):
+                parent = uid.rsplit('/', 1)[0]
+                if parent != root and not outcomes[parent][C.API_SUCCESS]:
+                    outcomes[uid] = {C.API_SUCCESS: False, C.API_MSG: C.DEVICE_CLASS_PARENT_FAILED_S % parent}
+                else:
+                    uids.append(uid)
+            # Sorted, so siblings go out together and are added to their parent in one request.
+            calls = [{'zid': uid.rsplit('/', 1)[1], 'context_uid': uid.rsplit('/', 1)[0], 'description': description,
+                      'connection_info': connection_info} for uid in uids]
+            for uid, response in zip(uids, self.add_device_class_node_batch(calls, batch_size=batch_size,
+                                                                            workers=workers)):
+                result = (response or {}).get(C.API_RESULT) or {}
+                outcomes[uid] = {C.API_SUCCESS: bool(result.get(C.API_SUCCESS)), C.API_MSG: result.get(C.API_MSG, '')}
+        return outcomes
+
     def set_production_level(self, uid, production_state, validate_success=False):
         """
         :param uid:
@@ -801,6 +1291,59 @@ class ZenossAPI(object):
         kwargs = {C.API_UID: uid, C.API_PRODUCTION_STATE: production_state}
         return self.set_device_info(validate_success=validate_success, **kwargs)
 
+    def set_device_info_bulk(self, updates, batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS, batched=True,
+                             journal=None):
+        """
+        :param updates: Dict of {uid: fields} or an iterable of (uid, fields) pairs. Repeated updates to the same uid
+                        are merged (later values win) so each device is only sent once.
+        :param batch_size: Int, number of setInfo calls per Ext.Direct envelope. Ignored when batched is False.
+        :param workers: Int, number of envelopes (or single calls when batched is False) in flight at once.
+        :param batched: Boolean, when false, send one setInfo call per uid on the worker pool instead.
+        :param journal: zenoss_journal.Journal of the uids already updated, e.g. by an earlier run that crashed. See
+                        api_bulk_request.
+        :return: Dict of {uid: {'success': Boolean, 'msg': String, 'elapsed': seconds}}
+        """
+        if isinstance(updates, dict):
+            updates = updates.items()
+
+        merged = {}
+        for uid, fields in updates:
+            merged.setdefault(uid, {}).update(fields)
+        data_list = [dict(fields, **{C.API_UID: uid}) for uid, fields in merged.items()]
+
+        return self.api_bulk_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_SET_INFO,
+                                     data_list, batch_size=batch_size if batched else 1, workers=workers,
+                                     journal=journal)
+
+    def write_behind(self, max_size=C.WRITE_BEHIND_MAX_SIZE, max_delay=C.WRITE_BEHIND_MAX_DELAY,
+                     batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS):
+        """
+        :param max_size: See WriteBehind.
+        :param max_delay: See WriteBehind.
+        :param batch_size: See WriteBehind.
+        :param workers: See WriteBehind.
+        :return: A new WriteBehind queue writing through this client. close() it (or use it in a with block) so the
+                 last writes are sent.
+        """
+        return WriteBehind(self, max_size=max_size, max_delay=max_delay, batch_size=batch_size, workers=workers)
+
+    def set_production_levels(self, uids, production_state, batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS,
+                              journal=None):
+        """
+        :param uids: Iterable of device uids.
+        :param production_state: e.g. C.API_PRODUCTION_STATE_MAINTENANCE
+        :param batch_size: See set_device_info_bulk
+        :param workers: See set_device_info_bulk
+        :param journal: See set_device_info_bulk
+        :return: See set_device_info_bulk
+        """
+        updates = [(uid, {C.API_PRODUCTION_STATE: production_state}) for uid in self._non_str_iterable(uids)]
+        return self.set_device_info_bulk(updates, batch_size=batch_size, workers=workers, journal=journal)
+
+
+for _router_method in ROUTER_METHODS:
+    _router_method.install(ZenossAPI)
+
 
 def main():
     fin = open('credentials.yaml', 'r')
@@ -890,6 +1433,7 @@ def main():
 
     # zap.add_linux_device_class_node('TerraformBuilt/ThisIsATest')
     # zap.add_device_class_node('Testing', C.API_DEVICES_SERVER_LINUX+'/TerraformBuilt')
+    # zap.ensure_device_class_tree(['/Server/Linux/TerraformBuilt/ThisIsATest', '/Server/Linux/TerraformBuilt/Test2'])
     #zap.get_tree(C.API_DEVICES_SERVER_LINUX)
 
     # {"action": "DeviceRouter", "method": "addDeviceClassNode", "data": [
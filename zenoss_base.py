@@ -0,0 +1,2 @@
+class ZenossError(Exception):
+    pass
@@ -0,0 +1,496 @@
+import io
+import sys
+import csv
+import json
+import time
+import yaml
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_api import ZenossAPI
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_export import ZenossExporter
+    from zenoss5_api.zenoss_jobs import JobTracker
+    from zenoss5_api.zenoss_journal import Journal
+    from zenoss5_api.zenoss_load import LoadGenerator, format_report
+    from zenoss5_api.zenoss_stub import StubZenoss
+except ImportError:
+    from CONSTS import C
+    from zenoss_api import ZenossAPI
+    from zenoss_base import ZenossError
+    from zenoss_export import ZenossExporter
+    from zenoss_jobs import JobTracker
+    from zenoss_journal import Journal
+    from zenoss_load import LoadGenerator, format_report
+    from zenoss_stub import StubZenoss
+
+
+def _coerce(column, value):
+    # CSV cells are all strings; the few numeric and boolean arguments should reach the API as numbers and booleans.
+    if column in C.CLI_BOOLEAN_COLUMNS:
+        if value.lower() in C.CLI_TRUE:
+            return True
+        if value.lower() in C.CLI_FALSE:
+            return False
+        return value
+    if column not in C.CLI_NUMERIC_COLUMNS:
+        return value
+    for t in (int, float):
+        try:
+            return t(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_rows(path, fmt=None, column=None):
+    """
+    :param path: String, a CSV, YAML or JSON file, or '-' for stdin.
+    :param fmt: String, 'csv' or 'yaml' (JSON is YAML). Guessed from the extension or the content when omitted.
+    :param column: String, the column name for rows given as bare values (e.g. a plain list of hostnames).
+    :return: List of dicts.
+    """
+    if path == '-':
+        text = sys.stdin.read()
+    else:
+        fin = open(path, 'r')
+        try:
+            text = fin.read()
+        finally:
+            fin.close()
+
+    if fmt is None:
+        if path.endswith('.csv'):
+            fmt = C.CLI_FORMAT_CSV
+        elif path.endswith(('.yaml', '.yml', '.json')) or text.lstrip()[:1] in ('[', '{', '-'):
+            fmt = C.CLI_FORMAT_YAML
+        else:
+            fmt = C.CLI_FORMAT_CSV
+
+    if fmt == C.CLI_FORMAT_CSV:
+        rows = []
+        for row in csv.DictReader(io.StringIO(text) if str is not bytes else io.BytesIO(text)):
+            rows.append(dict((k.strip(), _coerce(k.strip(), v.strip())) for k, v in row.items()
+                             if k and v not in (None, '')))
+        return rows
+    elif fmt == C.CLI_FORMAT_YAML:
+        data = yaml.safe_load(text) or []
+        if isinstance(data, dict):
+            data = [data]
+        return [row if isinstance(row, dict) else {column: row} for row in data]
+    raise ZenossError(C.ERROR_CLI_UNKNOWN_INPUT_FORMAT_S % fmt)
+
+
+def _split(value):
+    # 'a;b c' -> ['a', 'b', 'c']. YAML input can give a list directly.
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [v for v in str(value).replace(';', ' ').replace(',', ' ').split() if v]
+
+
+def _outcome(results):
+    # The API functions answer with a response dict, a (status_code, text) tuple or a plain Boolean.
+    if isinstance(results, bool):
+        return results, ''
+    if isinstance(results, tuple):
+        return False, '%s: %s' % results
+    if isinstance(results, dict) and isinstance(results.get(C.API_RESULT), dict):
+        result = results[C.API_RESULT]
+        return bool(result.get(C.API_SUCCESS, True)), result.get(C.API_MSG, '')
+    return True, ''
+
+
+class RateLimiter(object):
+    def __init__(self, rate):
+        """
+        :param rate: Float, calls per second across all threads. 0 or None for unlimited.
+        """
+        self.interval = 1.0 / rate if rate else 0
+        self.next = time.time()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            at = max(self.next, now)
+            self.next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class Progress(object):
+    def __init__(self, total, stream=sys.stderr, interval=1.0):
+        """
+        :param total: Int, number of tasks.
+        :param stream: File to write progress lines to (None for silent).
+        :param interval: Float, seconds between progress lines.
+        """
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.start = time.time()
+        self.done = 0
+        self.failed = 0
+        self.latencies = []
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, elapsed, success):
+        with self.lock:
+            self.done += 1
+            self.failed += 0 if success else 1
+            self.latencies.append(elapsed)
+
+    def percentiles(self, ps=(50, 95, 99)):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return dict((p, None) for p in ps)
+        return dict((p, latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]) for p in ps)
+
+    def summary(self):
+        elapsed = time.time() - self.start
+        ps = self.percentiles()
+        return {C.CLI_TOTAL: self.total, C.CLI_DONE: self.done, C.CLI_FAILED: self.failed, C.API_ELAPSED: elapsed,
+                C.CLI_THROUGHPUT: self.done / max(elapsed, 1e-6),
+                C.CLI_LATENCY: dict(('p%d' % p, v) for p, v in ps.items())}
+
+    def line(self):
+        s = self.summary()
+        ps = s[C.CLI_LATENCY]
+
+        def ms(v):
+            return '-' if v is None else '%.0f' % (v * 1000)
+        return '%d/%d done, %d failed, %.1f/s, latency ms p50 %s p95 %s p99 %s' % (
+            s[C.CLI_DONE], s[C.CLI_TOTAL], s[C.CLI_FAILED], s[C.CLI_THROUGHPUT], ms(ps['p50']), ms(ps['p95']),
+            ms(ps['p99']))
+
+    def _run(self):
+        tty = getattr(self.stream, 'isatty', lambda: False)()
+        while not self._stop.wait(self.interval):
+            self.stream.write(('\r%s' if tty else '%s\n') % self.line())
+            self.stream.flush()
+
+    def __enter__(self):
+        if self.stream is not None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.stream.write('%s%s\n' % ('\r' if getattr(self.stream, 'isatty', lambda: False)() else '',
+                                          self.line()))
+            self.stream.flush()
+
+
+def run_tasks(tasks, workers=C.BULK_WORKERS, rate=None, log=None, progress_stream=sys.stderr, journal=None):
+    """
+    :param tasks: List of (keys, function[, uids]). function() does the work for every key in keys (one call can
+                  cover a batch) and returns an API response (see _outcome) or raises. uids, in the order of keys, are
+                  the objects the task creates or changes, for the journal.
+    :param workers: Int, tasks in flight at once.
+    :param rate: Float, tasks started per second at most.
+    :param log: File to write one JSON line per key to: {'key', 'success', 'msg', 'elapsed'}.
+    :param progress_stream: File for progress lines, None for silent.
+    :param journal: zenoss_journal.Journal. Keys it already holds are not run again (they are logged as successful
+                    with msg C.JOURNAL_SKIPPED); keys of successful tasks are added to it as they finish.
+    :return: Dict, the run summary (see Progress.summary), also written to log.
+    """
+    limiter = RateLimiter(rate)
+    skipped = []
+    if journal is not None:
+        # A task covering several keys runs again unless all of them are done.
+        skipped = [key for task in tasks if not journal.pending(task[0]) for key in task[0]]
+        tasks = [task for task in tasks if journal.pending(task[0])]
+
+    def run(keys, func, uids):
+        limiter.wait()
+        start = time.time()
+        try:
+            success, msg = _outcome(func())
+        except Exception as e:
+            # One bad row shouldn't stop the run; it's reported in the log.
+            success, msg = False, '%s: %s' % (type(e).__name__, e)
+        if success and journal is not None:
+            for key, uid in zip(keys, uids or [None] * len(keys)):
+                journal.record(key, uid=uid)
+        return keys, success, msg, time.time() - start
+
+    def report(keys, success, msg, elapsed):
+        for key in keys:
+            progress.record(elapsed, success)
+            if log is not None:
+                log.write(json.dumps({C.CLI_KEY: key, C.API_SUCCESS: success, C.API_MSG: msg,
+                                      C.API_ELAPSED: elapsed}) + '\n')
+
+    progress = Progress(len(skipped) + sum(len(task[0]) for task in tasks), stream=progress_stream)
+    with progress:
+        report(skipped, True, C.JOURNAL_SKIPPED, 0.0)
+        pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            futures = [pool.submit(run, task[0], task[1], task[2] if len(task) > 2 else None) for task in tasks]
+            for future in as_completed(futures):
+                report(*future.result())
+        finally:
+            pool.shutdown()
+
+    summary = progress.summary()
+    if log is not None:
+        log.write(json.dumps({C.CLI_SUMMARY: summary}) + '\n')
+        log.flush()
+    return summary
+
+
+########################################################################################################################
+#  Subcommands
+########################################################################################################################
+def _add_tasks(zap, rows, args, journal):
+    tasks = []
+    for row in rows:
+        row = dict(row)
+        hostname = row.pop(C.CLI_HOSTNAME, None) or row.pop(C.API_DEVICE_NAME)
+        device_class = row.pop(C.API_DEVICE_CLASS, None) or args.device_class
+        tasks.append(([hostname], lambda h=hostname, d=device_class, kw=row: zap.add_device(h, d, **kw),
+                      [zap.device_uid(hostname, device_class)]))
+    return tasks
+
+
+def _remove_tasks(zap, rows, args, journal):
+    uids = []
+    for row in rows:
+        uid = row.get(C.API_UID) or row[C.CLI_HOSTNAME]
+        if not uid.startswith('/'):
+            # A hostname: '/zport/dmd/Devices' + device class + '/devices/' + hostname
+            uid = ZenossAPI.device_uid(uid, args.device_class)
+        elif not uid.startswith(C.API_ENDPOINT):
+            uid = C.API_ENDPOINT + C.API_DEVICES + uid
+        uids.append(uid)
+    if journal is not None:
+        # Batch only what is left, so a resumed run sends full batches.
+        uids = journal.pending(uids)
+    # removeDevices takes a list, so each task removes a whole batch.
+    chunks = [uids[i:i+max(1, args.batch_size)] for i in range(0, len(uids), max(1, args.batch_size))]
+    return [(chunk, lambda c=chunk: zap.remove_devices(c, C.API_ENDPOINT + C.API_DEVICES), chunk) for chunk in chunks]
+
+
+def _bind_tasks(zap, rows, args, journal):
+    return [([row[C.API_UID]], lambda r=row: zap.bind_templates(r[C.API_UID], _split(r[C.CLI_TEMPLATES])),
+             [row[C.API_UID]]) for row in rows]
+
+
+def _monitor_tasks(zap, rows, args, journal):
+    tasks = []
+    for row in rows:
+        row = dict(row)
+        row.setdefault(C.CLI_WORKERS, 1)  # the CLI already runs one monitor per worker.
+        target_uid = row[C.CLI_TARGET_UID] = _device_class_uid(row.get(C.CLI_TARGET_UID) or args.device_class)
+        template_uid = '%s%s/%s' % (target_uid, C.API_TEMPLATE_TYPE_RRD_TEMPLATES, row[C.CLI_ZID])
+        tasks.append(([row[C.CLI_ZID]], lambda kw=row: zap.add_new_snmp_monitor(**kw), [template_uid]))
+    return tasks
+
+
+def _device_class_uid(device_class):
+    # A device class, e.g. '/Server/Linux' like --device-class, or '/Devices/Server/Linux', to its uid. Uids are
+    # kept as they are.
+    if device_class.startswith(C.API_ENDPOINT):
+        return device_class
+    if not device_class.startswith(C.API_DEVICES + '/'):
+        device_class = C.API_DEVICES + device_class
+    return C.API_ENDPOINT + device_class
+
+
+def _tracked(tracker, func, key):
+    results = func()
+    if isinstance(results, dict):
+        tracker.track(results, key=key)
+    return results
+
+
+def _export(zap, args, log):
+    exporter = ZenossExporter(zap, page_size=args.page_size, workers=args.workers, processes=args.processes)
+    start = time.time()
+    manifest = exporter.export_devices(args.path, uid=args.uid, info_keys=args.info_keys, fmt=args.format,
+                                       previous=args.previous)
+    log.write(json.dumps({C.CLI_SUMMARY: {C.EXPORT_PATH: manifest[C.EXPORT_PATH],
+                                          C.CLI_DONE: len(manifest[C.EXPORT_FINGERPRINTS]),
+                                          C.API_ELAPSED: time.time() - start}}) + '\n')
+    log.flush()
+    return 0
+
+
+def _mix(value):
+    # 'get_devices=1,get_device_info=4' -> {'get_devices': 1.0, 'get_device_info': 4.0}. A bare name weighs 1.
+    mix = {}
+    for item in _split(value):
+        name, _, weight = item.partition('=')
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def _load(zap, args, log):
+    stub = None
+    mib_uid = args.mib_uid
+    if zap is None:
+        stub = StubZenoss(devices=args.stub, latency=args.stub_latency)
+        stub.start()
+        mib_uid = mib_uid or C.API_ENDPOINT + C.API_MIBS + '/mibs/STUB-MIB'
+        stub.add_fake_mib(mib_uid)
+        zap = stub.api()
+    try:
+        generator = LoadGenerator(zap, mix=args.mix, workers=args.workers, rate=args.rate or None,
+                                  poisson=not args.even, device_class=_device_class_uid(args.device_class),
+                                  mib_uid=mib_uid, page_size=args.page_size, seed=args.seed)
+        report = generator.run(duration=args.duration, requests=args.requests)
+    finally:
+        if stub is not None:
+            stub.stop()
+    log.write(json.dumps({C.CLI_SUMMARY: report}) + '\n')
+    log.flush()
+    if not args.quiet:
+        sys.stderr.write(format_report(report) + '\n')
+    return 1 if report[C.LOAD_ERRORS] else 0
+
+
+def _api(args):
+    fin = open(args.credentials, 'r')
+    try:
+        credentials = yaml.safe_load(fin.read())
+    finally:
+        fin.close()
+    if '://' in args.host:
+        # A full URI, e.g. a zenoss_stub server: 'http://127.0.0.1:8080'
+        zap = ZenossAPI(credentials, host=urlparse(args.host).hostname, ssl_verify=not args.insecure)
+        zap.host = args.host.rstrip('/')
+        return zap
+    return ZenossAPI(credentials, host=args.host, ssl_verify=not args.insecure)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='zenoss5_api', description='Bulk changes through the Zenoss JSON API.')
+    parser.add_argument('--host', default=C.API_URI_HOST, help='Zenoss host name, or a full base URI')
+    parser.add_argument('--credentials', default='credentials.yaml', help='YAML file with {username: password}')
+    parser.add_argument('--insecure', action='store_true', help="don't verify the server's certificate")
+    parser.add_argument('--workers', type=int, default=C.BULK_WORKERS, help='calls in flight at once')
+    parser.add_argument('--rate', type=float, default=0, help='calls started per second at most (0: unlimited)')
+    parser.add_argument('--batch-size', type=int, default=C.BULK_BATCH_SIZE, help='devices per removeDevices call')
+    parser.add_argument('--log', default='-', help='JSON lines result log (default: stdout)')
+    parser.add_argument('--journal', help='checkpoint file: rows finished by earlier runs with the same file are '
+                                          'skipped, finished rows are added as they complete')
+    parser.add_argument('--quiet', action='store_true', help='no progress output on stderr')
+    parser.add_argument('--verbose', action='store_true')
+    subparsers = parser.add_subparsers(dest=C.CLI_COMMAND)
+
+    def bulk(name, help_text, columns):
+        sub = subparsers.add_parser(name, help=help_text, description='%s Input columns: %s' % (help_text, columns))
+        sub.add_argument('input', nargs='?', default='-', help='CSV, YAML or JSON file, or - for stdin (default)')
+        sub.add_argument('--input-format', choices=[C.CLI_FORMAT_CSV, C.CLI_FORMAT_YAML])
+        sub.add_argument('--device-class', default=C.API_DEVICE_CLASS_SERVER_LINUX,
+                         help='device class for rows without one (default: %(default)s)')
+        return sub
+
+    sub = bulk(C.CLI_COMMAND_ADD, 'Add devices.', 'hostname, [deviceClass], [any addDevice argument]')
+    sub.add_argument('--wait', type=float, metavar='SECONDS',
+                     help='wait up to SECONDS for the modeling jobs to finish')
+    bulk(C.CLI_COMMAND_REMOVE, 'Remove devices.', 'uid, or hostname (in --device-class)')
+    bulk(C.CLI_COMMAND_BIND, 'Bind templates to devices or device classes.',
+         'uid, templates (separated by ; or spaces)')
+    bulk(C.CLI_COMMAND_MONITOR, 'Create SNMP monitor templates (see ZenossAPI.add_new_snmp_monitor).',
+         'zid, oid, [target_uid (a device class or uid, default --device-class)], [threshold_max, threshold_min, '
+         'graph_units, rpn, ...]')
+
+    sub = subparsers.add_parser(C.CLI_COMMAND_EXPORT, help='Export the device inventory.')
+    sub.add_argument('path')
+    sub.add_argument('--uid', help='device class to export (default: all devices)')
+    sub.add_argument('--info-keys', type=lambda v: _split(v), help='also export getInfo with these keys')
+    sub.add_argument('--format', choices=[C.EXPORT_FORMAT_JSONL, C.EXPORT_FORMAT_PARQUET])
+    sub.add_argument('--previous', help='earlier export to reuse unchanged getInfo data from')
+    sub.add_argument('--page-size', type=int, default=C.EXPORT_PAGE_SIZE)
+    sub.add_argument('--processes', type=int, default=C.PIPELINE_PROCESSES,
+                     help='worker processes for building records (default: %(default)s, in this process)')
+
+    sub = subparsers.add_parser(C.CLI_COMMAND_LOAD, help='Generate read load and report latencies per method.',
+                                description='Closed loop (--workers callers back to back) by default, open loop at '
+                                            '--rate requests per second with --rate.')
+    sub.add_argument('--mix', type=_mix, help='read methods and weights (default: %s)' % ','.join(
+        '%s=%s' % item for item in sorted(C.LOAD_MIX.items())))
+    sub.add_argument('--duration', type=float, default=C.LOAD_DURATION, help='seconds (default: %(default)s)')
+    sub.add_argument('--requests', type=int, help='stop after this many requests')
+    sub.add_argument('--device-class', default=C.API_DEVICE_CLASS_SERVER_LINUX,
+                     help='device class to read (default: %(default)s)')
+    sub.add_argument('--mib-uid', help='MIB module uid for get_oid_mappings (left out of the mix without one)')
+    sub.add_argument('--page-size', type=int, default=C.API_KEYWORD_DEFAULTS[C.API_LIMIT])
+    sub.add_argument('--even', action='store_true', help='evenly spaced open loop arrivals instead of random')
+    sub.add_argument('--seed', type=int, help='random seed, for a repeatable call sequence')
+    sub.add_argument('--stub', type=int, metavar='DEVICES',
+                     help='run against an in-process stub server with DEVICES devices instead of --host')
+    sub.add_argument('--stub-latency', type=float, default=0.0, help="the stub's seconds per round trip")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    if not args.command:
+        parser.print_help()
+        return 2
+
+    zap = None if args.command == C.CLI_COMMAND_LOAD and args.stub else _api(args)
+    log = sys.stdout if args.log == '-' else open(args.log, 'w')
+    journal = Journal(args.journal, job=args.command) \
+        if args.journal and args.command not in (C.CLI_COMMAND_EXPORT, C.CLI_COMMAND_LOAD) else None
+    try:
+        if args.command == C.CLI_COMMAND_EXPORT:
+            return _export(zap, args, log)
+        if args.command == C.CLI_COMMAND_LOAD:
+            return _load(zap, args, log)
+
+        columns = {C.CLI_COMMAND_ADD: C.CLI_HOSTNAME, C.CLI_COMMAND_REMOVE: C.CLI_HOSTNAME,
+                   C.CLI_COMMAND_BIND: C.API_UID, C.CLI_COMMAND_MONITOR: C.CLI_ZID}
+        rows = read_rows(args.input, args.input_format, column=columns[args.command])
+        builders = {C.CLI_COMMAND_ADD: _add_tasks, C.CLI_COMMAND_REMOVE: _remove_tasks,
+                    C.CLI_COMMAND_BIND: _bind_tasks, C.CLI_COMMAND_MONITOR: _monitor_tasks}
+        tasks = builders[args.command](zap, rows, args, journal)
+
+        tracker = None
+        if args.command == C.CLI_COMMAND_ADD and args.wait:
+            tracker = JobTracker(zap, workers=args.workers)
+            tasks = [(keys, lambda f=func, k=keys[0]: _tracked(tracker, f, k), uids) for keys, func, uids in tasks]
+
+        summary = run_tasks(tasks, workers=args.workers, rate=args.rate, log=log,
+                            progress_stream=None if args.quiet else sys.stderr, journal=journal)
+
+        if tracker is not None:
+            done, not_done = tracker.wait_all(timeout=args.wait)
+            for jobid, job in list(done.items()) + list(not_done.items()):
+                log.write(json.dumps({C.CLI_KEY: tracker.keys.get(jobid), C.API_JOB_ID: jobid,
+                                      C.API_STATUS: job.get(C.API_STATUS)}) + '\n')
+            log.flush()
+            if not_done or [j for j in done.values() if j.get(C.API_STATUS) != C.API_JOB_STATUS_SUCCESS]:
+                return 1
+        return 1 if summary[C.CLI_FAILED] else 0
+    finally:
+        if journal is not None:
+            journal.close()
+        if log is not sys.stdout:
+            log.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+import os
+import json
+import threading
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+
+class TemplateCrawler(object):
+    """
+    Breadth-first walk of getTemplates -> (getDataSources, getDataPoints, getThresholds, getGraphs) ->
+    getGraphPoints. Nodes are yielded as soon as their parent's listing comes back; each node is a dict of
+    {'kind', 'uid', 'parent', 'data'} where data is the listing record from the API.
+    """
+    def __init__(self, api, workers=C.BULK_WORKERS, limits=None, checkpoint=None, checkpoint_every=100):
+        """
+        :param api: ZenossAPI
+        :param workers: Int, listing calls in flight at once.
+        :param limits: Dict of {method: Int}, e.g. {C.API_METHOD_GET_GRAPH_POINTS: 2}, caps concurrent calls of one
+                       router method below 'workers'.
+        :param checkpoint: String, path of a checkpoint file. An existing checkpoint is resumed: nodes recorded in
+                           it are not yielded again. It is removed once the crawl completes.
+        :param checkpoint_every: Int, save the checkpoint after this many completed listing calls.
+        """
+        self.api = api
+        self.workers = max(1, workers)
+        self.limits = dict((method, threading.BoundedSemaphore(cap)) for method, cap in (limits or {}).items())
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+
+        # The listing calls under each node kind: (router method, child kind, function of the node uid).
+        self.expansions = {
+            C.DIFF_KIND_ROOT: [(C.API_METHOD_GET_TEMPLATES, C.DIFF_KIND_TEMPLATE, self._get_templates)],
+            C.DIFF_KIND_TEMPLATE: [(C.API_METHOD_GET_DATA_SOURCES, C.DIFF_KIND_DATA_SOURCE, api.get_data_sources),
+                                   (C.API_METHOD_GET_DATA_POINTS, C.DIFF_KIND_DATA_POINT, api.get_data_points),
+                                   (C.API_METHOD_GET_THRESHOLDS, C.DIFF_KIND_THRESHOLD, api.get_thresholds),
+                                   (C.API_METHOD_GET_GRAPHS, C.DIFF_KIND_GRAPH, api.get_graphs)],
+            C.DIFF_KIND_GRAPH: [(C.API_METHOD_GET_GRAPH_POINTS, C.DIFF_KIND_GRAPH_POINT, api.get_graph_points)],
+        }
+
+    def _get_templates(self, uid):
+        # getTemplates returns organizer nodes with the templates as children; only the templates are crawled.
+        stack = list(self.api.get_templates(uid)[C.API_RESULT] or [])
+        templates = []
+        while stack:
+            node = stack.pop()
+            stack.extend(node.get(C.API_CHILDREN) or [])
+            if C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/' in node.get(C.API_UID, ''):
+                templates.append(dict((k, v) for k, v in node.items() if k != C.API_CHILDREN))
+        return {C.API_RESULT: {C.API_DATA: templates, C.API_SUCCESS: True}}
+
+    def _list(self, method, func, uid):
+        semaphore = self.limits.get(method)
+        if semaphore:
+            semaphore.acquire()
+        try:
+            results = func(uid)
+        finally:
+            if semaphore:
+                semaphore.release()
+        if method == C.API_METHOD_GET_GRAPHS:
+            # No 'success'/'data' wrapper on this one (see ZenossAPI.get_graphs).
+            return results[C.API_RESULT] or []
+        data, success = self.api._get_result_data(results)
+        return data or []
+
+    def _parent(self, kind, uid, listed_under):
+        # getDataPoints lists every data point of the template; their real parent is the data source.
+        if kind == C.DIFF_KIND_DATA_POINT and '/%s/' % C.API_PATH_PART_DATA_POINTS in uid:
+            return uid.rsplit('/%s/' % C.API_PATH_PART_DATA_POINTS, 1)[0]
+        return listed_under
+
+    def _load_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return None
+        fin = open(self.checkpoint, 'r')
+        try:
+            return json.load(fin)
+        finally:
+            fin.close()
+
+    def _save_checkpoint(self, visited, pending):
+        fout = open(self.checkpoint + '.tmp', 'w')
+        try:
+            json.dump({C.CRAWL_VISITED: sorted(visited), C.CRAWL_PENDING: list(pending)}, fout)
+        finally:
+            fout.close()
+        os.rename(self.checkpoint + '.tmp', self.checkpoint)
+
+    def crawl(self, roots=None):
+        """
+        :param roots: List of (kind, uid) to start from. Default: every template under /zport/dmd/Devices.
+        :return: Generator of node dicts, breadth-first.
+        """
+        state = self._load_checkpoint()
+        if state:
+            visited = set(state[C.CRAWL_VISITED])
+            pending = deque(tuple(p) for p in state[C.CRAWL_PENDING])
+        else:
+            visited = set()
+            pending = deque()
+            for kind, uid in roots or [(C.DIFF_KIND_ROOT, C.API_ENDPOINT + C.API_DEVICES)]:
+                if kind != C.DIFF_KIND_ROOT:
+                    visited.add(uid)
+                    yield {C.DIFF_KIND: kind, C.API_UID: uid, C.CRAWL_PARENT: None, C.DIFF_NODE_DATA: None}
+                for method, child_kind, func in self.expansions.get(kind, []):
+                    pending.append((method, child_kind, uid))
+
+        funcs = dict((method, func) for expansions in self.expansions.values() for method, kind, func in expansions)
+        in_flight = {}
+        completed = 0
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while pending or in_flight:
+                # Submitting in FIFO order keeps the walk (roughly) breadth-first.
+                while pending and len(in_flight) < self.workers * 2:
+                    task = pending.popleft()
+                    method, child_kind, uid = task
+                    in_flight[pool.submit(self._list, method, funcs[method], uid)] = task
+
+                done, not_done = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    method, child_kind, listed_under = in_flight.pop(future)
+                    for record in future.result():
+                        uid = record.get(C.API_UID)
+                        if not uid or uid in visited:
+                            continue
+                        visited.add(uid)
+                        for child_method, grandchild_kind, func in self.expansions.get(child_kind, []):
+                            pending.append((child_method, grandchild_kind, uid))
+                        yield {C.DIFF_KIND: child_kind, C.API_UID: uid,
+                               C.CRAWL_PARENT: self._parent(child_kind, uid, listed_under), C.DIFF_NODE_DATA: record}
+                    completed += 1
+                    if self.checkpoint and completed % self.checkpoint_every == 0:
+                        # In-flight calls go back in the queue so a resumed crawl re-issues them.
+                        self._save_checkpoint(visited, list(in_flight.values()) + list(pending))
+        finally:
+            pool.shutdown(wait=False)
+
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+
+class TemplateBlueprint(object):
+    """
+    The structure of one template (data sources, data points, thresholds, graphs and graph points), read once and
+    replayed onto any number of device classes. Template object uids are deterministic
+    (<class>/rrdTemplates/<template>/datasources/<ds>/...), so replay computes them instead of listing them back.
+    """
+    # Listing fields that are identity, type or computed values rather than settable properties.
+    SKIP_KEYS = ('uid', 'id', 'name', 'newId', 'type', 'meta_type', 'inspector_type', 'leaf', 'children',
+                 'source', 'availableParsers', 'testable', 'dataPoints', 'dpName', 'rrdVariables', 'graphPoints',
+                 'fakeGraphCommands', 'dsName')
+
+    def __init__(self, uid, nodes):
+        self.uid = uid
+        self.name = uid.rstrip('/').split('/')[-1]
+        self.nodes = dict((kind, []) for kind in (C.DIFF_KIND_DATA_SOURCE, C.DIFF_KIND_DATA_POINT,
+                                                  C.DIFF_KIND_THRESHOLD, C.DIFF_KIND_GRAPH, C.DIFF_KIND_GRAPH_POINT))
+        for node in nodes:
+            if node[C.DIFF_KIND] in self.nodes:
+                self.nodes[node[C.DIFF_KIND]].append(node)
+
+    @classmethod
+    def read(cls, api, uid, workers=C.BULK_WORKERS):
+        """
+        :param api: ZenossAPI
+        :param uid: String, the source template uid.
+        :param workers: Int, listing calls in flight at once.
+        :return: TemplateBlueprint
+        """
+        crawler = TemplateCrawler(api, workers=workers)
+        return cls(uid, list(crawler.crawl(roots=[(C.DIFF_KIND_TEMPLATE, uid)])))
+
+    def _settable(self, data):
+        return dict((k, v) for k, v in (data or {}).items()
+                    if k not in self.SKIP_KEYS and (v is None or isinstance(v, (str, int, float, bool))))
+
+    def _rebase(self, uid, template_uid):
+        return template_uid + uid[len(self.uid):] if uid.startswith(self.uid) else uid
+
+    def _data_point_uid(self, ref, template_uid):
+        # Thresholds and graph points refer to data points as uids or as '<datasource>_<datapoint>' names.
+        for dp in self.nodes[C.DIFF_KIND_DATA_POINT]:
+            ds_name = dp[C.CRAWL_PARENT].split('/')[-1]
+            if ref in (dp[C.API_UID], '%s_%s' % (ds_name, dp[C.API_UID].split('/')[-1])):
+                return self._rebase(dp[C.API_UID], template_uid)
+        return self._rebase(ref, template_uid)
+
+    def apply(self, api, target_uid, workers=C.BULK_WORKERS):
+        """
+        :param api: ZenossAPI
+        :param target_uid: String, the device class to create the template on, e.g. C.API_DEVICES_SERVER_LINUX
+        :param workers: Int, calls in flight at once within each step.
+        :return: String, the new template's uid.
+        """
+        if not target_uid.startswith(C.API_ENDPOINT):
+            target_uid = C.API_ENDPOINT + target_uid
+        template_uid = target_uid + C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/' + self.name
+        api.add_template(self.name, target_uid, validate_success=True)
+
+        pool = ThreadPoolExecutor(max_workers=max(1, workers))
+
+        def run(calls):
+            # Calls within a step don't depend on each other; steps run in order.
+            for future in [pool.submit(func, *args, **kwargs) for func, args, kwargs in calls]:
+                future.result()
+
+        try:
+            run([(api.add_data_source, (template_uid, ds[C.API_UID].split('/')[-1]),
+                  {'data_source_type': ds[C.DIFF_NODE_DATA].get(C.API_TYPE), 'validate_success': True})
+                 for ds in self.nodes[C.DIFF_KIND_DATA_SOURCE]])
+            # Zenoss creates a data point named after its data source; only the others need adding.
+            run([(api.add_data_point, (self._rebase(dp[C.CRAWL_PARENT], template_uid), dp[C.API_UID].split('/')[-1]),
+                  {'validate_success': True})
+                 for dp in self.nodes[C.DIFF_KIND_DATA_POINT]
+                 if dp[C.API_UID].split('/')[-1] != dp[C.CRAWL_PARENT].split('/')[-1]])
+            run([(api.set_template_info, (self._rebase(node[C.API_UID], template_uid),),
+                  dict(self._settable(node[C.DIFF_NODE_DATA]), validate_success=True))
+                 for kind in (C.DIFF_KIND_DATA_SOURCE, C.DIFF_KIND_DATA_POINT)
+                 for node in self.nodes[kind] if self._settable(node[C.DIFF_NODE_DATA])])
+
+            run([(api.add_threshold, (template_uid, t[C.DIFF_NODE_DATA].get(C.API_TYPE), t[C.API_UID].split('/')[-1],
+                                      [self._data_point_uid(ref, template_uid)
+                                       for ref in t[C.DIFF_NODE_DATA].get(C.API_DATA_POINTS) or []]),
+                  {'validate_success': True})
+                 for t in self.nodes[C.DIFF_KIND_THRESHOLD]] +
+                [(api.add_graph_definition, (template_uid, g[C.API_UID].split('/')[-1]), {'validate_success': True})
+                 for g in self.nodes[C.DIFF_KIND_GRAPH]])
+            run([(api.set_template_info, (self._rebase(t[C.API_UID], template_uid),),
+                  dict(self._settable(t[C.DIFF_NODE_DATA]), validate_success=True))
+                 for t in self.nodes[C.DIFF_KIND_THRESHOLD] if self._settable(t[C.DIFF_NODE_DATA])])
+
+            run([(api.add_data_point_to_graph, (self._data_point_uid(gp[C.DIFF_NODE_DATA][C.CRAWL_DP_NAME],
+                                                                     template_uid),
+                                                self._rebase(gp[C.CRAWL_PARENT], template_uid)),
+                  {'include_thresholds': True, 'validate_success': True})
+                 for gp in self.nodes[C.DIFF_KIND_GRAPH_POINT] if gp[C.DIFF_NODE_DATA].get(C.CRAWL_DP_NAME)])
+            run([(api.set_template_info, (self._rebase(node[C.API_UID], template_uid),),
+                  dict(self._settable(node[C.DIFF_NODE_DATA]), validate_success=True))
+                 for kind in (C.DIFF_KIND_GRAPH, C.DIFF_KIND_GRAPH_POINT)
+                 for node in self.nodes[kind] if self._settable(node[C.DIFF_NODE_DATA])])
+        except Exception:
+            # Whatever stopped it (a failed call, a dropped connection, a bad listing record), the half-built
+            # template goes.
+            api.delete_template(template_uid)
+            raise
+        finally:
+            pool.shutdown()
+        return template_uid
+
+
+def clone_template(api, src_uid, target_uids, workers=C.BULK_WORKERS):
+    """
+    :param api: ZenossAPI
+    :param src_uid: String, the template to copy.
+    :param target_uids: String or list of device class uids to copy it to.
+    :param workers: Int, targets built at once.
+    :return: Dict of {target_uid: new template uid, or the ZenossError or requests exception that stopped it}
+    """
+    blueprint = TemplateBlueprint.read(api, src_uid, workers=workers)
+    target_uids = api._non_str_iterable(target_uids)
+
+    def apply(target_uid):
+        try:
+            return blueprint.apply(api, target_uid, workers=1)
+        except (ZenossError, requests.exceptions.RequestException) as e:
+            return e
+
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        return dict(zip(target_uids, pool.map(apply, target_uids)))
+    finally:
+        pool.shutdown()
@@ -0,0 +1,210 @@
+import json
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+
+# change is one of C.DIFF_ADDED, C.DIFF_REMOVED or C.DIFF_MODIFIED. before/after are the listing records, or the
+# detail records when details were compared.
+Change = namedtuple('Change', ['kind', 'uid', 'change', 'before', 'after'])
+
+# getTree/getTemplates decorate nodes with display values (e.g. device counts in 'text') that aren't configuration.
+IGNORED_KEYS = ('text', 'children', 'qtip', 'iconCls', 'expanded')
+
+
+def _node(kind, data, children=None, ignore_keys=IGNORED_KEYS):
+    data = dict((k, v) for k, v in (data or {}).items() if k not in ignore_keys)
+    children = children or {}
+    digest = hashlib.sha1(kind.encode('utf-8'))
+    digest.update(json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    for key in sorted(children):
+        digest.update(key.encode('utf-8'))
+        digest.update(children[key][C.DIFF_HASH].encode('utf-8'))
+    return {C.DIFF_KIND: kind, C.DIFF_HASH: digest.hexdigest(), C.DIFF_NODE_DATA: data, C.API_CHILDREN: children}
+
+
+def _walk(nodes):
+    stack = list(nodes or [])
+    while stack:
+        node = stack.pop()
+        stack.extend(node.get(C.API_CHILDREN) or [])
+        yield node
+
+
+class ConfigSnapshot(object):
+    """
+    A Merkle tree of the Zenoss configuration. Every node carries the hash of its own listing record plus the hashes
+    of its children, so two snapshots can be compared top-down and any subtree with an equal hash skipped.
+    Detail records (getDataSourceDetails/getThresholdDetails) are only kept for objects diff() had to look at.
+    """
+    def __init__(self, root, details=None):
+        self.root = root
+        self.details = details or {}
+
+    def save(self, path):
+        fout = open(path, 'w')
+        try:
+            json.dump({C.DIFF_ROOT: self.root, C.DIFF_DETAILS: self.details}, fout, separators=(',', ':'))
+        finally:
+            fout.close()
+
+    @classmethod
+    def load(cls, path):
+        fin = open(path, 'r')
+        try:
+            obj = json.load(fin)
+        finally:
+            fin.close()
+        return cls(obj[C.DIFF_ROOT], obj.get(C.DIFF_DETAILS))
+
+    @classmethod
+    def capture(cls, api, bindings=True, workers=C.BULK_WORKERS):
+        """
+        :param api: ZenossAPI
+        :param bindings: Boolean, include the templates bound to each device class (one call per class).
+        :param workers: Int, calls in flight at once.
+        :return: ConfigSnapshot of the live configuration.
+        """
+        device_class_root = C.API_ENDPOINT + C.API_DEVICES
+        tree = api.get_tree(device_class_root, validate_success=False)[C.API_RESULT]
+        tree = tree if isinstance(tree, list) else [tree]
+        class_uids = [n[C.API_UID] for n in _walk(tree) if C.API_UID in n]
+
+        templates = api.get_templates(device_class_root)[C.API_RESULT]
+        template_nodes = dict((n[C.API_UID], n) for n in _walk(templates)
+                              if C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/' in n.get(C.API_UID, ''))
+
+        pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            template_futures = dict((uid, pool.submit(cls._capture_template, api, uid, node))
+                                    for uid, node in template_nodes.items())
+            binding_futures = dict((uid, pool.submit(api.get_bound_templates, uid))
+                                   for uid in (class_uids if bindings else []))
+
+            children = {}
+            for node in _walk(tree):
+                if C.API_UID in node:
+                    children[node[C.API_UID]] = _node(C.DIFF_KIND_DEVICE_CLASS, node)
+            for uid, future in template_futures.items():
+                children[uid] = future.result()
+            for uid, future in binding_futures.items():
+                data, success = api._get_result_data(future.result())
+                key = uid + '#' + C.DIFF_KIND_BINDING
+                children[key] = _node(C.DIFF_KIND_BINDING, {C.API_UID: uid, C.API_DATA: sorted(data or [])})
+        finally:
+            pool.shutdown()
+        return cls(_node(C.DIFF_KIND_ROOT, {}, children))
+
+    @staticmethod
+    def _capture_template(api, uid, node):
+        def listing(results):
+            data, success = api._get_result_data(results)
+            return data or []
+
+        data_points = listing(api.get_data_points(uid))
+        sources = {}
+        for ds in listing(api.get_data_sources(uid)):
+            # Data points live under their data source: .../datasources/<ds>/datapoints/<dp>
+            prefix = ds[C.API_UID] + '/'
+            dps = dict((dp[C.API_UID], _node(C.DIFF_KIND_DATA_POINT, dp)) for dp in data_points
+                       if dp[C.API_UID].startswith(prefix))
+            sources[ds[C.API_UID]] = _node(C.DIFF_KIND_DATA_SOURCE, ds, dps)
+
+        thresholds = dict((t[C.API_UID], _node(C.DIFF_KIND_THRESHOLD, t)) for t in listing(api.get_thresholds(uid)))
+
+        # getGraphs has no 'success'/'data' wrapper (see ZenossAPI.get_graphs).
+        graphs = {}
+        for graph in api.get_graphs(uid)[C.API_RESULT] or []:
+            points = dict((p[C.API_UID], _node(C.DIFF_KIND_GRAPH_POINT, p))
+                          for p in listing(api.get_graph_points(graph[C.API_UID])))
+            graphs[graph[C.API_UID]] = _node(C.DIFF_KIND_GRAPH, graph, points)
+
+        children = {}
+        for group in (sources, thresholds, graphs):
+            children.update(group)
+        return _node(C.DIFF_KIND_TEMPLATE, node, children)
+
+
+def diff(old, new, api=None, workers=C.BULK_WORKERS):
+    """
+    :param old: ConfigSnapshot, e.g. yesterday's.
+    :param new: ConfigSnapshot, e.g. today's.
+    :param api: ZenossAPI, when given, modified data sources and thresholds are compared on their detail records.
+                Details are only fetched for those objects, cached in new.details, and used as the 'before' side the
+                next time new is diffed as the old snapshot.
+    :param workers: Int, detail calls in flight at once.
+    :return: List of Change
+    """
+    changes = []
+    stack = [(old.root, new.root)]
+    while stack:
+        before, after = stack.pop()
+        if before[C.DIFF_HASH] == after[C.DIFF_HASH]:
+            continue
+        if before[C.DIFF_NODE_DATA] != after[C.DIFF_NODE_DATA]:
+            uid = after[C.DIFF_NODE_DATA].get(C.API_UID)
+            changes.append(Change(after[C.DIFF_KIND], uid, C.DIFF_MODIFIED, before[C.DIFF_NODE_DATA],
+                                  after[C.DIFF_NODE_DATA]))
+
+        old_children, new_children = before[C.API_CHILDREN], after[C.API_CHILDREN]
+        for key in sorted(set(old_children) - set(new_children)):
+            changes.append(Change(old_children[key][C.DIFF_KIND],
+                                  old_children[key][C.DIFF_NODE_DATA].get(C.API_UID, key), C.DIFF_REMOVED,
+                                  old_children[key][C.DIFF_NODE_DATA], None))
+        for key in sorted(set(new_children) - set(old_children)):
+            changes.append(Change(new_children[key][C.DIFF_KIND],
+                                  new_children[key][C.DIFF_NODE_DATA].get(C.API_UID, key), C.DIFF_ADDED, None,
+                                  new_children[key][C.DIFF_NODE_DATA]))
+        for key in set(old_children) & set(new_children):
+            stack.append((old_children[key], new_children[key]))
+
+    if api is not None:
+        changes = _compare_details(old, new, changes, api, workers)
+    return changes
+
+
+def _compare_details(old, new, changes, api, workers):
+    fetchers = {C.DIFF_KIND_DATA_SOURCE: api.get_data_source_details,
+                C.DIFF_KIND_THRESHOLD: api.get_threshold_details}
+
+    def details(kind, uid):
+        result = dict(fetchers[kind](uid)[C.API_RESULT])
+        result.pop(C.API_SUCCESS, None)
+        return result
+
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = dict((i, pool.submit(details, c.kind, c.uid)) for i, c in enumerate(changes)
+                       if c.kind in fetchers and c.change != C.DIFF_REMOVED)
+        compared = []
+        for i, change in enumerate(changes):
+            if i not in futures:
+                compared.append(change)
+                continue
+            try:
+                new.details[change.uid] = futures[i].result()
+            except ZenossError:
+                compared.append(change)
+                continue
+            if change.change == C.DIFF_MODIFIED and old.details.get(change.uid, new.details[change.uid]) != \
+                    new.details[change.uid]:
+                compared.append(Change(change.kind, change.uid, change.change, old.details[change.uid],
+                                       new.details[change.uid]))
+            else:
+                compared.append(change)
+    finally:
+        pool.shutdown()
+
+    # Unchanged objects keep the details cached on earlier runs.
+    removed = set(c.uid for c in changes if c.change == C.DIFF_REMOVED)
+    for uid, details in old.details.items():
+        if uid not in removed:
+            new.details.setdefault(uid, details)
+    return compared
@@ -0,0 +1,95 @@
+import threading
+
+try:
+    from zenoss5_api.CONSTS import C
+except ImportError:
+    from CONSTS import C
+
+
+class EventPoller(object):
+    """
+    Incremental event polling: each poll only returns the events that are new or changed since the last one.
+
+        poller = EventPoller(zap, params={'severity': [5, 4]})
+        for event in poller.follow():
+            ...
+
+    For each watched field (lastTime for new occurrences, stateChange for acknowledge/close) the poller keeps the
+    newest value it has seen, its watermark. A poll reads the events newest first by each field with
+    ZenossAPI.iter_events and stops at the watermark the previous poll started from, so it costs a page or so however
+    many events there are. iter_events can skip an event that moves across a page boundary while it reads; reading
+    back one poll further means each range is read by two polls, and an event skipped by one is returned by the
+    next. Events read again are only returned if they changed (the watched fields, eventState or count). Save
+    poller.watermark to pick up where a previous process left off; the events at the watermark are returned once more
+    then.
+    """
+    # Event times only go down to the second; these catch a second change within the same second.
+    versioned = (C.API_EVENT_STATE, C.API_COUNT)
+
+    def __init__(self, api, params=None, uid=None, fields=(C.API_LAST_TIME, C.API_STATE_CHANGE), watermark=None,
+                 keys=None, page_size=C.EVENTS_PAGE_SIZE):
+        """
+        :param api: ZenossAPI
+        :param params: Dict, the event console filter (see ZenossAPI.iter_events).
+        :param uid: String, only events of this device or organizer.
+        :param fields: Tuple of event fields whose change makes an event show up again.
+        :param watermark: Dict of {field: value}, from an earlier poller's watermark. Without one, the first poll
+                          returns every matching event.
+        :param keys: List of event fields to return. evid and the watched fields are always included.
+        :param page_size: Int, events per query call.
+        """
+        self.api = api
+        self.params = params
+        self.uid = uid
+        self.fields = tuple(fields)
+        self.watermark = dict(watermark or {})
+        self.floor = dict(self.watermark)  # where the next poll reads back to
+        self.keys = keys if keys is None else \
+            list(keys) + [f for f in self.fields + self.versioned if f not in keys]
+        self.page_size = page_size
+        self.seen = {}  # evid -> field values last returned, for the events at or above the floors
+
+    def _version(self, event):
+        return tuple(event.get(field) for field in self.fields + self.versioned)
+
+    def poll(self):
+        """
+        :return: List of the events that are new or changed since the last poll, oldest first by the first field.
+        """
+        changed = {}
+        started = dict(self.watermark)
+        # Without a watermark every event is new, and one pass finds them all.
+        for field in self.fields if self.watermark else self.fields[:1]:
+            for event in self.api.iter_events(params=self.params, since=self.floor.get(field), uid=self.uid,
+                                              sort=field, keys=self.keys, page_size=self.page_size):
+                evid = event.get(C.API_EVID)
+                if self.seen.get(evid) != self._version(event):
+                    changed[evid] = event
+
+        for evid, event in changed.items():
+            self.seen[evid] = self._version(event)
+            for field, value in zip(self.fields, self.seen[evid]):
+                if value is not None and (self.watermark.get(field) is None or value > self.watermark[field]):
+                    self.watermark[field] = value
+        # The next poll reads back to where this one started. After a first poll that read everything, that would be
+        # everything again, so it starts at the watermark instead.
+        self.floor = started if started else dict(self.watermark)
+        # Only events at or above a floor can be read again unchanged; anything older that changes moves past it.
+        self.seen = dict((evid, version) for evid, version in self.seen.items()
+                         if [v for f, v in zip(self.fields, version)
+                             if v is not None and (self.floor.get(f) is None or v >= self.floor[f])])
+        first = self.fields[0]
+        return sorted([e for e in changed.values() if e.get(first) is not None], key=lambda e: e[first]) + \
+            [e for e in changed.values() if e.get(first) is None]
+
+    def follow(self, interval=C.EVENTS_POLL_INTERVAL, stop=None):
+        """
+        :param interval: Float, seconds between polls.
+        :param stop: threading.Event that ends the generator (checked between polls).
+        :return: Generator of new or changed events, as they are polled.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            for event in self.poll():
+                yield event
+            stop.wait(interval)
@@ -0,0 +1,308 @@
+import os
+import json
+import gzip
+import time
+import sqlite3
+import logging
+import tempfile
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_api import ZenossAPI
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_pipeline import ProcessStage
+except ImportError:
+    from CONSTS import C
+    from zenoss_api import ZenossAPI
+    from zenoss_base import ZenossError
+    from zenoss_pipeline import ProcessStage
+
+
+class _JsonlWriter(object):
+    def __init__(self, path):
+        self.fout = gzip.open(path, 'wt') if path.endswith('.gz') else open(path, 'w')
+
+    def write(self, records):
+        for record in records:
+            self.fout.write(json.dumps(record, separators=(',', ':')))
+            self.fout.write('\n')
+
+    def close(self):
+        self.fout.close()
+
+
+class _ParquetWriter(object):
+    # Nested Zenoss records don't have a fixed schema, so the columns are the fields we index on plus the full record
+    # as a JSON string. Each write() becomes one row group.
+    COLUMNS = [C.EXPORT_KIND, C.API_UID, C.API_NAME, C.EXPORT_FINGERPRINT, C.EXPORT_RECORD]
+
+    def __init__(self, path):
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in self.COLUMNS])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, records):
+        records = list(records)
+        if not records:
+            return
+        columns = dict((column, []) for column in self.COLUMNS)
+        for record in records:
+            for column in self.COLUMNS[:-1]:
+                columns[column].append(record.get(column))
+            columns[C.EXPORT_RECORD].append(json.dumps(record, separators=(',', ':')))
+        self.writer.write_table(pyarrow.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def iter_export(path):
+    """
+    :param path: String, a file written by ZenossExporter.
+    :return: Generator of the exported records (dicts), in file order.
+    """
+    if path.endswith('.parquet'):
+        if pyarrow is None:
+            raise ZenossError(C.ERROR_EXPORT_UNKNOWN_FORMAT_S % C.EXPORT_FORMAT_PARQUET)
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for i in range(parquet_file.num_row_groups):
+            for record in parquet_file.read_row_group(i, columns=[C.EXPORT_RECORD]).column(0).to_pylist():
+                yield json.loads(record)
+    else:
+        fin = gzip.open(path, 'rt') if path.endswith('.gz') else open(path, 'r')
+        try:
+            for line in fin:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            fin.close()
+
+
+def device_records(devices, transform=None):
+    """
+    The CPU-bound part of an export page. Runs in a worker process when the exporter has processes > 0.
+    :param devices: List of device dicts from one getDevices page.
+    :param transform: Function of the list of records returning the list to export, e.g. to add derived fields or
+                      drop devices. Must be picklable (module level) when processes are used.
+    :return: List of export records.
+    """
+    records = [{C.EXPORT_KIND: C.EXPORT_KIND_DEVICE, C.API_UID: device[C.API_UID], C.API_NAME: device.get(C.API_NAME),
+                C.EXPORT_FINGERPRINT: ZenossAPI.fingerprint(device), C.EXPORT_LISTING: device} for device in devices]
+    return transform(records) if transform else records
+
+
+class _PreviousInfo(object):
+    # The getInfo data of an earlier export, spilled to a temporary SQLite file so that memory stays bounded however
+    # many devices were exported.
+    def __init__(self, path):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.db = sqlite3.connect(self.path)
+        try:
+            self.db.execute('CREATE TABLE info (uid TEXT PRIMARY KEY, fingerprint TEXT, info TEXT)')
+            self.db.executemany('INSERT OR REPLACE INTO info VALUES (?, ?, ?)', (
+                (record[C.API_UID], record.get(C.EXPORT_FINGERPRINT), json.dumps(record[C.EXPORT_INFO]))
+                for record in iter_export(path)
+                if record.get(C.EXPORT_KIND) == C.EXPORT_KIND_DEVICE and C.EXPORT_INFO in record))
+            self.db.commit()
+        except BaseException:
+            self.close()
+            raise
+
+    def get(self, uid, fingerprint):
+        """
+        :return: The device's info from the earlier export if its listing record had the same fingerprint, else None.
+        """
+        row = self.db.execute('SELECT info FROM info WHERE uid = ? AND fingerprint = ?', (uid, fingerprint)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self):
+        self.db.close()
+        os.remove(self.path)
+
+
+def read_manifest(path):
+    try:
+        fin = open(path + C.EXPORT_MANIFEST_SUFFIX, 'r')
+    except IOError:
+        return None
+    try:
+        return json.load(fin)
+    finally:
+        fin.close()
+
+
+class ZenossExporter(object):
+    def __init__(self, api, page_size=C.EXPORT_PAGE_SIZE, workers=C.BULK_WORKERS, processes=C.PIPELINE_PROCESSES):
+        """
+        :param api: ZenossAPI
+        :param page_size: Int, devices per getDevices call.
+        :param workers: Int, page fetches (and getInfo calls within a page) in flight at once.
+        :param processes: Int, worker processes for building records from fetched pages (see device_records).
+                          0 builds them in this process, None uses every CPU.
+        """
+        self.api = api
+        self.page_size = page_size
+        self.workers = max(1, workers)
+        self.processes = processes
+
+    def _output_path(self, path, fmt):
+        # Parquet when pyarrow is installed, gzipped JSON lines otherwise. The extension tells iter_export which.
+        if fmt is None:
+            if path.endswith('.parquet') or path.endswith('.jsonl') or path.endswith('.gz'):
+                return path
+            fmt = C.EXPORT_FORMAT_PARQUET if pyarrow is not None else C.EXPORT_FORMAT_JSONL
+        if fmt == C.EXPORT_FORMAT_PARQUET and pyarrow is not None:
+            return path if path.endswith('.parquet') else path + '.parquet'
+        elif fmt == C.EXPORT_FORMAT_JSONL:
+            return path if path.endswith('.gz') or path.endswith('.jsonl') else path + '.jsonl.gz'
+        raise ZenossError(C.ERROR_EXPORT_UNKNOWN_FORMAT_S % fmt)
+
+    def _writer(self, path):
+        if path.endswith('.parquet'):
+            if pyarrow is None:
+                raise ZenossError(C.ERROR_EXPORT_UNKNOWN_FORMAT_S % C.EXPORT_FORMAT_PARQUET)
+            return _ParquetWriter(path)
+        return _JsonlWriter(path)
+
+    def _get_devices_page(self, uid, start, keys):
+        results = self.api.get_devices(validate_success=True, uid=uid, start=start, limit=self.page_size,
+                                       sort=C.API_KEYWORD_DEFAULTS[C.API_SORT],
+                                       direction=C.API_KEYWORD_DEFAULTS[C.API_DIR], keys=keys)
+        return results[C.API_RESULT].get(C.API_DEVICES_KEY) or [], results[C.API_RESULT].get(C.API_TOTAL_COUNT, 0)
+
+    def iter_device_pages(self, pool, uid=None, keys=None):
+        """
+        Page through getDevices with up to 'workers' pages in flight, yielding pages in order. Only the pages in
+        flight are held in memory.
+        :param pool: ThreadPoolExecutor to fetch on.
+        :param uid: String, the device class to list (default: all devices).
+        :param keys: List, device attributes to include in the listing.
+        :return: Generator of lists of device dicts.
+        """
+        devices, total = self._get_devices_page(uid, 0, keys)
+        yield devices
+
+        starts = iter(range(self.page_size, total, self.page_size))
+        in_flight = deque()
+        for start in starts:
+            in_flight.append(pool.submit(self._get_devices_page, uid, start, keys))
+            if len(in_flight) >= self.workers:
+                break
+        while in_flight:
+            devices, _ = in_flight.popleft().result()
+            for start in starts:
+                in_flight.append(pool.submit(self._get_devices_page, uid, start, keys))
+                break
+            yield devices
+
+    def _get_device_info(self, uid, info_keys):
+        results = self.api.get_device_info(uid, keys=info_keys, validate_success=True)
+        data, success = self.api._get_result_data(results)
+        return data
+
+    def export_devices(self, path, uid=None, listing_keys=None, info_keys=None, fmt=None, previous=None,
+                       transform=None):
+        """
+        :param path: String, output file. An extension is added for the chosen format unless the path already ends in
+                     '.parquet', '.jsonl' or '.gz'.
+        :param uid: String, the device class to export (default: all devices).
+        :param listing_keys: List, device attributes to request from getDevices.
+        :param info_keys: List, when set, also call getInfo with these keys for every device.
+        :param fmt: String, C.EXPORT_FORMAT_JSONL or C.EXPORT_FORMAT_PARQUET. When omitted, Parquet if pyarrow is
+                    installed, otherwise gzipped JSON lines.
+        :param previous: String, path of an earlier export. Devices whose listing record is unchanged since then reuse
+                         their getInfo data from that file instead of calling the API again.
+        :param transform: Function applied to each page of records before it is written (see device_records).
+        :return: Dict, the manifest written next to the export (see read_manifest). Its 'path' is the file written.
+        """
+        path = self._output_path(path, fmt)
+        # Read before the writer opens path, which may be the previous export itself.
+        previous_info = self._load_previous(previous, info_keys)
+
+        fingerprints = {}
+        try:
+            writer = self._writer(path)
+        except BaseException:
+            if previous_info is not None:
+                previous_info.close()
+            raise
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        stage = ProcessStage(functools.partial(device_records, transform=transform), processes=self.processes)
+        try:
+            pages = self.iter_device_pages(pool, uid=uid, keys=listing_keys)
+            for records in stage.map(pages):
+                info_futures = {}
+                for i, record in enumerate(records):
+                    fingerprints[record[C.API_UID]] = record[C.EXPORT_FINGERPRINT]
+                    if info_keys is None:
+                        continue
+                    info = None
+                    if previous_info is not None:
+                        info = previous_info.get(record[C.API_UID], record[C.EXPORT_FINGERPRINT])
+                    if info is not None:
+                        record[C.EXPORT_INFO] = info
+                    else:
+                        info_futures[i] = pool.submit(self._get_device_info, record[C.API_UID], info_keys)
+                for i, future in info_futures.items():
+                    records[i][C.EXPORT_INFO] = future.result()
+                writer.write(records)
+        finally:
+            pool.shutdown()
+            writer.close()
+            if previous_info is not None:
+                previous_info.close()
+
+        manifest = {C.EXPORT_PATH: path, C.EXPORT_EXPORTED_AT: time.time(), C.EXPORT_KEYS: info_keys,
+                    C.EXPORT_FINGERPRINTS: fingerprints}
+        fout = open(path + C.EXPORT_MANIFEST_SUFFIX, 'w')
+        try:
+            json.dump(manifest, fout)
+        finally:
+            fout.close()
+        return manifest
+
+    def _load_previous(self, previous, info_keys):
+        if not previous or info_keys is None:
+            return None
+        manifest = read_manifest(previous)
+        if not manifest or manifest.get(C.EXPORT_KEYS) != info_keys:
+            logging.info('%s has no usable manifest for keys %s. Exporting everything.' % (previous, info_keys))
+            return None
+        return _PreviousInfo(previous)
+
+    def export_templates(self, path, fmt=None):
+        """
+        Flatten the getTemplates tree into one record per node.
+        :param path: String, output file. See export_devices.
+        :param fmt: String, C.EXPORT_FORMAT_JSONL or C.EXPORT_FORMAT_PARQUET. See export_devices.
+        :return: String, the file written.
+        """
+        path = self._output_path(path, fmt)
+        results = self.api.get_templates(C.API_ENDPOINT + C.API_DEVICES)
+        stack = list(reversed(results[C.API_RESULT]))
+        records = []
+        writer = self._writer(path)
+        try:
+            while stack:
+                node = stack.pop()
+                stack.extend(reversed(node.get(C.API_CHILDREN) or []))
+                record = dict((k, v) for k, v in node.items() if k != C.API_CHILDREN)
+                records.append({C.EXPORT_KIND: C.EXPORT_KIND_TEMPLATE, C.API_UID: node.get(C.API_UID),
+                                C.API_NAME: node.get(C.API_TEXT) or node.get(C.API_ID),
+                                C.EXPORT_FINGERPRINT: ZenossAPI.fingerprint(record), C.EXPORT_LISTING: record})
+                if len(records) >= self.page_size:
+                    writer.write(records)
+                    records = []
+            writer.write(records)
+        finally:
+            writer.close()
+        return path
@@ -0,0 +1,214 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+
+class CircuitBreaker(object):
+    """
+    Guards one router method. Closed: calls go through and their outcomes are kept. Open (too many recent failures
+    or slow calls): calls raise ZenossError at once instead of adding to the server's backlog. Half open (open_seconds
+    later): one probe call goes through; success closes the breaker, failure opens it again.
+    """
+    def __init__(self, name, window=C.BREAKER_WINDOW, min_calls=C.BREAKER_MIN_CALLS,
+                 failure_ratio=C.BREAKER_FAILURE_RATIO, slow_seconds=C.BREAKER_SLOW_SECONDS,
+                 open_seconds=C.BREAKER_OPEN_SECONDS):
+        """
+        :param name: Tuple, (endpoint, method), for messages.
+        :param window: Int, the number of latest outcomes kept.
+        :param min_calls: Int, outcomes needed before the breaker may open.
+        :param failure_ratio: Float, the share of failed outcomes that opens the breaker.
+        :param slow_seconds: Float, calls slower than this count as failed.
+        :param open_seconds: Float, how long the breaker rejects calls before probing.
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.outcomes = deque(maxlen=max(1, window))  # True for each failed call
+        self.state = C.BREAKER_CLOSED
+        self.changed_at = time.time()
+        self.probing = False
+        self.counts = dict.fromkeys([C.BREAKER_CALLS, C.BREAKER_FAILURES, C.BREAKER_REJECTED, C.BREAKER_OPENED], 0)
+        self.lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        self.changed_at = time.time()
+        if state == C.BREAKER_OPEN:
+            self.counts[C.BREAKER_OPENED] += 1
+            logging.warning('Circuit breaker for %s %s opened.' % self.name)
+        elif state == C.BREAKER_CLOSED:
+            self.outcomes.clear()
+            logging.info('Circuit breaker for %s %s closed.' % self.name)
+
+    def before(self):
+        """
+        Call before sending a request.
+        :return: Boolean, True when this call is the half-open probe. Pass it on to after().
+        """
+        with self.lock:
+            if self.state == C.BREAKER_OPEN:
+                remaining = self.open_seconds - (time.time() - self.changed_at)
+                if remaining > 0:
+                    self.counts[C.BREAKER_REJECTED] += 1
+                    raise ZenossError(C.ERROR_BREAKER_OPEN_S_S_S % (self.name + (remaining,)))
+                self._set_state(C.BREAKER_HALF_OPEN)
+            if self.state == C.BREAKER_HALF_OPEN:
+                if self.probing:
+                    self.counts[C.BREAKER_REJECTED] += 1
+                    raise ZenossError(C.ERROR_BREAKER_OPEN_S_S_S % (self.name + (self.open_seconds,)))
+                self.probing = True
+                return True
+            return False
+
+    def after(self, failed, elapsed, probe=False):
+        """
+        :param failed: Boolean, the request raised or the server answered with an error status.
+        :param elapsed: Float, seconds the request took.
+        :param probe: Boolean, what before() returned.
+        """
+        failed = failed or elapsed > self.slow_seconds
+        with self.lock:
+            self.counts[C.BREAKER_CALLS] += 1
+            self.counts[C.BREAKER_FAILURES] += int(failed)
+            if probe:
+                self.probing = False
+                self._set_state(C.BREAKER_OPEN if failed else C.BREAKER_CLOSED)
+                return
+            self.outcomes.append(failed)
+            if self.state == C.BREAKER_CLOSED and len(self.outcomes) >= self.min_calls and \
+                    sum(self.outcomes) >= self.failure_ratio * len(self.outcomes):
+                self._set_state(C.BREAKER_OPEN)
+
+    def metrics(self):
+        with self.lock:
+            metrics = dict(self.counts)
+            metrics[C.BREAKER_STATE] = self.state
+            metrics[C.BREAKER_CHANGED_AT] = self.changed_at
+            return metrics
+
+
+class PriorityGate(object):
+    """
+    Caps the requests a client has in flight. When every slot is taken, waiting requests get the next free slot in
+    priority order (C.PRIORITY_INTERACTIVE, then C.PRIORITY_WRITE, then C.PRIORITY_BULK), first come first served
+    within a priority. With 0 slots there is no cap and no queueing.
+    """
+    def __init__(self, slots=C.MAX_IN_FLIGHT):
+        self.slots = slots
+        self.in_flight = 0
+        self.waiting = []  # heap of (priority, arrival, Event)
+        self.arrivals = itertools.count()
+        self.lock = threading.Lock()
+
+    def acquire(self, priority):
+        if not self.slots:
+            return
+        with self.lock:
+            if self.in_flight < self.slots and not self.waiting:
+                self.in_flight += 1
+                return
+            event = threading.Event()
+            heapq.heappush(self.waiting, (priority, next(self.arrivals), event))
+        event.wait()
+
+    def release(self):
+        if not self.slots:
+            return
+        with self.lock:
+            if self.waiting:
+                # Hand the slot straight over, so a new arrival can't take it first.
+                heapq.heappop(self.waiting)[2].set()
+            else:
+                self.in_flight -= 1
+
+    def metrics(self):
+        with self.lock:
+            waiting = {}
+            for priority, _, _ in self.waiting:
+                waiting[priority] = waiting.get(priority, 0) + 1
+            return {C.GATE_SLOTS: self.slots, C.GATE_IN_FLIGHT: self.in_flight, C.GATE_WAITING: waiting}
+
+
+class ChunkSizer(object):
+    """
+    Picks the chunk size (calls per envelope, page size) for one operation from how the last chunks went: every
+    'window' full-size chunks it compares their p95 latency with the target, grows the size by 'growth' while well
+    under it and shrinks it by 'backoff' when over it. A chunk that fails as a whole shrinks the size at once.
+    """
+    def __init__(self, size=C.BULK_BATCH_SIZE, target_p95=C.CHUNK_TARGET_P95, min_size=C.CHUNK_MIN_SIZE,
+                 max_size=C.CHUNK_MAX_SIZE, window=C.CHUNK_WINDOW, growth=C.CHUNK_GROWTH, backoff=C.CHUNK_BACKOFF):
+        """
+        :param size: Int, the size to start from.
+        :param target_p95: Float, seconds. The p95 chunk latency to stay under.
+        :param min_size: Int
+        :param max_size: Int
+        :param window: Int, full-size chunks per decision.
+        :param growth: Float, factor to grow by.
+        :param backoff: Float, factor to shrink by.
+        """
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = min(self.max_size, max(self.min_size, int(size)))
+        self.target_p95 = target_p95
+        self.window = max(1, window)
+        self.growth = growth
+        self.backoff = backoff
+        self.latencies = []
+        self.p95 = None
+        self.counts = dict.fromkeys([C.CHUNK_OBSERVED, C.CHUNK_GROWN, C.CHUNK_SHRUNK], 0)
+        self.lock = threading.Lock()
+
+    def _resize(self, size):
+        size = min(self.max_size, max(self.min_size, int(size)))
+        if size != self.size:
+            self.counts[C.CHUNK_GROWN if size > self.size else C.CHUNK_SHRUNK] += 1
+            logging.debug('Chunk size %d -> %d (p95 %s)' % (self.size, size, self.p95))
+            self.size = size
+        # Latencies seen at the old size say nothing about the new one.
+        self.latencies = []
+
+    def observe(self, size, elapsed, ok=True):
+        """
+        :param size: Int, the chunk's size.
+        :param elapsed: Float, seconds the chunk took.
+        :param ok: Boolean, False when the chunk failed as a whole (connection error, timeout, error status).
+        """
+        with self.lock:
+            self.counts[C.CHUNK_OBSERVED] += 1
+            if not ok:
+                self._resize(min(self.size, size) * self.backoff)
+                return
+            if size < self.size:
+                # The last, short chunk of a run, or one sent before the size grew.
+                return
+            self.latencies.append(elapsed)
+            if len(self.latencies) < self.window:
+                return
+            latencies = sorted(self.latencies)
+            self.p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            if self.p95 > self.target_p95:
+                self._resize(self.size * self.backoff)
+            elif self.p95 < self.target_p95 / self.growth:
+                # Only grow while the bigger chunks should still come in under the target.
+                self._resize(max(self.size + 1, self.size * self.growth))
+            else:
+                self.latencies = []
+
+    def metrics(self):
+        with self.lock:
+            metrics = dict(self.counts)
+            metrics[C.CHUNK_SIZE] = self.size
+            metrics[C.CHUNK_P95] = self.p95
+            return metrics
@@ -0,0 +1,168 @@
+import time
+import random
+import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+
+class JobTracker(object):
+    """
+    Follows the jobs Zenoss queues for calls like addDevice (model=True) until they finish. Instead of every script
+    polling every device on its own, all tracked jobs are checked together: one batched JobsRouter getInfo round per
+    wait, with the wait between rounds growing from initial_delay to max_delay.
+    """
+    def __init__(self, api, batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS,
+                 initial_delay=C.JOB_POLL_INITIAL_DELAY, backoff=C.JOB_POLL_BACKOFF, max_delay=C.JOB_POLL_MAX_DELAY):
+        """
+        :param api: ZenossAPI
+        :param batch_size: Int, job status checks per Ext.Direct envelope.
+        :param workers: Int, envelopes (or addDevice batches) in flight at once.
+        :param initial_delay: Float, seconds before the first status round.
+        :param backoff: Float, factor the delay grows by after each round.
+        :param max_delay: Float, longest delay between rounds.
+        """
+        self.api = api
+        self.batch_size = batch_size
+        self.workers = workers
+        self.initial_delay = initial_delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jobs = {}  # jobid -> latest job record
+        self.keys = {}  # jobid -> caller's key, e.g. the hostname
+        self.lock = threading.Lock()
+
+    def track(self, results, key=None):
+        """
+        :param results: A response with 'new_jobs' (e.g. from add_device), or a list of job ids.
+        :param key: Anything to remember the jobs by, e.g. the hostname.
+        :return: List of the job ids now being tracked.
+        """
+        jobids = self.api.new_jobs(results) if isinstance(results, dict) else list(results)
+        with self.lock:
+            for jobid in jobids:
+                self.jobs.setdefault(jobid, {C.API_UUID: jobid, C.API_STATUS: C.API_JOB_STATUS_PENDING})
+                self.keys[jobid] = key
+        return jobids
+
+    def jobs_for(self, key):
+        with self.lock:
+            return [jobid for jobid, k in self.keys.items() if k == key]
+
+    def add_devices(self, hostnames, device_class, journal=None, **kwargs):
+        """
+        Add devices in batched addDevice calls and track the jobs they queue.
+        :param hostnames: List of hostnames.
+        :param device_class: String, e.g. C.API_DEVICE_CLASS_SERVER_LINUX
+        :param journal: zenoss_journal.Journal. Hostnames it already holds are skipped (msg C.JOURNAL_SKIPPED, no
+                        jobs); added devices are recorded in it with their uid.
+        :param kwargs: Other addDevice arguments, as for ZenossAPI.add_device.
+        :return: Dict of {hostname: {'success': Boolean, 'msg': String, 'new_jobs': [job ids]}}
+        """
+        skipped = {}
+        if journal is not None:
+            skipped = dict((hostname, {C.API_SUCCESS: True, C.API_MSG: C.JOURNAL_SKIPPED, C.API_NEW_JOBS: []})
+                           for hostname in hostnames if hostname in journal)
+        data_list = [self.api.add_device_payload(hostname, device_class, **kwargs) for hostname in hostnames
+                     if hostname not in skipped]
+        chunks = [data_list[i:i+max(1, self.batch_size)] for i in range(0, len(data_list), max(1, self.batch_size))]
+
+        def run(chunk):
+            try:
+                results = self.api.api_batch_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
+                                                     C.API_METHOD_ADD_DEVICE, chunk, priority=C.PRIORITY_BULK)
+            except (ZenossError, requests.exceptions.RequestException) as e:
+                # Only this chunk fails; the other chunks still run.
+                results = str(e)
+            if not isinstance(results, list):
+                msg = results if isinstance(results, str) else '%s: %s' % results
+                results = [{C.API_RESULT: {C.API_SUCCESS: False, C.API_MSG: msg}}] * len(chunk)
+
+            outcomes = {}
+            for data, result in zip(chunk, results):
+                hostname = data[C.API_DEVICE_NAME]
+                result = result or {}
+                outcomes[hostname] = {C.API_SUCCESS: bool((result.get(C.API_RESULT) or {}).get(C.API_SUCCESS)),
+                                      C.API_MSG: (result.get(C.API_RESULT) or {}).get(C.API_MSG, ''),
+                                      C.API_NEW_JOBS: self.track(result, key=hostname)}
+                if journal is not None and outcomes[hostname][C.API_SUCCESS]:
+                    journal.record(hostname, uid=self.api.device_uid(hostname, data[C.API_DEVICE_CLASS]))
+            return outcomes
+
+        outcomes = dict(skipped)
+        pool = ThreadPoolExecutor(max_workers=max(1, self.workers))
+        try:
+            for chunk_outcomes in pool.map(run, chunks):
+                outcomes.update(chunk_outcomes)
+        finally:
+            pool.shutdown()
+        return outcomes
+
+    def poll(self, jobids=None):
+        """
+        One status round for the given (default: all unfinished) tracked jobs.
+        :param jobids: List of job ids.
+        :return: Dict of {jobid: job record} for the jobs checked.
+        """
+        if jobids is None:
+            jobids = self.pending()
+        infos = self.api.get_jobs_info(jobids, batch_size=self.batch_size, workers=self.workers)
+        with self.lock:
+            self.jobs.update(infos)
+        return infos
+
+    def pending(self):
+        with self.lock:
+            return [jobid for jobid, job in self.jobs.items() if not self._finished(job)]
+
+    def _unfinished(self, jobids):
+        with self.lock:
+            return [jobid for jobid in jobids if not self._finished(self.jobs[jobid])]
+
+    def _finished(self, job):
+        # A job Zenoss no longer knows about (status None) won't finish later either.
+        status = job.get(C.API_STATUS)
+        return status is None or status in C.API_JOB_STATUS_FINISHED
+
+    def wait_all(self, jobs=None, timeout=None):
+        """
+        :param jobs: List of job ids (default: every tracked job). Untracked ids are tracked.
+        :param timeout: Float, seconds to wait at most (default: until all jobs finish).
+        :return: (done, not_done), both dicts of {jobid: latest job record}. A finished job's 'status' is one of
+                 C.API_JOB_STATUS_FINISHED, or None when Zenoss couldn't find it.
+        """
+        if jobs is None:
+            with self.lock:
+                jobs = list(self.jobs)
+        else:
+            with self.lock:
+                untracked = [j for j in jobs if j not in self.jobs]
+            self.track(untracked)
+
+        deadline = None if timeout is None else time.time() + timeout
+        delay = self.initial_delay
+        waiting = self._unfinished(jobs)
+        while waiting:
+            sleep = delay * random.uniform(0.9, 1.1)  # keeps many trackers from polling in lockstep
+            if deadline is not None:
+                sleep = min(sleep, deadline - time.time())
+                if sleep < 0:
+                    break
+            time.sleep(sleep)
+
+            self.poll(waiting)
+            waiting = self._unfinished(waiting)
+            delay = min(self.max_delay, delay * self.backoff)
+            logging.debug('%d of %d jobs still running; next check in %.1fs' % (len(waiting), len(jobs), delay))
+
+        with self.lock:
+            done = dict((j, self.jobs[j]) for j in jobs if self._finished(self.jobs[j]))
+            not_done = dict((j, self.jobs[j]) for j in jobs if j not in done)
+        return done, not_done
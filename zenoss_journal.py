@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import logging
+import threading
+
+try:
+    from zenoss5_api.CONSTS import C
+except ImportError:
+    from CONSTS import C
+
+
+class Journal(object):
+    """
+    Append-only checkpoint file for bulk runs: one JSON line per finished item, written as soon as the item is done.
+    Opening an existing journal reads back what earlier (possibly crashed) runs finished, so a rerun can skip it:
+
+        journal = Journal('onboarding.journal', job='add')
+        todo = journal.pending(hostnames)
+        ...
+        journal.record(hostname, uid=device_uid)
+
+    Several jobs can share one file; each only sees its own items. A line cut short by a crash is ignored.
+    """
+    def __init__(self, path, job=None, fsync=C.JOURNAL_FSYNC):
+        """
+        :param path: String, the journal file. Created if missing.
+        :param job: String, names this run's items, e.g. 'add' or 'bind'. Items of other jobs are ignored.
+        :param fsync: Boolean, fsync after every item, so they survive a power loss and not just a crash.
+        """
+        self.path = path
+        self.job = job
+        self.fsync = fsync
+        self.items = {}  # key -> journal line
+        self.lock = threading.Lock()
+        torn = self._load()
+        self.fout = open(path, 'a')
+        if torn:
+            # End the cut-off line, or the next item would be appended to it.
+            self.fout.write('\n')
+
+    def _load(self):
+        # Returns True when the file ends in a cut-off line.
+        try:
+            fin = open(self.path, 'r')
+        except IOError:
+            return False
+        line = '\n'
+        try:
+            for n, line in enumerate(fin):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    logging.warning('%s line %d is incomplete. Ignoring it.' % (self.path, n + 1))
+                    continue
+                if item.get(C.JOURNAL_JOB) == self.job:
+                    self.items[item[C.JOURNAL_KEY]] = item
+        finally:
+            fin.close()
+        return not line.endswith('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def uid(self, key):
+        """
+        :param key: The item key, e.g. a hostname.
+        :return: String, the uid recorded for a finished item, or None.
+        """
+        item = self.items.get(key)
+        return item.get(C.API_UID) if item else None
+
+    def pending(self, keys):
+        """
+        :param keys: Iterable of item keys.
+        :return: List of the keys not finished yet, in their original order.
+        """
+        return [key for key in keys if key not in self.items]
+
+    def record(self, key, uid=None):
+        """
+        :param key: The item key. Must be JSON serializable (normally a string).
+        :param uid: String, the uid of the object the item created or changed, if any.
+        """
+        item = {C.JOURNAL_JOB: self.job, C.JOURNAL_KEY: key, C.API_UID: uid, C.JOURNAL_AT: time.time()}
+        line = json.dumps(item, separators=(',', ':')) + '\n'
+        with self.lock:
+            # A crash between two writes must not leave half an item, so each item goes out in a single write.
+            self.fout.write(line)
+            self.fout.flush()
+            if self.fsync:
+                os.fsync(self.fout.fileno())
+            self.items[key] = item
+
+    def close(self):
+        with self.lock:
+            self.fout.close()
@@ -0,0 +1,294 @@
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+
+class LatencyHistogram(object):
+    """
+    HDR-style latency histogram: values are counted in log-linear buckets that keep 'digits' significant decimal
+    digits (1% for 2) at any magnitude, so memory stays small however long the run and the tail percentiles are
+    still accurate. Values are recorded in seconds and kept as whole microseconds.
+    """
+    def __init__(self, digits=C.LOAD_HISTOGRAM_DIGITS):
+        """
+        :param digits: Int, significant decimal digits to keep.
+        """
+        self.digits = digits
+        self.sub_bits = (2 * 10 ** digits - 1).bit_length()
+        self.counts = {}  # (shift, sub bucket) -> count
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    def _bucket(self, value):
+        shift = max(0, value.bit_length() - self.sub_bits)
+        return shift, value >> shift
+
+    def record(self, seconds):
+        """
+        :param seconds: Float
+        """
+        value = max(0, int(seconds * 1e6))
+        bucket = self._bucket(value)
+        with self.lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """
+        :param other: LatencyHistogram with the same digits.
+        """
+        with other.lock:
+            counts, count, total, low, high = dict(other.counts), other.count, other.total, other.min, other.max
+        with self.lock:
+            for bucket, n in counts.items():
+                self.counts[bucket] = self.counts.get(bucket, 0) + n
+            self.count += count
+            self.total += total
+            if count:
+                self.min = low if self.min is None else min(self.min, low)
+                self.max = high if self.max is None else max(self.max, high)
+
+    def percentile(self, p):
+        """
+        :param p: Float, 0 to 100.
+        :return: Float, seconds: the highest value in the bucket holding the p-th percentile, or None when empty.
+        """
+        with self.lock:
+            if not self.count:
+                return None
+            rank = max(1, int(round(p / 100.0 * self.count)))
+            seen = 0
+            for shift, sub in sorted(self.counts):
+                seen += self.counts[(shift, sub)]
+                if seen >= rank:
+                    return min(((sub + 1) << shift) - 1, self.max) / 1e6
+            return self.max / 1e6
+
+    def summary(self, percentiles=C.LOAD_PERCENTILES):
+        """
+        :param percentiles: Iterable of Floats.
+        :return: Dict of {'count', 'min', 'mean', 'max', 'p50', ...}, latencies in seconds.
+        """
+        summary = dict(('p%g' % p, self.percentile(p)) for p in percentiles)
+        with self.lock:
+            summary[C.LOAD_COUNT] = self.count
+            summary[C.LOAD_MIN] = self.min / 1e6 if self.count else None
+            summary[C.LOAD_MAX] = self.max / 1e6 if self.count else None
+            summary[C.LOAD_MEAN] = self.total / 1e6 / self.count if self.count else None
+        return summary
+
+
+class LoadGenerator(object):
+    """
+    Drives a ZenossAPI (against a Zenoss server or a zenoss_stub.StubZenoss) with a weighted mix of read methods and
+    reports per-method latency histograms, to find out how much load a Zenoss instance takes:
+
+        report = LoadGenerator(zap, mix={'get_device_info': 4, 'get_devices': 1}, workers=16).run(duration=60)
+
+    Closed loop (rate None): 'workers' callers each send their next request as soon as the last one returns.
+    Open loop: requests arrive at 'rate' per second whether or not earlier ones have returned, at most 'workers' in
+    flight; a request's latency is counted from when it was due, so time spent queued behind a slow server shows.
+    """
+    # Method name -> function(self) -> kwargs for one call.
+    methods = {
+        'get_devices': lambda self: {'uid': self.device_class, 'limit': self.page_size,
+                                     'start': self.random.randrange(max(1, self.device_count - self.page_size + 1))},
+        'get_device_info': lambda self: {'uid': self.random.choice(self.device_uids)},
+        'get_templates': lambda self: {'zid': self.device_class},
+        'get_oid_mappings': lambda self: {'uid': self.mib_uid, 'limit': self.page_size},
+    }
+
+    def __init__(self, api, mix=None, workers=C.BULK_WORKERS, rate=None, poisson=True,
+                 device_class=C.API_DEVICES_SERVER_LINUX, mib_uid=None, page_size=C.API_KEYWORD_DEFAULTS[C.API_LIMIT],
+                 single_flight=False, seed=None):
+        """
+        :param api: ZenossAPI
+        :param mix: Dict of {method name: relative weight}, default C.LOAD_MIX. Names are ZenossAPI read methods
+                    in LoadGenerator.methods.
+        :param workers: Int, requests in flight at most.
+        :param rate: Float, requests per second for an open loop, None for a closed loop.
+        :param poisson: Boolean, open loop arrivals at random (exponential) intervals rather than evenly spaced.
+        :param device_class: String, the device class uid that get_devices, get_device_info and get_templates read.
+        :param mib_uid: String, the MIB module uid get_oid_mappings reads, e.g. '/zport/dmd/Mibs/mibs/IF-MIB'.
+                        Without one, get_oid_mappings is left out of the mix.
+        :param page_size: Int, limit of the paged reads.
+        :param single_flight: Boolean, let identical concurrent reads share one request (ZenossAPI single_flight).
+                              The run uses its own clone of api for that, so api itself is left as it is. Off by
+                              default, so every generated request reaches the server.
+        :param seed: Random seed, for a repeatable sequence of calls.
+        """
+        mix = dict(mix or C.LOAD_MIX)
+        unknown = sorted(set(mix) - set(self.methods))
+        if unknown:
+            raise ZenossError(C.ERROR_LOAD_UNKNOWN_METHOD_S_S % (', '.join(unknown), ', '.join(sorted(self.methods))))
+        if not mib_uid and mix.pop('get_oid_mappings', None):
+            logging.warning('No MIB uid to read. Leaving get_oid_mappings out of the load mix.')
+        self.mix = [(name, weight) for name, weight in sorted(mix.items()) if weight > 0]
+        self.api = api
+        self.client = api  # the clone of api a run sends its requests through
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.poisson = poisson
+        self.device_class = device_class
+        self.mib_uid = mib_uid
+        self.page_size = page_size
+        self.single_flight = single_flight
+        self.random = random.Random(seed)
+        self.device_uids = []
+        self.device_count = 0
+        self.histograms = {}
+        self.errors = {}
+        self.last_errors = {}
+        self.lock = threading.Lock()
+
+    def _discover(self):
+        # One page of device uids for get_device_info to pick from, and the device count for get_devices offsets.
+        results = self.api.get_devices(uid=self.device_class, limit=self.page_size, keys=[C.API_UID],
+                                       validate_success=True)
+        self.device_uids = [d[C.API_UID] for d in results[C.API_RESULT].get(C.API_DEVICES_KEY) or []]
+        self.device_count = results[C.API_RESULT].get(C.API_TOTAL_COUNT, len(self.device_uids))
+        if not self.device_uids and 'get_device_info' in dict(self.mix):
+            raise ZenossError(C.ERROR_LOAD_NO_TARGET_S % 'get_device_info')
+
+    def _pick(self):
+        point = self.random.uniform(0, sum(weight for name, weight in self.mix))
+        for name, weight in self.mix:
+            point -= weight
+            if point <= 0:
+                break
+        return name, self.methods[name](self)
+
+    def _call(self, name, kwargs, due):
+        # due: when the request should have started. Latency is counted from then, not from when a worker got to it.
+        error = None
+        try:
+            results = getattr(self.client, name)(**kwargs)
+            if isinstance(results, tuple):
+                error = '%s: %s' % results
+            elif isinstance(results.get(C.API_RESULT), dict) and results[C.API_RESULT].get(C.API_SUCCESS) is False:
+                error = results[C.API_RESULT].get(C.API_MSG, '')
+        except Exception as e:
+            error = '%s: %s' % (type(e).__name__, e)
+        elapsed = time.time() - due
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = LatencyHistogram()
+                self.errors[name] = 0
+            if error is not None:
+                self.errors[name] += 1
+                self.last_errors[name] = error
+        self.histograms[name].record(elapsed)
+
+    def _closed_loop(self, end, requests):
+        issued = [0]
+
+        def caller():
+            while time.time() < end:
+                with self.lock:
+                    if requests is not None and issued[0] >= requests:
+                        return
+                    issued[0] += 1
+                    name, kwargs = self._pick()
+                self._call(name, kwargs, time.time())
+
+        threads = [threading.Thread(target=caller) for _ in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return 0
+
+    def _open_loop(self, start, end, requests):
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        futures = set()
+        max_backlog = 0
+        try:
+            due = start
+            issued = 0
+            while due < end and (requests is None or issued < requests):
+                now = time.time()
+                if due > now:
+                    time.sleep(due - now)
+                with self.lock:
+                    name, kwargs = self._pick()
+                futures.add(pool.submit(self._call, name, kwargs, due))
+                futures = set(f for f in futures if not f.done())
+                max_backlog = max(max_backlog, len(futures) - self.workers)
+                issued += 1
+                due += self.random.expovariate(self.rate) if self.poisson else 1.0 / self.rate
+            wait(futures)
+        finally:
+            pool.shutdown()
+        return max_backlog
+
+    def run(self, duration=C.LOAD_DURATION, requests=None):
+        """
+        :param duration: Float, seconds to generate load for. Requests in flight at the end are waited for.
+        :param requests: Int, stop after this many requests instead, if that comes first.
+        :return: Dict of {'mode': 'open' or 'closed', 'elapsed': seconds, 'count', 'errors', 'throughput': per second,
+                 'max_backlog': requests waiting for a worker at most (open loop), 'total': histogram summary,
+                 'methods': {name: histogram summary with 'errors' and 'last_error'}}. See LatencyHistogram.summary.
+        """
+        self._discover()
+        self.histograms, self.errors, self.last_errors = {}, {}, {}
+        self.client = self.api.clone(single_flight=self.single_flight)
+        start = time.time()
+        end = start + duration
+        if self.rate:
+            max_backlog = self._open_loop(start, end, requests)
+        else:
+            max_backlog = self._closed_loop(end, requests)
+        elapsed = time.time() - start
+        return self.report(elapsed, max_backlog)
+
+    def report(self, elapsed, max_backlog=0):
+        total = LatencyHistogram()
+        methods = {}
+        for name, histogram in sorted(self.histograms.items()):
+            total.merge(histogram)
+            methods[name] = histogram.summary()
+            methods[name][C.LOAD_ERRORS] = self.errors[name]
+            methods[name][C.LOAD_LAST_ERROR] = self.last_errors.get(name)
+        return {C.LOAD_MODE: C.LOAD_MODE_OPEN if self.rate else C.LOAD_MODE_CLOSED, C.API_ELAPSED: elapsed,
+                C.LOAD_COUNT: total.count, C.LOAD_ERRORS: sum(self.errors.values()),
+                C.CLI_THROUGHPUT: total.count / max(elapsed, 1e-6), C.LOAD_MAX_BACKLOG: max_backlog,
+                C.LOAD_TOTAL: total.summary(), C.LOAD_METHODS: methods}
+
+
+def format_report(report):
+    """
+    :param report: Dict, from LoadGenerator.run
+    :return: String, a table of the per-method latencies in milliseconds.
+    """
+    columns = ['p%g' % p for p in C.LOAD_PERCENTILES] + [C.LOAD_MAX]
+
+    def ms(v):
+        return '-' if v is None else '%.1f' % (v * 1000)
+
+    lines = ['%s loop, %d requests in %.1fs (%.1f/s), %d errors' % (
+        report[C.LOAD_MODE], report[C.LOAD_COUNT], report[C.API_ELAPSED], report[C.CLI_THROUGHPUT],
+        report[C.LOAD_ERRORS])]
+    lines.append('%-20s %8s %7s' % ('method', 'count', 'errors') + ''.join(' %9s' % c for c in columns))
+    total = dict(report[C.LOAD_TOTAL])
+    total[C.LOAD_ERRORS] = report[C.LOAD_ERRORS]
+    rows = sorted(report[C.LOAD_METHODS].items()) + [(C.LOAD_TOTAL, total)]
+    for name, summary in rows:
+        lines.append('%-20s %8d %7d' % (name, summary[C.LOAD_COUNT], summary[C.LOAD_ERRORS]) +
+                     ''.join(' %9s' % ms(summary[c]) for c in columns))
+    return '\n'.join(lines)
@@ -0,0 +1,338 @@
+try:
+    from inspect import Parameter, Signature
+except ImportError:
+    # Python 2: no signature objects; help() falls back to the first line of the generated docstrings.
+    Parameter = Signature = None
+
+try:
+    from zenoss5_api.CONSTS import C
+except ImportError:
+    from CONSTS import C
+
+
+REQUIRED = object()
+VALIDATE_SUCCESS = 'validate_success'
+ASYNC_SUFFIX = '_async'
+BATCH_SUFFIX = '_batch'
+PAYLOAD_SUFFIX = '_payload'
+
+
+def listify(values):
+    # Same as ZenossAPI._non_str_iterable with its defaults: a lone string becomes a one item list.
+    return [values] if isinstance(values, str) else values
+
+
+def query_or_default(query):
+    return query or C.API_KEYWORD_DEFAULTS[C.API_QUERY]
+
+
+class RouterMethod(object):
+    """
+    One router method of the Zenoss JSON API: where it lives, the client method's arguments and how they map onto the
+    router's. install() generates the client methods from it:
+        name(...)            the call itself, e.g. api.get_tree(zid)
+        name_async(...)      the same call on the client's executor, returning a Future
+        name_batch(calls)    many calls in batched Ext.Direct envelopes, returning the responses in order
+        name_payload(...)    the router method's data for a call, without sending it (e.g. for api_batch_request)
+    The argument handling is worked out once here, not on every call.
+    """
+    def __init__(self, name, method, endpoint, action, args=(), validate_first=False, extra_kwargs=False,
+                 drop_none=False, validate=True):
+        """
+        :param name: String, the client method name, e.g. 'get_tree'
+        :param method: String, e.g. C.API_METHOD_GET_TREE
+        :param endpoint: String, e.g. C.API_ROUTER_DEVICE_ENDPOINT
+        :param action: String, e.g. C.API_ACTION_DEVICE_ROUTER
+        :param args: List of (argument, router key[, default[, convert]]) in signature order. Arguments without a
+                     default are required. convert is applied to the value before it is sent.
+        :param validate_first: Boolean, validate_success is the first argument rather than the last.
+        :param extra_kwargs: Boolean, other keyword arguments are sent as they are (named arguments win).
+        :param drop_none: Boolean, leave arguments that are None out of the request.
+        :param validate: Boolean, False when the response has no 'success' to check (validate_success is ignored).
+        """
+        self.name = name
+        self.endpoint = endpoint
+        self.action = action
+        self.method = method
+        self.extra_kwargs = extra_kwargs
+        self.drop_none = drop_none
+        self.validate = validate
+
+        self.fields = []
+        self.defaults = {VALIDATE_SUCCESS: False}
+        for arg in args:
+            arg = tuple(arg) + (REQUIRED, None)[len(arg) - 2:]
+            self.fields.append((arg[0], arg[1], arg[3]))
+            if arg[2] is not REQUIRED:
+                self.defaults[arg[0]] = arg[2]
+        names = [field[0] for field in self.fields]
+        self.params = [VALIDATE_SUCCESS] + names if validate_first else names + [VALIDATE_SUCCESS]
+        self.param_set = frozenset(self.params)
+        self.payload_params = names
+        self.payload_param_set = frozenset(names)
+        self.required = [name for name in names if name not in self.defaults]
+
+    def __repr__(self):
+        return '%s(%s.%s)' % (self.name, self.action, self.method)
+
+    def signature(self, suffix='', params=None):
+        parts = []
+        for param in self.params if params is None else params:
+            parts.append(param if param not in self.defaults else '%s=%r' % (param, self.defaults[param]))
+        if self.extra_kwargs:
+            parts.append('**kwargs')
+        return '%s(%s)' % (self.name + suffix, ', '.join(parts))
+
+    def python_signature(self, params=None):
+        """
+        :param params: List of parameter names, default self.params (self.payload_params for name_payload()).
+        :return: inspect.Signature of the generated name() and name_async() methods, the client included, or None on
+                 Python 2.
+        """
+        if Signature is None:
+            return None
+        parameters = [Parameter('api', Parameter.POSITIONAL_OR_KEYWORD)]
+        for param in self.params if params is None else params:
+            parameters.append(Parameter(param, Parameter.POSITIONAL_OR_KEYWORD,
+                                        default=self.defaults.get(param, Parameter.empty)))
+        if self.extra_kwargs:
+            parameters.append(Parameter('kwargs', Parameter.VAR_KEYWORD))
+        return Signature(parameters)
+
+    def doc(self, suffix, returns, params=None):
+        """
+        :param suffix: String, '' , ASYNC_SUFFIX or PAYLOAD_SUFFIX.
+        :param returns: String, the ':return:' text.
+        :param params: List of parameter names, as for python_signature.
+        :return: String, the docstring of the generated name(), name_async() or name_payload() method.
+        """
+        lines = ['%s -> %s.%s' % (self.signature(suffix, params), self.action, self.method)]
+        for name, key, convert in self.fields:
+            lines.append(":param %s: Sent as '%s'%s." % (name, key, ' (a lone string becomes a list)'
+                                                         if convert is listify else ''))
+        if params is None or VALIDATE_SUCCESS in params:
+            if self.validate:
+                lines.append(':param validate_success: Boolean, raise ZenossError unless the response has '
+                             'success=true.')
+            else:
+                lines.append(":param validate_success: Ignored, the response has no 'success'.")
+        if self.extra_kwargs:
+            lines.append(':param kwargs: Other %s arguments, sent as they are.' % self.method)
+        lines.append(':return: ' + returns)
+        return '\n'.join(lines)
+
+    def batch_doc(self, batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS):
+        return '\n'.join([
+            '%s(calls, batch_size=%r, workers=%r) -> %s.%s (batched)' % (self.name + BATCH_SUFFIX, batch_size, workers,
+                                                                          self.action, self.method),
+            ':param calls: List, one call per item: a dict of keyword arguments or a tuple of positional ones for %s.'
+            % self.signature(),
+            ':param batch_size: Int, calls per Ext.Direct envelope.',
+            ':param workers: Int, envelopes in flight at once.',
+            ":return: List of responses in the order of calls. Calls in an envelope that failed as a whole get "
+            "{'result': {'success': False, 'msg': String}}."])
+
+    def bind(self, args, kwargs, payload=False):
+        """
+        :param args: Tuple, positional arguments as given to the client method.
+        :param kwargs: Dict, keyword arguments as given to the client method.
+        :param payload: Boolean, the arguments are name_payload()'s, which has no validate_success.
+        :return: (Dict, the router method's data, Boolean validate_success)
+        """
+        params, param_set = (self.payload_params, self.payload_param_set) if payload else (self.params, self.param_set)
+        name = self.name + PAYLOAD_SUFFIX if payload else self.name
+        if len(args) > len(params):
+            raise TypeError('%s takes at most %d positional arguments (%d given)' %
+                            (name, len(params), len(args)))
+        values = dict(self.defaults)
+        values.update(zip(params, args))
+        extra = {}
+        for key, value in kwargs.items():
+            if key in param_set:
+                if key in params[:len(args)]:
+                    raise TypeError("%s got multiple values for argument '%s'" % (name, key))
+                values[key] = value
+            elif self.extra_kwargs:
+                extra[key] = value
+            else:
+                raise TypeError("%s got an unexpected keyword argument '%s'" % (name, key))
+        for param in self.required:
+            if param not in values:
+                raise TypeError("%s missing required argument '%s'" % (name, param))
+
+        data = extra
+        for param, key, convert in self.fields:
+            value = values[param]
+            if convert is not None:
+                value = convert(value)
+            if value is None and self.drop_none:
+                continue
+            data[key] = value
+        return data, self.validate and bool(values[VALIDATE_SUCCESS])
+
+    def call(self, api, args, kwargs):
+        data, validate_success = self.bind(args, kwargs)
+        return api.api_request(self.endpoint, self.action, self.method, data=[data], validate_success=validate_success)
+
+    def batch(self, api, calls, batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS):
+        data_list = []
+        for call in calls:
+            args, kwargs = (call, {}) if isinstance(call, (tuple, list)) else ((), dict(call))
+            data_list.append(self.bind(tuple(args), kwargs)[0])
+        return api.api_batch_calls(self.endpoint, self.action, self.method, data_list, batch_size=batch_size,
+                                   workers=workers)
+
+    def install(self, cls):
+        """
+        Add the generated methods to cls, leaving alone any the class defines by hand.
+        :param cls: ZenossAPI or a subclass.
+        """
+        method = self
+
+        def sync(api, *args, **kwargs):
+            return method.call(api, args, kwargs)
+
+        def run_async(api, *args, **kwargs):
+            # Bind here so that argument errors are raised by the caller, not hidden in the Future.
+            method.bind(args, kwargs)
+            return api.executor().submit(method.call, api, args, kwargs)
+
+        def batch(api, calls, batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS):
+            return method.batch(api, calls, batch_size=batch_size, workers=workers)
+
+        def payload(api, *args, **kwargs):
+            return method.bind(args, kwargs, payload=True)[0]
+
+        signature = self.python_signature()
+        response = 'When zenoss responds with status code 200, the unpacked json object, otherwise a tuple ' \
+                   '(status_code, raw_text). See ZenossAPI.api_request.'
+        for suffix, func, func_doc, func_signature in (
+                ('', sync, self.doc('', response), signature),
+                (ASYNC_SUFFIX, run_async, self.doc(ASYNC_SUFFIX, 'Future of the response.'), signature),
+                (BATCH_SUFFIX, batch, self.batch_doc(), None),
+                (PAYLOAD_SUFFIX, payload, self.doc(PAYLOAD_SUFFIX, 'Dict, the data of one %s call.' % self.method,
+                                                   self.payload_params),
+                 self.python_signature(self.payload_params))):
+            func.__name__ = self.name + suffix
+            func.__doc__ = func_doc
+            if func_signature is not None:
+                # Without it, help() and inspect show (api, *args, **kwargs).
+                func.__signature__ = func_signature
+            if hasattr(func, '__qualname__'):
+                func.__qualname__ = '%s.%s' % (cls.__name__, func.__name__)
+            if func.__name__ not in cls.__dict__:
+                setattr(cls, func.__name__, func)
+        cls.router_methods = dict(getattr(cls, 'router_methods', {}), **{self.name: self})
+
+
+_D = C.API_KEYWORD_DEFAULTS
+_DEVICE = (C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER)
+_TEMPLATE = (C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER)
+_MIB = (C.API_ROUTER_MIB_ENDPOINT, C.API_ACTION_MIB_ROUTER)
+_JOBS = (C.API_ROUTER_JOBS_ENDPOINT, C.API_ACTION_JOBS_ROUTER)
+_EVENTS = (C.API_ROUTER_EVENTS_ENDPOINT, C.API_ACTION_EVENTS_ROUTER)
+# acknowledge, unacknowledge, close and reopen take the same arguments. evids is required so that a forgotten list
+# doesn't act on every event; pass evids=None with params to act on the events matching a filter.
+_EVENT_ACTION_ARGS = [('evids', C.API_EVIDS, REQUIRED, listify), ('exclude_ids', C.API_EXCLUDE_IDS, None),
+                      ('params', C.API_PARAMS, None), ('uid', C.API_UID, None), ('asof', C.API_ASOF, None)]
+
+# add_device and the functions built on several calls stay hand-written in ZenossAPI.
+ROUTER_METHODS = [
+    # DEVICE
+    RouterMethod('get_devices', C.API_METHOD_GET_DEVICES, *_DEVICE, validate_first=True, drop_none=True, args=[
+        ('uid', C.API_UID, None), ('start', C.API_START, None), ('limit', C.API_LIMIT, None),
+        ('sort', C.API_SORT, None), ('direction', C.API_DIR, None), ('params', C.API_PARAMS, None),
+        ('keys', C.API_KEYS, None, listify)]),
+    RouterMethod('remove_devices', C.API_METHOD_REMOVE_DEVICES, *_DEVICE, args=[
+        ('uids', C.API_UIDS), ('uid', C.API_UID), ('hash_check', C.API_HASH_CHECK, _D[C.API_HASH_CHECK]),
+        ('action', C.API_ACTION, C.API_DELETE), ('delete_events', C.API_DELETE_EVENTS, _D[C.API_DELETE_EVENTS])]),
+    RouterMethod('add_device_class_node', C.API_METHOD_ADD_DEVICE_CLASS, *_DEVICE, args=[
+        ('zid', C.API_ID), ('context_uid', C.API_CONTEXT_UID),
+        ('description', C.API_DESCRIPTION, _D[C.API_DESCRIPTION]),
+        ('connection_info', C.API_CONNECTION_INFO, _D[C.API_CONNECTION_INFO]), ('ztype', C.API_TYPE, _D[C.API_TYPE])]),
+    RouterMethod('bind_or_unbind_template', C.API_METHOD_BIND_OR_UNBIND_TEMPLATE, *_DEVICE, args=[
+        ('uid', C.API_UID), ('template_uid', C.API_TEMPLATE_UID)]),
+    RouterMethod('get_device_info', C.API_METHOD_GET_INFO, *_DEVICE, args=[
+        ('uid', C.API_UID), ('keys', C.API_KEYS, None, listify)]),
+    RouterMethod('get_tree', C.API_METHOD_GET_TREE, *_DEVICE, args=[('zid', C.API_ID)]),
+    RouterMethod('get_bound_templates', C.API_METHOD_GET_BOUND_TEMPLATES, *_DEVICE, args=[('uid', C.API_UID)]),
+    RouterMethod('get_unbound_templates', C.API_METHOD_GET_UNBOUND_TEMPLATES, *_DEVICE, args=[('uid', C.API_UID)]),
+    RouterMethod('add_local_template', C.API_METHOD_ADD_LOCAL_TEMPLATE, *_DEVICE, args=[
+        ('device_uid', C.API_DEVICE_UID), ('template_id', C.API_TEMPLATE_ID)]),
+    RouterMethod('remove_local_template', C.API_METHOD_REMOVE_LOCAL_TEMPLATE, *_DEVICE, args=[
+        ('device_uid', C.API_DEVICE_UID), ('template_uid', C.API_TEMPLATE_UID)]),
+    RouterMethod('get_local_templates', C.API_METHOD_GET_LOCAL_TEMPLATES, *_DEVICE, args=[
+        ('uid', C.API_UID), ('query', C.API_QUERY, None)]),
+    RouterMethod('set_bound_templates', C.API_METHOD_SET_BOUND_TEMPLATES, *_DEVICE, args=[
+        ('uid', C.API_UID), ('template_ids', C.API_TEMPLATE_IDS, REQUIRED, listify)]),
+    RouterMethod('set_device_info', C.API_METHOD_SET_INFO, *_DEVICE, validate_first=True, extra_kwargs=True),
+
+    # TEMPLATE
+    RouterMethod('add_template', C.API_METHOD_ADD_TEMPLATE, *_TEMPLATE, args=[
+        ('zid', C.API_ID), ('target_uid', C.API_TARGET_UID)]),
+    RouterMethod('get_templates', C.API_METHOD_GET_TEMPLATES, *_TEMPLATE, args=[('zid', C.API_ID, '')]),
+    RouterMethod('add_data_source', C.API_METHOD_ADD_DATA_SOURCE, *_TEMPLATE, args=[
+        ('template_uid', C.API_TEMPLATE_UID), ('name', C.API_NAME),
+        ('data_source_type', C.API_TYPE, C.API_DATA_SOURCE_TYPE_SNMP)]),
+    RouterMethod('get_data_sources', C.API_METHOD_GET_DATA_SOURCES, *_TEMPLATE, args=[('uid', C.API_UID)]),
+    RouterMethod('get_data_source_details', C.API_METHOD_GET_DATA_SOURCE_DETAILS, *_TEMPLATE, args=[
+        ('uid', C.API_UID)]),
+    RouterMethod('get_data_source_types', C.API_METHOD_GET_DATA_SOURCE_TYPES, *_TEMPLATE, args=[
+        ('query', C.API_QUERY, None, query_or_default)]),
+    RouterMethod('add_data_point', C.API_METHOD_ADD_DATA_POINT, *_TEMPLATE, args=[
+        ('data_source_uid', C.API_DATA_SOURCE_UID), ('name', C.API_NAME)]),
+    RouterMethod('get_data_points', C.API_METHOD_GET_DATA_POINTS, *_TEMPLATE, args=[
+        ('uid', C.API_UID), ('query', C.API_QUERY, _D[C.API_QUERY])]),
+    RouterMethod('add_graph_definition', C.API_METHOD_ADD_GRAPH_DEFINITION, *_TEMPLATE, args=[
+        ('template_uid', C.API_TEMPLATE_UID), ('graph_definition_id', C.API_GRAPH_DEFINITION_ID)]),
+    RouterMethod('add_data_point_to_graph', C.API_METHOD_ADD_DATA_POINT_TO_GRAPH, *_TEMPLATE, args=[
+        ('data_point_uid', C.API_DATA_POINT_UID), ('graph_uid', C.API_GRAPH_UID),
+        ('include_thresholds', C.API_INCLUDE_THRESHOLDS, _D[C.API_INCLUDE_THRESHOLDS])]),
+    RouterMethod('set_graph_definition', C.API_METHOD_SET_GRAPH_DEFINITION, *_TEMPLATE, extra_kwargs=True, args=[
+        ('uid', C.API_UID), ('miny', C.API_MINY, _D[C.API_MINY]), ('maxy', C.API_MAXY, _D[C.API_MAXY]),
+        ('units', C.API_UNITS, '')]),
+    RouterMethod('get_template_info', C.API_METHOD_GET_INFO, *_TEMPLATE, args=[('uid', C.API_UID)]),
+    RouterMethod('set_template_info', C.API_METHOD_SET_INFO, *_TEMPLATE, extra_kwargs=True, args=[
+        ('uid', C.API_UID)]),
+    RouterMethod('get_threshold_types', C.API_METHOD_GET_THRESHOLD_TYPES, *_TEMPLATE, args=[
+        ('query', C.API_QUERY, _D[C.API_QUERY])]),
+    RouterMethod('add_threshold', C.API_METHOD_ADD_THRESHOLD, *_TEMPLATE, args=[
+        ('uid', C.API_UID), ('threshold_type', C.API_THRESHOLD_TYPE), ('threshold_id', C.API_THRESHOLD_ID),
+        ('data_points', C.API_DATA_POINTS)]),
+    RouterMethod('get_threshold_details', C.API_METHOD_GET_THRESHOLD_DETAILS, *_TEMPLATE, args=[('uid', C.API_UID)]),
+    RouterMethod('get_data_point_details', C.API_METHOD_GET_DATA_POINT_DETAILS, *_TEMPLATE, args=[
+        ('uid', C.API_UID)]),
+    RouterMethod('get_thresholds', C.API_METHOD_GET_THRESHOLDS, *_TEMPLATE, args=[
+        ('uid', C.API_UID), ('query', C.API_QUERY, _D[C.API_QUERY])]),
+    # The getGraphs response has no 'success' value to validate.
+    RouterMethod('get_graphs', C.API_METHOD_GET_GRAPHS, *_TEMPLATE, validate=False, args=[
+        ('uid', C.API_UID), ('query', C.API_QUERY, _D[C.API_QUERY])]),
+    RouterMethod('get_graph_definition', C.API_METHOD_GET_GRAPH_DEFINITION, *_TEMPLATE, args=[('uid', C.API_UID)]),
+    RouterMethod('get_graph_points', C.API_METHOD_GET_GRAPH_POINTS, *_TEMPLATE, args=[('uid', C.API_UID)]),
+    RouterMethod('delete_template', C.API_METHOD_DELETE_TEMPLATE, *_TEMPLATE, args=[('uid', C.API_UID)]),
+
+    # MIB
+    RouterMethod('add_oid_mapping', C.API_METHOD_ADD_OID_MAPPING, *_MIB, args=[
+        ('uid', C.API_UID), ('zid', C.API_ID), ('oid', C.API_OID),
+        ('node_type', C.API_NODE_TYPE, _D[C.API_NODE_TYPE])]),
+    RouterMethod('get_oid_mappings', C.API_METHOD_GET_OID_MAPPINGS, *_MIB, args=[
+        ('uid', C.API_UID), ('direction', C.API_DIR, _D[C.API_DIR]), ('sort', C.API_SORT, _D[C.API_SORT]),
+        ('start', C.API_START, _D[C.API_START]), ('page', C.API_PAGE, _D[C.API_PAGE]),
+        ('limit', C.API_LIMIT, _D[C.API_LIMIT])]),
+
+    # JOBS
+    RouterMethod('get_job_info', C.API_METHOD_GET_INFO, *_JOBS, args=[('jobid', C.API_JOB_ID)]),
+    RouterMethod('abort_jobs', C.API_METHOD_ABORT_JOBS, *_JOBS, args=[
+        ('jobids', C.API_JOB_IDS, REQUIRED, listify)]),
+
+    # EVENTS
+    RouterMethod('query_events', C.API_METHOD_QUERY, *_EVENTS, drop_none=True, args=[
+        ('params', C.API_PARAMS, None), ('uid', C.API_UID, None), ('start', C.API_START, 0),
+        ('limit', C.API_LIMIT, C.EVENTS_PAGE_SIZE), ('sort', C.API_SORT, C.API_LAST_TIME),
+        ('direction', C.API_DIR, 'DESC'), ('archive', C.API_ARCHIVE, False), ('keys', C.API_KEYS, None, listify)]),
+    RouterMethod('acknowledge_events', C.API_METHOD_ACKNOWLEDGE, *_EVENTS, drop_none=True, args=_EVENT_ACTION_ARGS),
+    RouterMethod('unacknowledge_events', C.API_METHOD_UNACKNOWLEDGE, *_EVENTS, drop_none=True,
+                 args=_EVENT_ACTION_ARGS),
+    RouterMethod('close_events', C.API_METHOD_CLOSE, *_EVENTS, drop_none=True, args=_EVENT_ACTION_ARGS),
+    RouterMethod('reopen_events', C.API_METHOD_REOPEN, *_EVENTS, drop_none=True, args=_EVENT_ACTION_ARGS),
+]
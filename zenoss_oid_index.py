@@ -0,0 +1,175 @@
+import os
+import json
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_api import ZenossAPI
+except ImportError:
+    from CONSTS import C
+    from zenoss_api import ZenossAPI
+
+
+def _components(oid):
+    return tuple(int(c) for c in oid.strip('.').split('.') if c)
+
+
+class OidIndex(object):
+    """
+    Client-side trie of OID mappings keyed by OID component, built from getOidMappings pages. Each node is a list of
+    [record or None, {component: child node}].
+    """
+    def __init__(self, mib_uids=None):
+        """
+        :param mib_uids: List of MIB module uids that build() and refresh() read from.
+        """
+        self.mib_uids = list(mib_uids or [])
+        self.root = [None, {}]
+        self.fingerprints = {}
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def insert(self, oid, record):
+        node = self.root
+        for component in _components(oid):
+            node = node[1].setdefault(component, [None, {}])
+        node[0] = record
+        self.fingerprints['.'.join(str(c) for c in _components(oid))] = ZenossAPI.fingerprint(record)
+
+    def remove(self, oid):
+        path = [self.root]
+        for component in _components(oid):
+            if component not in path[-1][1]:
+                return False
+            path.append(path[-1][1][component])
+        path[-1][0] = None
+        self.fingerprints.pop('.'.join(str(c) for c in _components(oid)), None)
+        # Prune branches that no longer lead to a record.
+        for parent, component in zip(reversed(path[:-1]), reversed(_components(oid))):
+            child = parent[1][component]
+            if child[0] is not None or child[1]:
+                break
+            del parent[1][component]
+        return True
+
+    def lookup(self, oid):
+        """
+        :param oid: String, e.g. '1.3.6.1.2.1.1.3'
+        :return: The mapping record for exactly this OID, or None.
+        """
+        node = self.root
+        for component in _components(oid):
+            node = node[1].get(component)
+            if node is None:
+                return None
+        return node[0]
+
+    def longest_prefix(self, oid):
+        """
+        :param oid: String, e.g. '1.3.6.1.2.1.2.2.1.10.5'
+        :return: (matched OID string, record, remaining components as a string) for the deepest mapped prefix, or
+                 (None, None, oid) when nothing matches.
+        """
+        components = _components(oid)
+        node = self.root
+        best = None
+        for depth, component in enumerate(components):
+            node = node[1].get(component)
+            if node is None:
+                break
+            if node[0] is not None:
+                best = (depth + 1, node[0])
+        if best is None:
+            return None, None, oid
+        depth, record = best
+        return ('.'.join(str(c) for c in components[:depth]), record,
+                '.'.join(str(c) for c in components[depth:]))
+
+    def resolve(self, oid):
+        """
+        :param oid: String, a numeric OID, possibly with an instance suffix.
+        :return: String, e.g. 'ifInOctets.5', or the OID unchanged if no prefix is mapped.
+        """
+        matched, record, remainder = self.longest_prefix(oid)
+        if record is None:
+            return oid
+        name = record.get(C.API_ID) or record.get(C.API_NAME)
+        return '%s.%s' % (name, remainder) if remainder else name
+
+    def subtree(self, oid=''):
+        """
+        :param oid: String, the subtree root. Empty for the whole index.
+        :return: Generator of (OID string, record) under (and including) oid, in OID order.
+        """
+        components = _components(oid)
+        node = self.root
+        for component in components:
+            node = node[1].get(component)
+            if node is None:
+                return
+        stack = [(components, node)]
+        while stack:
+            prefix, node = stack.pop()
+            if node[0] is not None:
+                yield '.'.join(str(c) for c in prefix), node[0]
+            for component in sorted(node[1], reverse=True):
+                stack.append((prefix + (component,), node[1][component]))
+
+    def build(self, api, limit=C.API_KEYWORD_DEFAULTS[C.API_LIMIT]):
+        """
+        :param api: ZenossAPI
+        :param limit: Int, getOidMappings page size.
+        :return: self
+        """
+        self.root = [None, {}]
+        self.fingerprints = {}
+        for uid in self.mib_uids:
+            for record in api.iter_oid_mappings(uid, limit=limit):
+                if record.get(C.API_OID):
+                    self.insert(record[C.API_OID], record)
+        return self
+
+    def refresh(self, api, limit=C.API_KEYWORD_DEFAULTS[C.API_LIMIT]):
+        """
+        Re-read the mappings and only touch the trie where a record was added, changed or removed.
+        :param api: ZenossAPI
+        :param limit: Int, getOidMappings page size.
+        :return: Dict, {'added': Int, 'modified': Int, 'removed': Int}
+        """
+        seen = set()
+        counts = {C.DIFF_ADDED: 0, C.DIFF_MODIFIED: 0, C.DIFF_REMOVED: 0}
+        for uid in self.mib_uids:
+            for record in api.iter_oid_mappings(uid, limit=limit):
+                if not record.get(C.API_OID):
+                    continue
+                oid = '.'.join(str(c) for c in _components(record[C.API_OID]))
+                seen.add(oid)
+                fp = self.fingerprints.get(oid)
+                if fp != ZenossAPI.fingerprint(record):
+                    counts[C.DIFF_ADDED if fp is None else C.DIFF_MODIFIED] += 1
+                    self.insert(oid, record)
+        for oid in set(self.fingerprints) - seen:
+            self.remove(oid)
+            counts[C.DIFF_REMOVED] += 1
+        return counts
+
+    def save(self, path):
+        fout = open(path + '.tmp', 'w')
+        try:
+            json.dump({C.OID_INDEX_MIBS: self.mib_uids, C.OID_INDEX_RECORDS: list(self.subtree())}, fout,
+                      separators=(',', ':'))
+        finally:
+            fout.close()
+        os.rename(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        fin = open(path, 'r')
+        try:
+            obj = json.load(fin)
+        finally:
+            fin.close()
+        index = cls(obj[C.OID_INDEX_MIBS])
+        for oid, record in obj[C.OID_INDEX_RECORDS]:
+            index.insert(oid, record)
+        return index
@@ -0,0 +1,129 @@
+import operator
+import functools
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+
+class PathMatcher(object):
+    """
+    Checks on the '/'-separated components of a path attribute (usually the uid), compiled once and run over whole
+    result sets. checks and values are keyed by component index (negative indexes count from the end):
+    e.g. PathMatcher({-2: '__eq__', -1: 'startswith'}, {-2: 'datasources', -1: 'Uptime'})
+    A check is a string method name or a function of (component, value).
+    """
+    # Checks whose value must appear literally in the path; used to reject most records without splitting them.
+    LITERAL_CHECKS = ('__eq__', 'startswith', 'endswith', '__contains__')
+
+    def __init__(self, checks, values, key=C.API_UID):
+        """
+        :param checks: Dict of {component index: method name or function}
+        :param values: Dict of {component index: value to check against}
+        :param key: String, the record attribute holding the path.
+        """
+        self.key = key
+        self.values = values
+        self.ops = []
+        self.needles = []
+        for k, check in sorted(checks.items()):
+            if callable(check):
+                func = functools.partial(lambda f, v, part: f(part, v), check, values[k])
+            elif check == '__eq__':
+                func = functools.partial(operator.eq, values[k])
+            else:
+                func = operator.methodcaller(check, values[k])
+            self.ops.append((k, func))
+            if check in self.LITERAL_CHECKS:
+                self.needles.append(values[k])
+
+        # Only split as far as the checks reach.
+        indexes = list(checks)
+        self.head = max([k for k in indexes if k >= 0] or [-1])
+        self.tail = min([k for k in indexes if k < 0] or [0])
+        self.eq = dict((k, values[k]) for k, check in checks.items() if check == '__eq__')
+
+    def _parts(self, path):
+        if self.tail == 0:
+            return path.split('/', self.head + 1)
+        if self.head < 0:
+            return path.rsplit('/', -self.tail)
+        return path.split('/')
+
+    def match(self, path):
+        """
+        :param path: String, e.g. a uid.
+        :return: Boolean, True when every check passes. Paths too short for a check don't match.
+        """
+        for needle in self.needles:
+            if needle not in path:
+                return False
+        parts = self._parts(path)
+        n = len(parts)
+        for k, func in self.ops:
+            if not -n <= k < n or not func(parts[k]):
+                return False
+        return True
+
+    def filter(self, data, records=False):
+        """
+        :param data: List of dicts, e.g. a listing response's data.
+        :param records: Boolean, return the matching dicts rather than their path values.
+        :return: List of every match, in the order of data.
+        """
+        key = self.key
+        match = self.match
+        return [d if records else d[key] for d in data if key in d and match(d[key])]
+
+    def first(self, data):
+        """
+        :return: The path value of the first match.
+        :raises ZenossError: when nothing matches.
+        """
+        key = self.key
+        for d in data:
+            if key in d and self.match(d[key]):
+                return d[key]
+        raise ZenossError(C.ERROR_VALUES_S_NO_MATCH_S % (self.values.values(), key))
+
+
+class PathIndex(object):
+    """
+    An index of one listing by (component index, component) for answering many PathMatcher queries against the same
+    data, e.g. resolving thousands of names against one getTemplates result. Each component is indexed from the start
+    and from the end of the path, so both positive and negative indexes can be looked up.
+    """
+    def __init__(self, data, key=C.API_UID):
+        """
+        :param data: List of dicts.
+        :param key: String, the record attribute holding the path.
+        """
+        self.data = [d for d in data if key in d]
+        self.key = key
+        self.postings = {}
+        for i, d in enumerate(self.data):
+            parts = d[key].split('/')
+            n = len(parts)
+            for j, part in enumerate(parts):
+                self.postings.setdefault((j, part), []).append(i)
+                self.postings.setdefault((j - n, part), []).append(i)
+
+    def filter(self, matcher, records=False):
+        """
+        :param matcher: PathMatcher. Its '__eq__' checks are answered from the index; the rest only run on the
+                        records the index leaves.
+        :param records: Boolean, return the matching dicts rather than their path values.
+        :return: List of every match, in the order of the indexed data.
+        """
+        if matcher.eq:
+            candidates = min((self.postings.get(k, []) for k in matcher.eq.items()), key=len)
+            candidates = [self.data[i] for i in candidates]
+        else:
+            candidates = self.data
+        return matcher.filter(candidates, records=records)
+
+    def query(self, checks, values, records=False):
+        return self.filter(PathMatcher(checks, values, key=self.key), records=records)
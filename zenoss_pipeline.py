@@ -0,0 +1,66 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from zenoss5_api.CONSTS import C
+except ImportError:
+    from CONSTS import C
+
+
+def ordered_map(executor, func, iterable, in_flight):
+    """
+    Like executor.map, but only pulls from iterable as results are consumed, so at most in_flight items (and their
+    results) are held at once. Results come back in input order.
+    :param executor: ThreadPoolExecutor or ProcessPoolExecutor
+    :param func: Function of one item. Must be picklable (module level) for a ProcessPoolExecutor.
+    :param iterable: Items, e.g. a generator of pages.
+    :param in_flight: Int, items submitted but not yet consumed.
+    :return: Generator of func(item).
+    """
+    items = iter(iterable)
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max(1, in_flight):
+            break
+    while pending:
+        result = pending.popleft().result()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            break
+        yield result
+
+
+class ProcessStage(object):
+    """
+    Runs a CPU-bound transform (decoding, building records, path matching, diffing) over a stream of pages in worker
+    processes, so it isn't limited to one core by the GIL. Pages are still fetched on I/O threads; only the transform
+    moves. Each item should be a whole page so the pickling cost is paid per page, not per device.
+    """
+    def __init__(self, func, processes=C.PIPELINE_PROCESSES, in_flight=None):
+        """
+        :param func: Function of one page, defined at module level so it can be pickled.
+        :param processes: Int, worker processes. 0 runs func inline in this process; None uses every CPU.
+        :param in_flight: Int, pages handed to the workers but not yet consumed (default: 2 per process).
+        """
+        self.func = func
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.in_flight = in_flight or 2 * max(1, self.processes)
+
+    def map(self, iterable):
+        """
+        :param iterable: Pages.
+        :return: Generator of func(page), in the order of iterable.
+        """
+        if not self.processes:
+            for item in iterable:
+                yield self.func(item)
+            return
+
+        pool = ProcessPoolExecutor(max_workers=self.processes)
+        try:
+            for result in ordered_map(pool, self.func, iterable, self.in_flight):
+                yield result
+        finally:
+            pool.shutdown()
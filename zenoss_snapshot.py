@@ -0,0 +1,331 @@
+import os
+import json
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_api import ZenossAPI
+    from zenoss5_api.zenoss_base import ZenossError
+    from zenoss5_api.zenoss_export import ZenossExporter, iter_export
+except ImportError:
+    from CONSTS import C
+    from zenoss_api import ZenossAPI
+    from zenoss_base import ZenossError
+    from zenoss_export import ZenossExporter, iter_export
+
+
+# magic, index offset, index length
+_HEADER = struct.Struct('<8sQQ')
+
+
+def _device_class(uid):
+    # '/zport/dmd/Devices/Server/Linux/devices/host' -> '/zport/dmd/Devices/Server/Linux'
+    return uid.rsplit(C.SNAPSHOT_DEVICES_PATH_PART, 1)[0]
+
+
+class SnapshotWriter(object):
+    """
+    Layout: fixed header, then one compact JSON blob per record, then a JSON index of
+    [uid, offset, length, {listing field: value}] entries plus name and device class indexes. Only the index is parsed
+    on open; records are decoded from the memory map on first access.
+    """
+    def __init__(self, path, index_keys=C.SNAPSHOT_INDEX_KEYS):
+        """
+        :param path: String, the snapshot file to write. It only appears once close() succeeds.
+        :param index_keys: List, listing fields to keep in the index for get_devices' filters and sort.
+        """
+        self.path = path
+        self.index_keys = list(index_keys)
+        self.fout = open(path + '.tmp', 'wb')
+        self.fout.write(_HEADER.pack(C.SNAPSHOT_MAGIC, 0, 0))
+        self.uids = []
+        self.names = {}
+        self.classes = {}
+        self.templates = None
+
+    def _write_blob(self, obj):
+        offset = self.fout.tell()
+        blob = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+        self.fout.write(blob)
+        return [offset, len(blob)]
+
+    def add_device(self, listing, info=None, bound_templates=None):
+        uid = listing[C.API_UID]
+        record = {C.EXPORT_LISTING: listing, C.EXPORT_INFO: info, C.SNAPSHOT_BOUND_TEMPLATES: bound_templates}
+        fields = dict((k, listing[k]) for k in self.index_keys if k in listing)
+        self.uids.append([uid] + self._write_blob(record) + [fields])
+        if listing.get(C.API_NAME):
+            self.names.setdefault(listing[C.API_NAME], []).append(uid)
+        self.classes.setdefault(_device_class(uid), []).append(uid)
+
+    def set_templates(self, tree):
+        self.templates = self._write_blob(tree)
+
+    def close(self):
+        index = {C.SNAPSHOT_INDEX_UIDS: self.uids, C.SNAPSHOT_INDEX_NAMES: self.names,
+                 C.SNAPSHOT_INDEX_CLASSES: self.classes, C.SNAPSHOT_TEMPLATES: self.templates,
+                 C.SNAPSHOT_INDEX_FIELDS: self.index_keys}
+        offset, length = self._write_blob(index)
+        self.fout.seek(0)
+        self.fout.write(_HEADER.pack(C.SNAPSHOT_MAGIC, offset, length))
+        self.fout.close()
+        # Readers never see a half-written snapshot.
+        os.rename(self.path + '.tmp', self.path)
+
+    def abort(self):
+        # Drop the partial file after a failed build; an older snapshot at path is left alone.
+        self.fout.close()
+        if os.path.exists(self.path + '.tmp'):
+            os.remove(self.path + '.tmp')
+
+
+class SnapshotStore(object):
+    def __init__(self, path, cache_size=C.SNAPSHOT_CACHE_SIZE):
+        """
+        :param path: String, a file written by SnapshotWriter (see build_snapshot).
+        :param cache_size: Int, decoded device records to keep, least recently used dropped first. 0 for none.
+        """
+        self.path = path
+        self.fin = open(path, 'rb')
+        try:
+            self.mm = mmap.mmap(self.fin.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap refuses empty files.
+            self.fin.close()
+            raise ZenossError(C.ERROR_SNAPSHOT_BAD_FILE_S % path)
+
+        magic, offset, length = _HEADER.unpack_from(self.mm, 0)
+        if magic != C.SNAPSHOT_MAGIC or not offset:
+            self.close()
+            raise ZenossError(C.ERROR_SNAPSHOT_BAD_FILE_S % path)
+
+        index = self._read_blob(offset, length)
+        self.order = [entry[0] for entry in index[C.SNAPSHOT_INDEX_UIDS]]
+        self.offsets = dict((entry[0], (entry[1], entry[2])) for entry in index[C.SNAPSHOT_INDEX_UIDS])
+        # Older snapshots have no indexed listing fields.
+        self.fields = dict((entry[0], entry[3] if len(entry) > 3 else {}) for entry in index[C.SNAPSHOT_INDEX_UIDS])
+        self.index_keys = set(index.get(C.SNAPSHOT_INDEX_FIELDS) or [])
+        self.names = index[C.SNAPSHOT_INDEX_NAMES]
+        self.classes = index[C.SNAPSHOT_INDEX_CLASSES]
+        self.templates_offset = index[C.SNAPSHOT_TEMPLATES]
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _read_blob(self, offset, length):
+        return json.loads(self.mm[offset:offset+length].decode('utf-8'))
+
+    def close(self):
+        self.mm.close()
+        self.fin.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, uid):
+        return uid in self.offsets
+
+    def device(self, uid):
+        """
+        :param uid: String, the device uid.
+        :return: Dict with 'listing', 'info' and 'bound_templates', or None if the uid isn't in the snapshot.
+        """
+        with self._cache_lock:
+            if uid in self._cache:
+                # Most recently used last.
+                self._cache[uid] = record = self._cache.pop(uid)
+                return record
+        if uid not in self.offsets:
+            return None
+        record = self._read_blob(*self.offsets[uid])
+        if self.cache_size > 0:
+            with self._cache_lock:
+                self._cache[uid] = record
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return record
+
+    def indexed(self, uid):
+        """
+        :param uid: String, the device uid.
+        :return: Dict of the listing fields kept in the index (see index_keys), without decoding the record.
+        """
+        return self.fields.get(uid, {})
+
+    def uids_by_name(self, name):
+        return list(self.names.get(name, []))
+
+    def uids_in_class(self, class_uid, recursive=True):
+        """
+        :param class_uid: String, e.g. C.API_DEVICES_SERVER_LINUX
+        :param recursive: Boolean, include devices in sub-classes.
+        :return: List of device uids.
+        """
+        if not recursive:
+            return list(self.classes.get(class_uid, []))
+        uids = []
+        for cls, members in self.classes.items():
+            if cls == class_uid or cls.startswith(class_uid.rstrip('/') + '/'):
+                uids.extend(members)
+        return uids
+
+    def templates(self):
+        if self.templates_offset is None:
+            return None
+        return self._read_blob(*self.templates_offset)
+
+
+def build_snapshot(api, path, uid=None, listing_keys=None, info_keys=None, bound_templates=True, templates=True,
+                   page_size=C.EXPORT_PAGE_SIZE, workers=C.BULK_WORKERS):
+    """
+    :param api: ZenossAPI
+    :param path: String, the snapshot file to write.
+    :param uid: String, the device class to snapshot (default: all devices).
+    :param listing_keys: List, device attributes to request from getDevices.
+    :param info_keys: List, when set, also store getInfo data with these keys for every device.
+    :param bound_templates: Boolean, also store getBoundTemplates for every device.
+    :param templates: Boolean, also store the getTemplates tree.
+    :param page_size: Int, devices per getDevices call.
+    :param workers: Int, calls in flight at once.
+    :return: SnapshotStore for the new file.
+    """
+    exporter = ZenossExporter(api, page_size=page_size, workers=workers)
+
+    def details(device_uid):
+        info = bound = None
+        if info_keys is not None:
+            info, success = api._get_result_data(api.get_device_info(device_uid, keys=info_keys,
+                                                                      validate_success=True))
+        if bound_templates:
+            bound, success = api._get_result_data(api.get_bound_templates(device_uid, validate_success=True))
+        return info, bound
+
+    writer = SnapshotWriter(path)
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        for devices in exporter.iter_device_pages(pool, uid=uid, keys=listing_keys):
+            futures = [pool.submit(details, device[C.API_UID]) for device in devices]
+            for device, future in zip(devices, futures):
+                info, bound = future.result()
+                writer.add_device(device, info=info, bound_templates=bound)
+        if templates:
+            writer.set_templates(api.get_templates(C.API_ENDPOINT + C.API_DEVICES)[C.API_RESULT])
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        pool.shutdown()
+    return SnapshotStore(path)
+
+
+def build_snapshot_from_export(export_path, path):
+    """
+    :param export_path: String, a device export written by ZenossExporter.export_devices.
+    :param path: String, the snapshot file to write.
+    :return: SnapshotStore for the new file.
+    """
+    writer = SnapshotWriter(path)
+    try:
+        for record in iter_export(export_path):
+            if record.get(C.EXPORT_KIND) == C.EXPORT_KIND_DEVICE:
+                writer.add_device(record[C.EXPORT_LISTING], info=record.get(C.EXPORT_INFO))
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    return SnapshotStore(path)
+
+
+class ZenossSnapshotAPI(ZenossAPI):
+    """
+    Read-only stand-in for ZenossAPI that answers get_devices, get_device_info, get_bound_templates and
+    get_templates from a SnapshotStore, in the same response format as the live API. Anything else that would reach
+    api_request raises ZenossError.
+    """
+    def __init__(self, store):
+        # Deliberately skips ZenossAPI.__init__: no credentials or host lookup are needed.
+        self.store = store if isinstance(store, SnapshotStore) else SnapshotStore(store)
+        self.host = None
+        self._init_state()
+
+    def api_request(self, endpoint, action, method, *args, **kwargs):
+        raise ZenossError(C.ERROR_SNAPSHOT_READ_ONLY_S % method)
+
+    def api_batch_request(self, endpoint, action, method, *args, **kwargs):
+        raise ZenossError(C.ERROR_SNAPSHOT_READ_ONLY_S % method)
+
+    def _result(self, data=None, success=True, msg=None, **kwargs):
+        result = {C.API_SUCCESS: success}
+        if data is not None:
+            result[C.API_DATA] = data
+        if msg is not None:
+            result[C.API_MSG] = msg
+        result.update(kwargs)
+        return {C.API_RESULT: result}
+
+    def _missing(self, uid, validate_success):
+        if validate_success:
+            raise ZenossError(C.ERROR_SNAPSHOT_NO_UID_S % uid)
+        return self._result(success=False, msg=C.ERROR_SNAPSHOT_NO_UID_S % uid)
+
+    def get_devices(self, validate_success=False, uid=None, start=None, limit=None, sort=None, direction=None,
+                    params=None, keys=None):
+        uids = self.store.uids_in_class(uid) if uid else self.store.order
+        params = params or {}
+        if set(params) | set([sort] if sort else []) <= self.store.index_keys:
+            # Filter and sort on the index; only the requested page gets decoded.
+            listing = self.store.indexed
+        else:
+            listing = lambda device_uid: self.store.device(device_uid)[C.EXPORT_LISTING]
+
+        matches = []
+        for device_uid in uids:
+            fields = listing(device_uid)
+            for k, v in params.items():
+                if (fields.get(k) not in v) if isinstance(v, list) else (fields.get(k) != v):
+                    break
+            else:
+                matches.append((device_uid, fields.get(sort) if sort else None))
+
+        if sort:
+            matches.sort(key=lambda m: m[1], reverse=(direction == 'DESC'))
+        total = len(matches)
+        start = start or 0
+        matches = matches[start:start+limit] if limit else matches[start:]
+        devices = [self.store.device(device_uid)[C.EXPORT_LISTING] for device_uid, value in matches]
+        if keys:
+            keys = self._non_str_iterable(keys)
+            devices = [dict((k, d[k]) for k in keys if k in d) for d in devices]
+        return {C.API_RESULT: {C.API_DEVICES_KEY: devices, C.API_TOTAL_COUNT: total, C.API_SUCCESS: True}}
+
+    def get_device_info(self, uid, keys=None, validate_success=False):
+        record = self.store.device(uid)
+        if record is None:
+            return self._missing(uid, validate_success)
+        info = record[C.EXPORT_INFO] or record[C.EXPORT_LISTING]
+        if keys:
+            info = dict((k, info[k]) for k in self._non_str_iterable(keys) if k in info)
+        return self._result(info)
+
+    def get_bound_templates(self, uid, validate_success=False):
+        record = self.store.device(uid)
+        if record is None or record[C.SNAPSHOT_BOUND_TEMPLATES] is None:
+            return self._missing(uid, validate_success)
+        return self._result(record[C.SNAPSHOT_BOUND_TEMPLATES])
+
+    def get_templates(self, zid='', validate_success=False):
+        tree = self.store.templates()
+        if tree is None:
+            raise ZenossError(C.ERROR_SNAPSHOT_READ_ONLY_S % C.API_METHOD_GET_TEMPLATES)
+        return {C.API_RESULT: tree}
@@ -0,0 +1,626 @@
+import json
+import time
+import zlib
+import logging
+import argparse
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_api import ZenossAPI
+except ImportError:
+    from CONSTS import C
+    from zenoss_api import ZenossAPI
+
+
+class StubZenoss(object):
+    """
+    In-process stand-in for the Zenoss JSON API, for benchmarks and trying things out without a Zenoss server.
+    Answers Ext.Direct envelopes (single and batched) on any router endpoint from self.handlers, a dict of
+    {method or (action, method): function(data dict) -> result}. Can compress its responses and simulate a slow link.
+    Methods in self.errors ({method: HTTP status}) fail as a whole, e.g. to simulate a stalled router.
+    """
+    def __init__(self, devices=0, device_class=C.API_DEVICES_SERVER_LINUX, bandwidth=None, latency=0.0,
+                 compress_min_bytes=1024, job_polls=2):
+        """
+        :param devices: Int, fake devices to create in device_class.
+        :param device_class: String, device class uid for the fake devices.
+        :param bandwidth: Int, simulated link speed in bytes per second (None for unthrottled).
+        :param latency: Float, simulated round trip time in seconds, added to every request.
+        :param compress_min_bytes: Int, only compress responses at least this big.
+        :param job_polls: Int, JobsRouter getInfo calls a job answers with PENDING/STARTED before it succeeds.
+        """
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.compress_min_bytes = compress_min_bytes
+        self.lock = threading.Lock()
+        self.calls = []
+        self.devices = {}
+        self.bound_templates = {}
+        self.job_polls = job_polls
+        self.jobs = {}  # uuid -> [job record, remaining polls, device uid]
+        self.errors = {}
+        self.mibs = {}  # MIB module uid -> [OID mapping record]
+        self.events = {}  # evid -> event
+        self.template_objects = {}  # uid -> record, for templates and everything in them
+        self.device_classes = set()
+        parent = device_class
+        while parent.startswith(C.API_ENDPOINT + C.API_DEVICES):
+            # The device class and all its parents, up to /zport/dmd/Devices.
+            self.device_classes.add(parent)
+            parent = parent.rsplit('/', 1)[0]
+        for i in range(devices):
+            self.add_fake_device('%s%sstub-%05d.example.com' % (device_class, C.SNAPSHOT_DEVICES_PATH_PART, i))
+
+        self.handlers = {
+            C.API_METHOD_GET_DEVICES: self.get_devices,
+            C.API_METHOD_GET_INFO: self.get_info,
+            C.API_METHOD_SET_INFO: self.set_info,
+            C.API_METHOD_REMOVE_DEVICES: self.remove_devices,
+            C.API_METHOD_SET_BOUND_TEMPLATES: self.set_bound_templates,
+            C.API_METHOD_GET_BOUND_TEMPLATES: self.get_bound_templates,
+            C.API_METHOD_BIND_OR_UNBIND_TEMPLATE: self.bind_or_unbind_template,
+            C.API_METHOD_ADD_DEVICE: self.add_device,
+            C.API_METHOD_GET_TEMPLATES: self.get_templates,
+            C.API_METHOD_GET_TREE: self.get_tree,
+            C.API_METHOD_ADD_DEVICE_CLASS: self.add_device_class_node,
+            C.API_METHOD_GET_OID_MAPPINGS: self.get_oid_mappings,
+            C.API_METHOD_ADD_OID_MAPPING: self.add_oid_mapping,
+            C.API_METHOD_ADD_TEMPLATE: self.add_template,
+            C.API_METHOD_DELETE_TEMPLATE: self.delete_template,
+            C.API_METHOD_ADD_DATA_SOURCE: self.add_data_source,
+            C.API_METHOD_GET_DATA_SOURCES: lambda data: self.list_template_objects(data, C.API_PATH_PART_DATA_SOURCES),
+            C.API_METHOD_ADD_DATA_POINT: self.add_data_point,
+            C.API_METHOD_GET_DATA_POINTS: lambda data: self.list_template_objects(data, C.API_PATH_PART_DATA_POINTS),
+            C.API_METHOD_ADD_THRESHOLD: self.add_threshold,
+            C.API_METHOD_GET_THRESHOLDS: lambda data: self.list_template_objects(data, C.API_PATH_PART_THRESHOLDS),
+            C.API_METHOD_ADD_GRAPH_DEFINITION: self.add_graph_definition,
+            C.API_METHOD_SET_GRAPH_DEFINITION: self.set_template_object_info,
+            C.API_METHOD_GET_GRAPHS: self.get_graphs,
+            C.API_METHOD_ADD_DATA_POINT_TO_GRAPH: self.add_data_point_to_graph,
+            C.API_METHOD_GET_GRAPH_POINTS: lambda data: self.list_template_objects(data, C.API_PATH_PART_GRAPH_POINTS),
+            (C.API_ACTION_TEMPLATE_ROUTER, C.API_METHOD_GET_INFO): self.get_template_object_info,
+            (C.API_ACTION_TEMPLATE_ROUTER, C.API_METHOD_SET_INFO): self.set_template_object_info,
+            (C.API_ACTION_JOBS_ROUTER, C.API_METHOD_GET_INFO): self.get_job_info,
+            (C.API_ACTION_JOBS_ROUTER, C.API_METHOD_ABORT_JOBS): self.abort_jobs,
+            (C.API_ACTION_EVENTS_ROUTER, C.API_METHOD_QUERY): self.query_events,
+            (C.API_ACTION_EVENTS_ROUTER, C.API_METHOD_ACKNOWLEDGE):
+                lambda data: self.set_event_state(data, C.API_EVENT_STATE_ACKNOWLEDGED),
+            (C.API_ACTION_EVENTS_ROUTER, C.API_METHOD_UNACKNOWLEDGE):
+                lambda data: self.set_event_state(data, C.API_EVENT_STATE_NEW),
+            (C.API_ACTION_EVENTS_ROUTER, C.API_METHOD_CLOSE):
+                lambda data: self.set_event_state(data, C.API_EVENT_STATE_CLOSED),
+            (C.API_ACTION_EVENTS_ROUTER, C.API_METHOD_REOPEN):
+                lambda data: self.set_event_state(data, C.API_EVENT_STATE_NEW),
+        }
+        self.server = None
+        self.uri = None
+
+    def add_fake_device(self, uid):
+        name = uid.rsplit('/', 1)[-1]
+        self.devices[uid] = {C.API_UID: uid, C.API_NAME: name, C.API_ID: name, C.API_PRODUCTION_STATE: 1000,
+                             'ipAddressString': '10.0.%d.%d' % (len(self.devices) // 250, len(self.devices) % 250 + 1),
+                             'collector': 'localhost', 'description': 'Stub device %s, serial %s' % (name, uid[::-1])}
+        self.bound_templates[uid] = ['Device']
+        return self.devices[uid]
+
+    @staticmethod
+    def event_time(at=None):
+        # Zenoss formats event times like this, to the second.
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() if at is None else at))
+
+    def add_fake_event(self, device, summary, severity=3, at=None):
+        """
+        Raise an event, or count another occurrence of an open one with the same device and summary.
+        :param device: String, device id.
+        :param summary: String
+        :param severity: Int, 0 (clear) to 5 (critical).
+        :param at: Float, epoch seconds (default: now).
+        :return: Dict, the event.
+        """
+        with self.lock:
+            stamp = self.event_time(at)
+            for event in self.events.values():
+                if event[C.API_DEVICE] == device and event[C.API_SUMMARY] == summary and \
+                        event[C.API_EVENT_STATE] != C.API_EVENT_STATE_CLOSED:
+                    event[C.API_LAST_TIME] = stamp
+                    event[C.API_COUNT] += 1
+                    return event
+            evid = '%08x-stub-event' % (len(self.events) + 1)
+            self.events[evid] = {C.API_EVID: evid, C.API_DEVICE: device, C.API_SUMMARY: summary,
+                                 C.API_SEVERITY: severity, C.API_EVENT_STATE: C.API_EVENT_STATE_NEW, C.API_COUNT: 1,
+                                 C.API_FIRST_TIME: stamp, C.API_LAST_TIME: stamp, C.API_STATE_CHANGE: stamp}
+            return self.events[evid]
+
+    def add_fake_mib(self, uid, mappings=100):
+        """
+        :param uid: String, MIB module uid, e.g. '/zport/dmd/Mibs/mibs/STUB-MIB'
+        :param mappings: Int, fake OID mappings to create in it.
+        """
+        name = uid.rsplit('/', 1)[-1]
+        self.mibs[uid] = [{C.API_UID: '%s/nodes/%sNode%d' % (uid, name, i), C.API_ID: '%sNode%d' % (name, i),
+                           C.API_OID: '1.3.6.1.4.1.99999.%d' % i, C.API_NODE_TYPE: 'scalar'} for i in range(mappings)]
+        return self.mibs[uid]
+
+    ####################################################################################################################
+    #  Router methods
+    ####################################################################################################################
+    def _missing(self, uid):
+        return {C.API_SUCCESS: False, C.API_MSG: 'ObjectNotFound: %s' % uid}
+
+    def get_devices(self, data):
+        uid = data.get(C.API_UID) or C.API_ENDPOINT + C.API_DEVICES
+        devices = [d for u, d in sorted(self.devices.items()) if u.startswith(uid)]
+        sort = data.get(C.API_SORT)
+        if sort:
+            devices.sort(key=lambda d: d.get(sort), reverse=(data.get(C.API_DIR) == 'DESC'))
+        start = data.get(C.API_START) or 0
+        limit = data.get(C.API_LIMIT)
+        page = devices[start:start+limit] if limit else devices[start:]
+        keys = data.get(C.API_KEYS)
+        if keys:
+            page = [dict((k, d[k]) for k in keys if k in d) for d in page]
+        return {C.API_DEVICES_KEY: page, C.API_TOTAL_COUNT: len(devices), C.API_SUCCESS: True}
+
+    def get_info(self, data):
+        device = self.devices.get(data.get(C.API_UID))
+        if device is None:
+            return self._missing(data.get(C.API_UID))
+        keys = data.get(C.API_KEYS)
+        return {C.API_SUCCESS: True, C.API_DATA: dict((k, v) for k, v in device.items() if not keys or k in keys)}
+
+    def set_info(self, data):
+        device = self.devices.get(data.get(C.API_UID))
+        if device is None:
+            return self._missing(data.get(C.API_UID))
+        device.update((k, v) for k, v in data.items() if k != C.API_UID)
+        return {C.API_SUCCESS: True}
+
+    def remove_devices(self, data):
+        for uid in data.get(C.API_UIDS) or []:
+            self.devices.pop(uid, None)
+            self.bound_templates.pop(uid, None)
+        return {C.API_SUCCESS: True}
+
+    def _bindable(self, uid):
+        # Templates bind to devices and device classes. Like devices, a class starts out with the Device template.
+        if uid in self.devices or uid in self.device_classes:
+            return self.bound_templates.setdefault(uid, ['Device'])
+        return None
+
+    def set_bound_templates(self, data):
+        if self._bindable(data.get(C.API_UID)) is None:
+            return self._missing(data.get(C.API_UID))
+        self.bound_templates[data[C.API_UID]] = list(data.get(C.API_TEMPLATE_IDS) or [])
+        return {C.API_SUCCESS: True}
+
+    def get_bound_templates(self, data):
+        bound = self._bindable(data.get(C.API_UID))
+        if bound is None:
+            return self._missing(data.get(C.API_UID))
+        return {C.API_SUCCESS: True, C.API_DATA: [[t, t] for t in bound]}
+
+    def bind_or_unbind_template(self, data):
+        device = self.devices.get(data.get(C.API_UID))
+        if device is None:
+            return self._missing(data.get(C.API_UID))
+        bound = self.bound_templates[device[C.API_UID]]
+        template_id = (data.get(C.API_TEMPLATE_UID) or '').rstrip('/').split('/')[-1]
+        if template_id in bound:
+            bound.remove(template_id)
+        else:
+            bound.append(template_id)
+        return {C.API_SUCCESS: True}
+
+    def get_tree(self, data):
+        root = data.get(C.API_ID) or C.API_ENDPOINT + C.API_DEVICES
+        if root not in self.device_classes:
+            return self._missing(root)
+        nodes = dict((uid, {C.API_UID: uid, C.API_TEXT: uid.rsplit('/', 1)[-1], C.API_CHILDREN: []})
+                     for uid in self.device_classes if uid == root or uid.startswith(root + '/'))
+        for uid in sorted(nodes):
+            if uid != root:
+                nodes[uid.rsplit('/', 1)[0]][C.API_CHILDREN].append(nodes[uid])
+        return [nodes[root]]
+
+    def add_device_class_node(self, data):
+        parent = data.get(C.API_CONTEXT_UID)
+        if parent not in self.device_classes:
+            return self._missing(parent)
+        uid = '%s/%s' % (parent, data.get(C.API_ID))
+        if uid in self.device_classes:
+            return {C.API_SUCCESS: False, C.API_MSG: 'Device class %s already exists' % uid}
+        self.device_classes.add(uid)
+        return {C.API_SUCCESS: True}
+
+    def query_events(self, data):
+        # params values match exactly, or by membership when given as a list (e.g. {'severity': [5, 4]}).
+        params = data.get(C.API_PARAMS) or {}
+        events = [e for e in self.events.values()
+                  if all(e.get(k) in (v if isinstance(v, list) else [v]) for k, v in params.items())]
+        if data.get(C.API_UID) and data[C.API_UID] in self.devices:
+            events = [e for e in events if e[C.API_DEVICE] == self.devices[data[C.API_UID]][C.API_ID]]
+        sort = data.get(C.API_SORT) or C.API_LAST_TIME
+        # Newest evid first among equal times, as a stable tie breaker.
+        events.sort(key=lambda e: (e.get(sort), e[C.API_EVID]), reverse=(data.get(C.API_DIR) or 'DESC') == 'DESC')
+        start = data.get(C.API_START) or 0
+        limit = data.get(C.API_LIMIT)
+        page = events[start:start+limit] if limit else events[start:]
+        keys = data.get(C.API_KEYS)
+        page = [dict((k, v) for k, v in e.items() if not keys or k in keys) for e in page]
+        return {C.API_EVENTS: page, C.API_TOTAL_COUNT: len(events), C.API_ASOF: time.time(), C.API_SUCCESS: True}
+
+    def set_event_state(self, data, state):
+        stamp = self.event_time()
+        for evid in data.get(C.API_EVIDS) or []:
+            event = self.events.get(evid)
+            if event is not None and event[C.API_EVENT_STATE] != state:
+                event[C.API_EVENT_STATE] = state
+                event[C.API_STATE_CHANGE] = stamp
+        return {C.API_SUCCESS: True, C.API_DATA: {C.API_COUNT: len(data.get(C.API_EVIDS) or [])}}
+
+    def get_templates(self, data):
+        # Like Zenoss, one node per template name (its id is the name) with every template of that name under the
+        # requested path as its children. Names bound anywhere but never created get a template at the path itself.
+        uid = data.get(C.API_ID) or C.API_ENDPOINT + C.API_DEVICES
+        templates = [dict(t) for u, t in sorted(self.template_objects.items())
+                     if u.startswith(uid) and u.rsplit('/', 2)[-2] == C.API_TEMPLATE_TYPE_RRD_TEMPLATES[1:]]
+        names = sorted(set(name for bound in self.bound_templates.values() for name in bound) -
+                       set(t[C.API_ID] for t in templates))
+        templates.extend({C.API_UID: uid + C.API_TEMPLATE_TYPE_RRD_TEMPLATES + '/' + name, C.API_ID: name,
+                          C.API_TEXT: name} for name in names)
+        nodes = {}
+        for template in templates:
+            nodes.setdefault(template[C.API_ID], []).append(template)
+        return [{C.API_ID: name, C.API_TEXT: name, C.API_CHILDREN: nodes[name]} for name in sorted(nodes)]
+
+    def _add_template_object(self, parent, part, name, **fields):
+        # Adds <parent>/<part>/<name>, failing like Zenoss when the parent is missing or the name is taken.
+        if parent not in self.template_objects:
+            return self._missing(parent), None
+        uid = '%s/%s/%s' % (parent, part, name)
+        if uid in self.template_objects:
+            return {C.API_SUCCESS: False, C.API_MSG: 'There is already an object named %s' % name}, None
+        self.template_objects[uid] = dict(fields, **{C.API_UID: uid, C.API_ID: name, C.API_NAME: name})
+        return {C.API_SUCCESS: True}, self.template_objects[uid]
+
+    def add_template(self, data):
+        target = data.get(C.API_TARGET_UID)
+        if target not in self.device_classes and target not in self.devices:
+            return self._missing(target)
+        uid = '%s%s/%s' % (target, C.API_TEMPLATE_TYPE_RRD_TEMPLATES, data.get(C.API_ID))
+        if uid in self.template_objects:
+            return {C.API_SUCCESS: False, C.API_MSG: 'There is already a template named %s' % data.get(C.API_ID)}
+        self.template_objects[uid] = {C.API_UID: uid, C.API_ID: data.get(C.API_ID), C.API_TEXT: data.get(C.API_ID)}
+        return {C.API_SUCCESS: True, C.API_NODE_CONFIG: dict(self.template_objects[uid])}
+
+    def delete_template(self, data):
+        uid = data.get(C.API_UID)
+        if uid not in self.template_objects:
+            return self._missing(uid)
+        for object_uid in [u for u in self.template_objects if u == uid or u.startswith(uid + '/')]:
+            del self.template_objects[object_uid]
+        return {C.API_SUCCESS: True}
+
+    def add_data_source(self, data):
+        result, ds = self._add_template_object(data.get(C.API_TEMPLATE_UID), C.API_PATH_PART_DATA_SOURCES,
+                                               data.get(C.API_NAME), **{C.API_TYPE: data.get(C.API_TYPE),
+                                                                        C.API_OID: ''})
+        if ds is not None:
+            # Zenoss gives a new data source a data point of the same name.
+            self._add_template_object(ds[C.API_UID], C.API_PATH_PART_DATA_POINTS, ds[C.API_ID])
+        return result
+
+    def add_data_point(self, data):
+        return self._add_template_object(data.get(C.API_DATA_SOURCE_UID), C.API_PATH_PART_DATA_POINTS,
+                                         data.get(C.API_NAME))[0]
+
+    def add_threshold(self, data):
+        return self._add_template_object(data.get(C.API_UID), C.API_PATH_PART_THRESHOLDS, data.get(C.API_THRESHOLD_ID),
+                                         **{C.API_TYPE: data.get(C.API_THRESHOLD_TYPE),
+                                            C.API_DATA_POINTS: list(data.get(C.API_DATA_POINTS) or [])})[0]
+
+    def add_graph_definition(self, data):
+        return self._add_template_object(data.get(C.API_TEMPLATE_UID), C.API_PATH_PART_GRAPH_DEFS,
+                                         data.get(C.API_GRAPH_DEFINITION_ID))[0]
+
+    def add_data_point_to_graph(self, data):
+        dp_uid, graph_uid = data.get(C.API_DATA_POINT_UID), data.get(C.API_GRAPH_UID)
+        if dp_uid not in self.template_objects:
+            return self._missing(dp_uid)
+        ds_name, dp_name = dp_uid.split('/')[-3], dp_uid.split('/')[-1]
+        result = self._add_template_object(graph_uid, C.API_PATH_PART_GRAPH_POINTS, dp_name,
+                                           **{C.CRAWL_DP_NAME: '%s_%s' % (ds_name, dp_name)})[0]
+        if result[C.API_SUCCESS] and data.get(C.API_INCLUDE_THRESHOLDS):
+            template_uid = graph_uid.rsplit('/%s/' % C.API_PATH_PART_GRAPH_DEFS, 1)[0]
+            for threshold in self._template_objects_in(template_uid, C.API_PATH_PART_THRESHOLDS):
+                if dp_uid in threshold[C.API_DATA_POINTS]:
+                    self._add_template_object(graph_uid, C.API_PATH_PART_GRAPH_POINTS, threshold[C.API_ID],
+                                              **{C.API_TYPE: 'ThresholdGraphPoint'})
+        return result
+
+    def _template_objects_in(self, uid, part):
+        # Everything of one kind under uid, e.g. all data points of a template (they sit under its data sources).
+        return [dict(o) for u, o in sorted(self.template_objects.items())
+                if u.startswith(uid + '/') and u.rsplit('/', 2)[-2] == part]
+
+    def list_template_objects(self, data, part):
+        uid = data.get(C.API_UID)
+        if uid not in self.template_objects:
+            return self._missing(uid)
+        return {C.API_SUCCESS: True, C.API_DATA: self._template_objects_in(uid, part)}
+
+    def get_graphs(self, data):
+        # Like Zenoss, the graph list comes without a 'success'/'data' wrapper.
+        return self._template_objects_in(data.get(C.API_UID), C.API_PATH_PART_GRAPH_DEFS)
+
+    def get_template_object_info(self, data):
+        record = self.template_objects.get(data.get(C.API_UID))
+        if record is None:
+            return self._missing(data.get(C.API_UID))
+        return {C.API_SUCCESS: True, C.API_DATA: dict(record)}
+
+    def set_template_object_info(self, data):
+        record = self.template_objects.get(data.get(C.API_UID))
+        if record is None:
+            return self._missing(data.get(C.API_UID))
+        record.update((k, v) for k, v in data.items() if k != C.API_UID)
+        return {C.API_SUCCESS: True}
+
+    def add_oid_mapping(self, data):
+        mappings = self.mibs.get(data.get(C.API_UID))
+        if mappings is None:
+            return self._missing(data.get(C.API_UID))
+        if [m for m in mappings if m[C.API_ID] == data.get(C.API_ID)]:
+            return {C.API_SUCCESS: False, C.API_MSG: 'There is already a node named %s' % data.get(C.API_ID)}
+        mappings.append({C.API_UID: '%s/nodes/%s' % (data[C.API_UID], data.get(C.API_ID)), C.API_ID: data.get(C.API_ID),
+                         C.API_OID: data.get(C.API_OID), C.API_NODE_TYPE: data.get(C.API_NODE_TYPE)})
+        return {C.API_SUCCESS: True}
+
+    def get_oid_mappings(self, data):
+        mappings = self.mibs.get(data.get(C.API_UID))
+        if mappings is None:
+            return self._missing(data.get(C.API_UID))
+        start = data.get(C.API_START) or 0
+        limit = data.get(C.API_LIMIT)
+        page = mappings[start:start+limit] if limit else mappings[start:]
+        return {C.API_SUCCESS: True, C.API_DATA: page, C.API_COUNT: len(mappings)}
+
+    def add_device(self, data):
+        device_class = data.get(C.API_DEVICE_CLASS) or ''
+        uid = '%s%s%s%s' % (C.API_ENDPOINT + C.API_DEVICES, device_class, C.SNAPSHOT_DEVICES_PATH_PART,
+                            data.get(C.API_DEVICE_NAME))
+        if uid in self.devices:
+            return {C.API_SUCCESS: False, C.API_MSG: 'Device %s already exists' % data.get(C.API_DEVICE_NAME)}
+        uuid = '%08x-stub-job' % (len(self.jobs) + 1)
+        job = {C.API_UUID: uuid, C.API_STATUS: C.API_JOB_STATUS_PENDING,
+               C.API_DESCRIPTION: 'Add device %s' % data.get(C.API_DEVICE_NAME)}
+        self.jobs[uuid] = [job, self.job_polls, uid]
+        return {C.API_SUCCESS: True, C.API_NEW_JOBS: [dict(job)]}
+
+    def get_job_info(self, data):
+        entry = self.jobs.get(data.get(C.API_JOB_ID))
+        if entry is None:
+            return {C.API_SUCCESS: False, C.API_MSG: 'NoSuchJobException: %s' % data.get(C.API_JOB_ID)}
+        job = entry[0]
+        if job[C.API_STATUS] not in C.API_JOB_STATUS_FINISHED:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                job[C.API_STATUS] = C.API_JOB_STATUS_SUCCESS
+                self.add_fake_device(entry[2])
+            else:
+                job[C.API_STATUS] = C.API_JOB_STATUS_STARTED
+        return {C.API_SUCCESS: True, C.API_DATA: dict(job)}
+
+    def abort_jobs(self, data):
+        for uuid in data.get(C.API_JOB_IDS) or []:
+            if uuid in self.jobs and self.jobs[uuid][0][C.API_STATUS] not in C.API_JOB_STATUS_FINISHED:
+                self.jobs[uuid][0][C.API_STATUS] = C.API_JOB_STATUS_ABORTED
+        return {C.API_SUCCESS: True}
+
+    ####################################################################################################################
+    #  HTTP
+    ####################################################################################################################
+    def handle(self, envelope):
+        action, method = envelope.get(C.API_ACTION), envelope.get(C.API_METHOD)
+        data = (envelope.get(C.API_DATA) or [{}])[0]
+        with self.lock:
+            self.calls.append((action, method, data))
+            handler = self.handlers.get((action, method)) or self.handlers.get(method)
+            result = handler(data) if handler else {C.API_SUCCESS: False, C.API_MSG: 'Unknown method %s' % method}
+        return {C.API_TYPE: 'rpc', C.API_TID: envelope.get(C.API_TID), C.API_ACTION: action, C.API_METHOD: method,
+                C.API_RESULT: result}
+
+    def _throttle(self, size):
+        if self.bandwidth:
+            time.sleep(float(size) / self.bandwidth)
+
+    def start(self, port=0):
+        """
+        :param port: Int, 0 for any free port.
+        :return: String, the base URI to use as ZenossAPI.host, e.g. 'http://127.0.0.1:41234'
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers[C.HEADER_CONTENT_LENGTH]))
+                stub._throttle(len(body))
+                if self.headers.get(C.HEADER_CONTENT_ENCODING) == C.ENCODING_GZIP:
+                    body = zlib.decompress(body, 31)
+                request = json.loads(body.decode('utf-8'))
+                envelopes = request if isinstance(request, list) else [request]
+                status = [stub.errors[e.get(C.API_METHOD)] for e in envelopes if e.get(C.API_METHOD) in stub.errors]
+                if status:
+                    time.sleep(stub.latency)
+                    self.send_response(status[0])
+                    self.send_header(C.HEADER_CONTENT_LENGTH, '0')
+                    self.end_headers()
+                    return
+                if isinstance(request, list):
+                    response = [stub.handle(envelope) for envelope in request]
+                else:
+                    response = stub.handle(request)
+
+                out = json.dumps(response).encode('utf-8')
+                accepted = [e.strip() for e in (self.headers.get(C.HEADER_ACCEPT_ENCODING) or '').split(',')]
+                encoding = None
+                if len(out) >= stub.compress_min_bytes:
+                    if C.ENCODING_GZIP in accepted:
+                        encoding = C.ENCODING_GZIP
+                        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+                    elif C.ENCODING_DEFLATE in accepted:
+                        encoding = C.ENCODING_DEFLATE
+                        compressor = zlib.compressobj(6, zlib.DEFLATED, 15)
+                    if encoding:
+                        out = compressor.compress(out) + compressor.flush()
+
+                time.sleep(stub.latency)
+                stub._throttle(len(out))
+                self.send_response(200)
+                self.send_header(C.HEADER_CONTENT_TYPE, C.HEADER_JSON[C.HEADER_CONTENT_TYPE])
+                if encoding:
+                    self.send_header(C.HEADER_CONTENT_ENCODING, encoding)
+                self.send_header(C.HEADER_CONTENT_LENGTH, str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', port), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.uri = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        return self.uri
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def api(self, **kwargs):
+        """
+        :param kwargs: Passed to ZenossAPI, e.g. compress_requests=True
+        :return: ZenossAPI pointed at this stub.
+        """
+        zap = ZenossAPI({'admin': 'zenoss'}, host='localhost', **kwargs)
+        zap.host = self.uri
+        return zap
+
+
+def _benchmark(stub, accept_compressed, compress_requests, pages, page_size, uids):
+    C.ACCEPT_COMPRESSED = accept_compressed
+    zap = stub.api(compress_requests=compress_requests)
+    timings = []
+    for i in range(pages):
+        start = time.time()
+        zap.get_devices(uid=C.API_DEVICES_SERVER_LINUX, start=(i * page_size) % max(1, len(stub.devices)),
+                        limit=page_size)
+        timings.append(time.time() - start)
+    # A large uid list, like remove_devices/bind_templates in bulk, to exercise request compression.
+    start = time.time()
+    zap.api_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_SET_BOUND_TEMPLATES,
+                    data=[{C.API_UID: uids[0], C.API_TEMPLATE_IDS: uids}])
+    timings.append(time.time() - start)
+    timings.sort()
+    return zap.byte_counters(), sum(timings) / len(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+def _time_envelopes(stub, hostnames):
+    # Microseconds per addDevice call: encoded on its own, then sent through api_request and api_batch_request.
+    calls = len(hostnames)
+    timings = []
+    zap = stub.api()
+    start = time.time()
+    for tid, hostname in enumerate(hostnames):
+        zap._encode_envelope(C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_ADD_DEVICE,
+                             [zap.add_device_payload(hostname, C.API_DEVICE_CLASS_SERVER_LINUX)], tid)
+    timings.append(('encode envelope', (time.time() - start) * 1e6 / calls))
+
+    stub.devices.clear()
+    start = time.time()
+    for hostname in hostnames:
+        zap.add_device(hostname, C.API_DEVICE_CLASS_SERVER_LINUX)
+    timings.append(('api_request', (time.time() - start) * 1e6 / calls))
+
+    stub.devices.clear()
+    start = time.time()
+    for i in range(0, calls, C.BULK_BATCH_SIZE):
+        zap.api_batch_request(C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_ADD_DEVICE,
+                              [zap.add_device_payload(hostname, C.API_DEVICE_CLASS_SERVER_LINUX)
+                               for hostname in hostnames[i:i+C.BULK_BATCH_SIZE]])
+    timings.append(('api_batch_request (%d)' % C.BULK_BATCH_SIZE, (time.time() - start) * 1e6 / calls))
+    return timings
+
+
+def _benchmark_envelopes(calls):
+    # The same addDevice calls with payloads and envelopes rebuilt on every call (C.PRECOMPILED_PAYLOADS off) and
+    # precompiled, against an unthrottled stub, so both the saving and encoding's share of a whole call show.
+    hostnames = ['host-%06d.example.com' % i for i in range(calls)]
+    precompiled = C.PRECOMPILED_PAYLOADS
+    stub = StubZenoss()
+    stub.start()
+    try:
+        C.PRECOMPILED_PAYLOADS = False
+        rebuilt = _time_envelopes(stub, hostnames)
+        C.PRECOMPILED_PAYLOADS = True
+        compiled = _time_envelopes(stub, hostnames)
+    finally:
+        C.PRECOMPILED_PAYLOADS = precompiled
+        stub.stop()
+
+    print('%-26s %14s %14s' % ('addDevice, us per call', 'rebuilt', 'precompiled'))
+    for (label, before), (_, after) in zip(rebuilt, compiled):
+        print('%-26s %14.2f %14.2f' % (label, before, after))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare compressed and uncompressed traffic against a throttled '
+                                                 'stub Zenoss API, or time envelope encoding.')
+    parser.add_argument('--devices', type=int, default=5000)
+    parser.add_argument('--page-size', type=int, default=C.EXPORT_PAGE_SIZE)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--bandwidth', type=int, default=1024 * 1024, help='bytes per second (default: 1MiB/s)')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per round trip')
+    parser.add_argument('--envelopes', type=int, metavar='CALLS',
+                        help='instead, time encoding CALLS addDevice envelopes and sending them through '
+                             'api_request and api_batch_request to an unthrottled stub, with and without '
+                             'C.PRECOMPILED_PAYLOADS')
+    args = parser.parse_args()
+    if args.envelopes:
+        return _benchmark_envelopes(args.envelopes)
+
+    stub = StubZenoss(devices=args.devices, bandwidth=args.bandwidth, latency=args.latency)
+    stub.start()
+    uids = sorted(stub.devices)
+    accept_compressed = C.ACCEPT_COMPRESSED
+    try:
+        print('%-26s %12s %12s %12s %12s %9s %9s' % ('mode', 'sent wire', 'sent', 'recv wire', 'recv', 'mean s',
+                                                      'p95 s'))
+        for label, accept, compress in (('identity', False, False), ('compressed responses', True, False),
+                                        ('compressed both ways', True, True)):
+            counters, mean, p95 = _benchmark(stub, accept, compress, args.pages, args.page_size, uids)
+            print('%-26s %12d %12d %12d %12d %9.3f %9.3f' % (
+                label, counters[C.BYTES_SENT_WIRE], counters[C.BYTES_SENT_DECODED], counters[C.BYTES_RECEIVED_WIRE],
+                counters[C.BYTES_RECEIVED_DECODED], mean, p95))
+    finally:
+        C.ACCEPT_COMPRESSED = accept_compressed
+        stub.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
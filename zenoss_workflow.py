@@ -0,0 +1,167 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+
+class Ref(object):
+    """
+    Placeholder for a value produced by another step. Steps that use a Ref in their args/kwargs depend on the step
+    that produces it.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Ref(%r)' % self.name
+
+
+class Step(object):
+    def __init__(self, name, func, args=(), kwargs=None, produces=None, extract=None, after=(), compensate=None):
+        """
+        :param name: String, unique within the workflow.
+        :param func: The call to make, e.g. api.add_template
+        :param args: Tuple, positional arguments. Ref values (also inside lists) are replaced before the call.
+        :param kwargs: Dict, keyword arguments. Ref values are replaced before the call.
+        :param produces: String, the name other steps use to Ref this step's value.
+        :param extract: Function of the call's return value that gives the produced value. Default: the return value.
+        :param after: List of step names that must finish first even though no value is passed (e.g. a listing
+                      that has to see an object another step creates).
+        :param compensate: Function of the produced value, called to undo this step if the workflow fails.
+        """
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+        self.produces = produces
+        self.extract = extract
+        self.after = list(after)
+        self.compensate = compensate
+
+    def consumes(self):
+        refs = set()
+        for value in list(self.args) + list(self.kwargs.values()):
+            for v in (value if isinstance(value, (list, tuple)) else [value]):
+                if isinstance(v, Ref):
+                    refs.add(v.name)
+        return refs
+
+
+class Workflow(object):
+    """
+    Runs Steps on a thread pool as soon as the steps they depend on have finished. If a step fails, no new steps are
+    started, the compensating actions of the finished steps run in reverse order of completion, and the step's
+    exception is raised. Per-step timings are kept in 'timings'.
+    """
+    def __init__(self, workers=C.BULK_WORKERS):
+        self.workers = max(1, workers)
+        self.steps = []
+        self.values = {}
+        self.timings = {}
+
+    def add(self, name, func, *args, **kwargs):
+        """
+        Shortcut for add_step(Step(name, func, args, kwargs)). Step options go in the 'step' keyword argument, e.g.
+        add('ds', api.add_data_source, Ref('template'), 'ds', step={'after': ['template']})
+        :return: Ref to the step's value, named after the step.
+        """
+        options = kwargs.pop('step', {})
+        options.setdefault('produces', name)
+        self.add_step(Step(name, func, args, kwargs, **options))
+        return Ref(options['produces'])
+
+    def add_step(self, step):
+        if step.name in [s.name for s in self.steps]:
+            raise ZenossError(C.ERROR_WORKFLOW_DUPLICATE_STEP_S % step.name)
+        self.steps.append(step)
+        return step
+
+    def _dependencies(self):
+        producers = dict((s.produces, s.name) for s in self.steps if s.produces)
+        dependencies = {}
+        for step in self.steps:
+            missing = [ref for ref in step.consumes() if ref not in producers and ref not in self.values]
+            unknown = [name for name in step.after if name not in [s.name for s in self.steps]]
+            if missing or unknown:
+                raise ZenossError(C.ERROR_WORKFLOW_STEP_S_UNKNOWN_S % (step.name, missing + unknown))
+            dependencies[step.name] = set(producers[ref] for ref in step.consumes() if ref in producers)
+            dependencies[step.name].update(step.after)
+        return dependencies
+
+    def _resolve(self, value):
+        if isinstance(value, Ref):
+            return self.values[value.name]
+        if isinstance(value, list):
+            return [self._resolve(v) for v in value]
+        if isinstance(value, tuple):
+            return tuple(self._resolve(v) for v in value)
+        return value
+
+    def _run_step(self, step):
+        start = time.time()
+        try:
+            result = step.func(*[self._resolve(a) for a in step.args],
+                               **dict((k, self._resolve(v)) for k, v in step.kwargs.items()))
+            return step.extract(result) if step.extract else result
+        finally:
+            self.timings[step.name] = time.time() - start
+
+    def run(self):
+        """
+        :return: Dict of {produced name: value}
+        """
+        dependencies = self._dependencies()
+        steps = dict((s.name, s) for s in self.steps)
+        remaining = set(steps)
+        finished = []
+        in_flight = {}
+        error = None
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while remaining or in_flight:
+                if error is None:
+                    for name in sorted(remaining):
+                        if dependencies[name] <= set(finished):
+                            remaining.discard(name)
+                            in_flight[pool.submit(self._run_step, steps[name])] = name
+                if not in_flight:
+                    if error is None and remaining:
+                        # Everything left waits on something else that's left.
+                        error = ZenossError(C.ERROR_WORKFLOW_CYCLE_S % sorted(remaining))
+                    break
+
+                done, not_done = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = in_flight.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    if steps[name].produces:
+                        self.values[steps[name].produces] = value
+                    finished.append(name)
+        finally:
+            pool.shutdown()
+
+        if error is not None:
+            self._compensate(finished, steps)
+            raise error
+        return self.values
+
+    def _compensate(self, finished, steps):
+        for name in reversed(finished):
+            step = steps[name]
+            if step.compensate is None:
+                continue
+            try:
+                step.compensate(self.values.get(step.produces) if step.produces else None)
+            except Exception as e:
+                logging.error(C.ERROR_WORKFLOW_COMPENSATE_S_FAILED_S % (name, e))
@@ -0,0 +1,176 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+try:
+    from zenoss5_api.CONSTS import C
+    from zenoss5_api.zenoss_base import ZenossError
+except ImportError:
+    from CONSTS import C
+    from zenoss_base import ZenossError
+
+
+class WriteBehind(object):
+    """
+    Buffers setInfo and bindOrUnbindTemplate calls and sends them in batched envelopes: when max_size objects are
+    pending, max_delay seconds after the first pending write, or on flush(). Writes to the same uid and router are
+    merged while they wait (the latest value of each field wins); two toggles of the same template binding cancel out.
+    Every write returns a Future with the response of the call it ended up in, or a ZenossError if that call failed.
+    Get one from ZenossAPI.write_behind().
+    """
+    def __init__(self, api, max_size=C.WRITE_BEHIND_MAX_SIZE, max_delay=C.WRITE_BEHIND_MAX_DELAY,
+                 batch_size=C.BULK_BATCH_SIZE, workers=C.BULK_WORKERS):
+        """
+        :param api: ZenossAPI
+        :param max_size: Int, pending objects that trigger a flush (in the writing thread).
+        :param max_delay: Float, seconds a write may wait before a background flush sends it.
+        :param batch_size: Int, calls per Ext.Direct envelope.
+        :param workers: Int, envelopes in flight at once.
+        """
+        self.api = api
+        self.max_size = max(1, max_size)
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.workers = workers
+        self.pending = OrderedDict()  # key -> [endpoint, action, method, data, futures, writes]
+        self.deadline = None
+        self.closed = False
+        self.counts = dict.fromkeys([C.WRITE_BEHIND_WRITES, C.WRITE_BEHIND_COALESCED, C.WRITE_BEHIND_CALLS], 0)
+        self.cond = threading.Condition()
+        # One flush at a time, so a later write to an object can't overtake an earlier one.
+        self.flush_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, key, endpoint, action, method, data):
+        future = Future()
+        with self.cond:
+            if self.closed:
+                raise ZenossError(C.ERROR_WRITE_BEHIND_CLOSED)
+            self.counts[C.WRITE_BEHIND_WRITES] += 1
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = [endpoint, action, method, dict(data), [future], 1]
+            else:
+                entry[3].update(data)
+                entry[4].append(future)
+                entry[5] += 1
+                self.counts[C.WRITE_BEHIND_COALESCED] += 1
+            if self.deadline is None:
+                self.deadline = time.time() + self.max_delay
+                self.cond.notify()
+            full = len(self.pending) >= self.max_size
+        if full:
+            self.flush()
+        return future
+
+    def set_device_info(self, uid, **kwargs):
+        """
+        :param uid: String, the device uid.
+        :param kwargs: The fields to set, as for ZenossAPI.set_device_info.
+        :return: Future
+        """
+        return self._write((C.API_ROUTER_DEVICE_ENDPOINT, C.API_METHOD_SET_INFO, uid), C.API_ROUTER_DEVICE_ENDPOINT,
+                           C.API_ACTION_DEVICE_ROUTER, C.API_METHOD_SET_INFO, dict(kwargs, **{C.API_UID: uid}))
+
+    def set_template_info(self, uid, **kwargs):
+        """
+        :param uid: String, e.g. a data source, graph point or threshold uid.
+        :param kwargs: The fields to set, as for ZenossAPI.set_template_info.
+        :return: Future
+        """
+        return self._write((C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_METHOD_SET_INFO, uid),
+                           C.API_ROUTER_TEMPLATE_ENDPOINT, C.API_ACTION_TEMPLATE_ROUTER, C.API_METHOD_SET_INFO,
+                           dict(kwargs, **{C.API_UID: uid}))
+
+    def bind_or_unbind_template(self, uid, template_uid):
+        """
+        :param uid: String, the device or device class uid.
+        :param template_uid: String
+        :return: Future
+        """
+        return self._write((C.API_ROUTER_DEVICE_ENDPOINT, C.API_METHOD_BIND_OR_UNBIND_TEMPLATE, uid, template_uid),
+                           C.API_ROUTER_DEVICE_ENDPOINT, C.API_ACTION_DEVICE_ROUTER,
+                           C.API_METHOD_BIND_OR_UNBIND_TEMPLATE, {C.API_UID: uid, C.API_TEMPLATE_UID: template_uid})
+
+    def flush(self):
+        """
+        Send everything pending now and wait for it.
+        :return: Int, the calls sent.
+        """
+        with self.flush_lock:
+            with self.cond:
+                entries = list(self.pending.values())
+                self.pending = OrderedDict()
+                self.deadline = None
+
+            groups = OrderedDict()
+            for entry in entries:
+                if entry[2] == C.API_METHOD_BIND_OR_UNBIND_TEMPLATE and entry[5] % 2 == 0:
+                    # Toggled back to where it started: nothing to send.
+                    for future in entry[4]:
+                        future.set_result({C.API_RESULT: {C.API_SUCCESS: True, C.API_MSG: C.WRITE_BEHIND_CANCELLED}})
+                    continue
+                groups.setdefault(tuple(entry[:3]), []).append(entry)
+
+            calls = 0
+            for (endpoint, action, method), group in groups.items():
+                try:
+                    results = self.api.api_batch_calls(endpoint, action, method, [entry[3] for entry in group],
+                                                       batch_size=self.batch_size, workers=self.workers)
+                except Exception as e:
+                    results = [{C.API_RESULT: {C.API_SUCCESS: False, C.API_MSG: str(e)}}] * len(group)
+                calls += len(group)
+                for entry, response in zip(group, results):
+                    result = (response or {}).get(C.API_RESULT) or {}
+                    for future in entry[4]:
+                        if result.get(C.API_SUCCESS):
+                            future.set_result(response)
+                        else:
+                            future.set_exception(ZenossError(result.get(C.API_MSG) or
+                                                             C.ERROR_GENERIC_UNKNOWN_EXCEPTION_S_S_S_S %
+                                                             (C.API_URI, endpoint, action, method)))
+            with self.cond:
+                self.counts[C.WRITE_BEHIND_CALLS] += calls
+            return calls
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.closed and (self.deadline is None or time.time() < self.deadline):
+                    self.cond.wait(None if self.deadline is None else self.deadline - time.time())
+                if self.closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error('Write-behind flush failed: %s' % e)
+
+    def metrics(self):
+        """
+        :return: Dict, {'writes': Int, 'coalesced': Int, 'calls': Int, 'pending': Int}. coalesced counts the writes
+                 merged into another pending one.
+        """
+        with self.cond:
+            metrics = dict(self.counts)
+            metrics[C.WRITE_BEHIND_PENDING] = len(self.pending)
+            return metrics
+
+    def close(self):
+        """
+        Flush what is pending and stop the background flusher. Later writes raise ZenossError.
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        self.flush()